@@ -1,12 +1,36 @@
 import chainlit as cl
-import google.generativeai as genai
 import os
 import base64
 from PIL import Image
 import io
 from dotenv import load_dotenv
 import asyncio
+import atexit
 import mimetypes
+import re
+import time
+import metrics
+from session_registry import SessionRegistry
+from session_store import SessionStore
+from input_queue import InputQueue
+from model_registry import ModelRegistry
+from model_coalescing import joined_flight
+from model_backends import create_backend_from_env
+from model_scheduler import (
+    SchedulerOverloaded, PRIORITY_QUESTION, PRIORITY_ILLUSTRATION, PRIORITY_FALLBACK, PRIORITY_BACKGROUND
+)
+from model_resilience import CircuitOpenError, is_transient_error
+from speculation import SpeculativeEngine
+from story_memory import StoryMemory
+from question_bank import QuestionBank, QUESTION_BATCH_SCHEMA, CHARACTER_PLACEHOLDER, format_question, parse_question_batch
+from structured_output import CHAPTER_GENERATION_CONFIG, ChapterTextStream, parse_chapter
+from prompt_builder import PromptBuilder, TokenLedger, compact, usage_from_response
+from image_cache import ImageCache, make_cache_key
+from image_pipeline import ImagePipeline
+from response_cache import ResponseCache
+from shared_cache import SharedCache
+from artifact_store import ImageArtifactStore, guess_image_mime
+from keyword_engine import KeywordMatcher
 
 # 환경변수 로드
 load_dotenv()
@@ -14,13 +38,211 @@ load_dotenv()
 # API 키 설정
 gemini_api_key = os.getenv('GEMINI_API_KEY')
 
-# google.generativeai 설정
-genai.configure(api_key=gemini_api_key)
-text_model = genai.GenerativeModel('gemini-2.5-flash')
+# 모델 백엔드 설정 (STORY_MODEL_BACKEND: gemini, stub, record, replay)
+# 모델 핸들은 프로세스당 한 번만 만들어 연결 재사용
+# 텍스트 모델의 공통 시스템 지시문은 컨텐츠 캐시에 한 번 올려 두고 모든 세션이 핸들로 참조
+model_registry = ModelRegistry(
+    create_backend_from_env(api_key=gemini_api_key),
+    context_cache_ttl=int(os.getenv('CONTEXT_CACHE_TTL', '3600')),
+    use_context_cache=os.getenv('CONTEXT_CACHE', '1') == '1',
+    # 지시문이 이보다 작으면 캐시 생성을 시도하지 않음 (Gemini 명시적 캐시 최소 크기, 모델마다 다름)
+    context_cache_min_tokens=int(os.getenv('CONTEXT_CACHE_MIN_TOKENS', '1024'))
+)
+MODEL_WARMUP = os.getenv('MODEL_WARMUP', '1') == '1'
+
+# 모델 호출 동시성 설정 (모델 호출이 이벤트 루프를 막지 않도록 스레드 풀에서 실행)
+TEXT_MODEL_CONCURRENCY = int(os.getenv('TEXT_MODEL_CONCURRENCY', '8'))
+IMAGE_MODEL_CONCURRENCY = int(os.getenv('IMAGE_MODEL_CONCURRENCY', '4'))
+
+# 모델별 분당 요청 수 제한 (할당량 보호, 0이면 제한 없음)
+TEXT_MODEL_RPM = int(os.getenv('TEXT_MODEL_RPM', '600'))
+IMAGE_MODEL_RPM = int(os.getenv('IMAGE_MODEL_RPM', '60'))
+# 부하가 높을 때 삽화/시각적 설명이 기다릴 최대 시간 (넘으면 대체 경로로 전환)
+ILLUSTRATION_MAX_WAIT = float(os.getenv('ILLUSTRATION_MAX_WAIT', '8'))
+FALLBACK_MAX_WAIT = float(os.getenv('FALLBACK_MAX_WAIT', '2'))
+
+# 일시적 오류 재시도 / 헤지 요청 / 회로 차단기 설정
+MODEL_MAX_RETRIES = int(os.getenv('MODEL_MAX_RETRIES', '2'))
+MODEL_RETRY_BASE_DELAY = float(os.getenv('MODEL_RETRY_BASE_DELAY', '0.5'))
+TEXT_MODEL_HEDGING = os.getenv('TEXT_MODEL_HEDGING', '1') == '1'
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('CIRCUIT_FAILURE_THRESHOLD', '5'))
+CIRCUIT_RESET_SECONDS = float(os.getenv('CIRCUIT_RESET_SECONDS', '30'))
+# 같은 프롬프트로 동시에 들어온 모델 호출 합치기 (수업 시작 때 같은 주제/기본값이 몰리는 경우)
+MODEL_COALESCING = os.getenv('MODEL_COALESCING', '1') == '1'
+
+# 모든 동화 텍스트 호출이 공유하는 시스템 지시문 (프로세스 시작 시 한 번만 구성, 매 프롬프트에 반복하지 않음)
+STORY_SYSTEM_INSTRUCTIONS = compact("""
+    당신은 경계선 지능 아동을 위한 동화 작가입니다.
+    - 5-6세 아이가 이해할 수 있는 쉬운 언어 사용
+    - 한 문장당 10-15단어 이내로 짧게 구성
+    - 따뜻하고 긍정적인 분위기 유지
+    - 아이들이 이해하기 쉬운 명확한 내용
+    - 폭력적이거나 무서운 내용 없이 안전한 이야기
+    """)
+
+text_client = model_registry.client(
+    'gemini-2.5-flash',
+    system_instruction=STORY_SYSTEM_INSTRUCTIONS,
+    max_concurrency=TEXT_MODEL_CONCURRENCY,
+    rate_per_minute=TEXT_MODEL_RPM,
+    burst=TEXT_MODEL_CONCURRENCY * 2,
+    max_retries=MODEL_MAX_RETRIES,
+    retry_base_delay=MODEL_RETRY_BASE_DELAY,
+    hedging=TEXT_MODEL_HEDGING,
+    failure_threshold=CIRCUIT_FAILURE_THRESHOLD,
+    reset_timeout=CIRCUIT_RESET_SECONDS,
+    coalesce=MODEL_COALESCING
+)
+# 이미지 호출은 비싸므로 헤지 요청 없이 재시도만 사용
+image_client = model_registry.client(
+    'gemini-2.5-flash-image',
+    max_concurrency=IMAGE_MODEL_CONCURRENCY,
+    rate_per_minute=IMAGE_MODEL_RPM,
+    burst=IMAGE_MODEL_CONCURRENCY,
+    max_retries=MODEL_MAX_RETRIES,
+    retry_base_delay=MODEL_RETRY_BASE_DELAY,
+    failure_threshold=CIRCUIT_FAILURE_THRESHOLD,
+    reset_timeout=CIRCUIT_RESET_SECONDS,
+    coalesce=MODEL_COALESCING
+)
+
+# 스트리밍 설정 (챕터 텍스트를 문장 단위로 바로 보여주기)
+STORY_STREAMING = os.getenv('STORY_STREAMING', '1') == '1'
+SENTENCE_BOUNDARY = re.compile(r'[.!?。…~]["\'”’)]*\s+|\n+')
+
+# 추측 생성 설정 (아이가 읽는 동안 제안 문구별 다음 챕터를 미리 생성)
+SPECULATION_BUDGET = int(os.getenv('SPECULATION_BUDGET', '3'))
+# 추측 생성은 텍스트 모델 동시 호출의 절반까지만 사용 (실제 요청 우선)
+speculation_limiter = asyncio.Semaphore(max(1, TEXT_MODEL_CONCURRENCY // 2))
+
+# 키워드 사전 설정 (의도 분석/입력 검증/주인공 이름 단어는 lexicons/*.json, 한 번만 컴파일해서 공유)
+LEXICON_DIR = os.getenv('LEXICON_DIR') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lexicons')
+keyword_matcher = KeywordMatcher.from_directory(LEXICON_DIR)
+print(f"🔤 키워드 사전 로드: {keyword_matcher.stats()}")
+
+# 워커 공유 캐시 설정 (여러 워커 프로세스로 띄울 때 삽화/응답 캐시를 함께 사용, SHARED_CACHE_PATH를 비우면 끔)
+WORKER_ID = os.getenv('WORKER_ID', '')
+SHARED_CACHE_PATH = os.getenv('SHARED_CACHE_PATH', '')
+shared_cache = SharedCache(
+    SHARED_CACHE_PATH,
+    max_bytes=int(os.getenv('SHARED_CACHE_MB', '512')) * 1024 * 1024
+) if SHARED_CACHE_PATH else None
+if shared_cache:
+    atexit.register(shared_cache.close)
+    print(f"🤝 워커 공유 캐시 사용: {SHARED_CACHE_PATH} (워커 {WORKER_ID or '-'})")
+
+# 삽화 캐시 설정 (같은 장면 프롬프트는 저장된 이미지 재사용)
+# 공유 캐시를 쓰면 워커마다 따로 관리하는 디스크 캐시는 끔 (용량 계산이 어긋나지 않도록)
+image_cache = ImageCache(
+    memory_limit_bytes=int(os.getenv('IMAGE_CACHE_MEMORY_MB', '64')) * 1024 * 1024,
+    disk_dir=None if shared_cache else os.getenv('IMAGE_CACHE_DIR', '.cache/images'),
+    disk_limit_bytes=int(os.getenv('IMAGE_CACHE_DISK_MB', '512')) * 1024 * 1024,
+    shared=shared_cache
+)
+
+# 삽화 후처리 설정 (원본을 화면용 WebP + 썸네일로 줄여서 느린 와이파이에서도 빠르게 전송)
+image_pipeline = ImagePipeline(
+    max_workers=int(os.getenv('IMAGE_PIPELINE_WORKERS', '2')),
+    display_size=int(os.getenv('IMAGE_DISPLAY_SIZE', '1024')),
+    thumbnail_size=int(os.getenv('IMAGE_THUMBNAIL_SIZE', '256')),
+    quality=int(os.getenv('IMAGE_WEBP_QUALITY', '80'))
+)
+
+# 텍스트 응답 캐시 설정 (첫 챕터/학습 문제는 같은 입력 조합이 자주 반복됨)
+response_cache = ResponseCache(
+    ttl=int(os.getenv('RESPONSE_CACHE_TTL', '3600')),
+    variants=int(os.getenv('RESPONSE_CACHE_VARIANTS', '3')),
+    memory_limit_bytes=int(os.getenv('RESPONSE_CACHE_MEMORY_MB', '16')) * 1024 * 1024,
+    shared=shared_cache
+)
+
+# 삽화 저장소 설정 (세션별 메모리 보관, IMAGE_ARTIFACT_DIR 지정 시 오래된 이미지는 디스크로)
+artifact_store = ImageArtifactStore(
+    max_items_per_session=int(os.getenv('IMAGE_ARTIFACTS_PER_SESSION', '6')),
+    spill_dir=os.getenv('IMAGE_ARTIFACT_DIR') or None,
+    retention_seconds=int(os.getenv('IMAGE_ARTIFACT_RETENTION_HOURS', '24')) * 3600
+)
+
+# 스토리 메모리 설정 (최근 챕터 링 버퍼 크기 + 밀려난 챕터의 압축 요약 길이)
+STORY_RECENT_CHAPTERS = int(os.getenv('STORY_RECENT_CHAPTERS', '4'))
+STORY_SUMMARY_CHARS = int(os.getenv('STORY_SUMMARY_CHARS', '500'))
+# 요약을 모델로 갱신할지 (0이면 챕터별 첫 문장을 이어 붙이는 로컬 요약)
+STORY_SUMMARY_MODEL = os.getenv('STORY_SUMMARY_MODEL', '1') == '1'
+
+# 호출 종류별 프롬프트 토큰 예산 (넘치면 오래된 스토리 컨텍스트부터 제외)
+prompt_builder = PromptBuilder(budgets={
+    "initial_story": int(os.getenv('PROMPT_BUDGET_STORY', '600')),
+    "continuation": int(os.getenv('PROMPT_BUDGET_CONTINUATION', '900')),
+    "illustration": int(os.getenv('PROMPT_BUDGET_ILLUSTRATION', '600')),
+    "question": int(os.getenv('PROMPT_BUDGET_QUESTION', '400')),
+})
+
+# 모든 삽화 프롬프트가 공유하는 스타일 지시문
+IMAGE_STYLE_INSTRUCTIONS = compact("""
+    Style: Cute children's book illustration, watercolor style, soft pastel colors
+    
+    Requirements:
+    - Warm and friendly atmosphere
+    - Bright, cheerful colors suitable for children
+    - Simple, clear composition for young readers
+    - Hand-drawn watercolor texture
+    - Safe and positive content for 5-6 year olds
+    - Korean children's book style
+    - NO TEXT OR WORDS in the image
+    - NO Korean characters or any text elements
+    - Pure visual illustration without any written content
+    """)
+
+# 구조화 출력 설정 (챕터 한 번의 호출로 본문/시각적 설명/의도 태그를 JSON으로 받음)
+# 삽화는 본문을 기다리지 않고 텍스트와 동시에 시작 (같은 응답의 시각적 설명은 삽화 실패 시 대체 문구로 사용)
+STORY_STRUCTURED_OUTPUT = os.getenv('STORY_STRUCTURED_OUTPUT', '1') == '1'
+STRUCTURED_CHAPTER_GUIDE = compact("""
+    응답 JSON 항목:
+    - chapter: 동화 본문
+    - visual_description: "🎨 이런 그림을 상상해보세요!"로 시작하는 2-3문장의 장면 설명
+    - intent_tags: 사용자 요청의 의도 (learning_focus, positive_emotion, help_action, social_interaction, movement_adventure, fear_concern, general_continuation 중 가까운 것부터)
+    """)
+
+# 학습 문제 은행 설정 (주제별로 여러 문제를 한 번에 만들어 두고 부족하면 백그라운드 보충)
+QUESTION_BATCH_SIZE = int(os.getenv('QUESTION_BATCH_SIZE', '8'))
+QUESTION_POOL_LOW_WATERMARK = int(os.getenv('QUESTION_POOL_LOW_WATERMARK', '3'))
+
+# 메트릭 설정 (METRICS_PORT를 지정하면 Prometheus /metrics 엔드포인트 실행, 0이면 끔)
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))
+metrics.registry.json_logs = os.getenv('METRICS_JSON_LOGS', '0') == '1'
+if METRICS_PORT:
+    metrics.start_metrics_server(METRICS_PORT)
+
+# 세션 관리 설정 (한 프로세스에서 여러 아이를 동시에 서비스)
+MAX_SESSIONS = int(os.getenv('MAX_SESSIONS', '200'))
+SESSION_IDLE_TTL = int(os.getenv('SESSION_IDLE_TTL', '1800'))
+SESSION_MEMORY_LIMIT_MB = int(os.getenv('SESSION_MEMORY_LIMIT_MB', '64'))
+
+# 세션 영구 저장소 설정 (재시작/재접속 후 이어하기, SESSION_STORE_PATH를 비우면 끔)
+SESSION_STORE_PATH = os.getenv('SESSION_STORE_PATH', '.cache/sessions.sqlite3')
+session_store = SessionStore(
+    SESSION_STORE_PATH,
+    flush_interval=float(os.getenv('SESSION_STORE_FLUSH_SECONDS', '1')),
+    retention_seconds=int(os.getenv('SESSION_STORE_RETENTION_HOURS', '72')) * 3600
+) if SESSION_STORE_PATH else None
+if session_store:
+    atexit.register(session_store.close)
 
 class StoryTeller:
+    # 세션 저장소에 남기는 필드 (챕터 본문과 요약은 따로 저장)
+    PERSISTED_FIELDS = (
+        "story_stage", "learning_subject", "user_profile", "character_name", "favorite_topic",
+        "current_chapter", "story_choices", "character_description", "input_attempts"
+    )
+    
     def __init__(self):
-        self.story_context = []
+        # 최근 챕터 링 버퍼 + 오래된 챕터의 압축 요약 (프롬프트 길이를 일정하게 유지)
+        self.story_memory = StoryMemory(
+            summarize=self.summarize_story if STORY_SUMMARY_MODEL else None,
+            recent_size=STORY_RECENT_CHAPTERS,
+            summary_chars=STORY_SUMMARY_CHARS
+        )
+        self.story_context = self.story_memory.recent
         self.current_chapter = 0
         self.story_stage = "setup"  # setup, story1, story2, story3, chatbot
         self.user_profile = {}
@@ -36,6 +258,18 @@ class StoryTeller:
         # 입력 검증을 위한 상태 추가
         self.input_attempts = 0
         self.max_attempts = 3
+        # 제안 문구별 다음 챕터 추측 생성
+        self.speculation = SpeculativeEngine(
+            self.generate_continuation_candidate,
+            budget=SPECULATION_BUDGET,
+            limiter=speculation_limiter
+        )
+        # 단계별 프롬프트/응답 토큰 사용량
+        self.token_ledger = TokenLedger()
+        # 구조화 출력으로 받은 마지막 챕터의 삽화 장면/시각적 설명/의도 태그
+        self.chapter_extras = None
+        # 세션 저장소에 이미 넘긴 마지막 챕터 번호
+        self.persisted_chapter = 0
         
     def validate_input(self, input_text, stage):
         """입력값 검증 함수"""
@@ -51,96 +285,176 @@ class StoryTeller:
         # 단계별 특별 검증
         if stage == "input_subject":
             # 학습 주제는 적절한 교육 내용인지 확인
-            if any(word in input_text.lower() for word in ['욕설', '폭력', '성인']):
+            if keyword_matcher.first(input_text, "banned"):
                 return False, "적절하지 않은 내용입니다. 학습에 도움이 되는 주제를 입력해주세요."
         
         return True, "검증 성공"
     
+    def estimate_memory_bytes(self):
+        """세션 메모리 사용량 추정 (세션 저장소의 메모리 상한 계산용)"""
+        total = self.story_memory.estimate_memory_bytes()
+        total += len(str(self.user_profile).encode('utf-8')) + len(self.favorite_topic.encode('utf-8'))
+        return total
+    
+    def close(self):
+        """세션 종료 시 백그라운드 작업 정리"""
+        self.speculation.cancel_all()
+        self.story_memory.close()
+        totals = self.token_ledger.totals()
+        if totals["calls"]:
+            print(f"🧾 세션 토큰 사용량: 프롬프트 {totals['prompt_tokens']}, 응답 {totals['completion_tokens']} ({totals['calls']}회 호출)")
+            metrics.log_event("session_tokens", **totals, stages=self.token_ledger.stages)
+    
+    def export_state(self):
+        """세션 저장소에 남길 상태 (프로필/진행 단계 + 줄거리 요약)"""
+        state = {field: getattr(self, field) for field in self.PERSISTED_FIELDS}
+        memory = self.story_memory
+        state.update(
+            opening=memory.opening,
+            summary=memory.summary,
+            summarized_through=memory.summarized_through,
+            chapter_count=memory.chapter_count
+        )
+        return state
+    
+    def restore_state(self, state, chapters):
+        """세션 저장소에서 읽은 상태와 최근 챕터로 복원"""
+        for field in self.PERSISTED_FIELDS:
+            if field in state:
+                setattr(self, field, state[field])
+        self.story_memory.restore(
+            state.get("opening", ""),
+            state.get("summary", ""),
+            state.get("summarized_through", 0),
+            state.get("chapter_count", len(chapters)),
+            chapters
+        )
+        self.persisted_chapter = self.current_chapter
+        # 동화를 만드는 도중에 끊긴 세션은 생성 직전 단계로
+        if self.story_stage == "story_generation":
+            self.story_stage = "story_ongoing" if self.current_chapter else "ready_to_start"
+    
+    def record_usage(self, stage, prompt, response=None, text=""):
+        """단계별 프롬프트/응답 토큰 수 기록 (usage_metadata가 없으면 글자 수로 추정)"""
+        if joined_flight():
+            # 같은 호출에 합류해 결과만 받은 경우는 처음 호출한 쪽이 이미 기록함 (합친 만큼 부풀지 않도록)
+            return
+        prompt_tokens, completion_tokens = usage_from_response(response, prompt, text)
+        self.token_ledger.record(stage, prompt_tokens, completion_tokens)
+    
+    def read_chapter(self, raw_text):
+        """응답에서 챕터 본문 추출 (구조화 출력이면 시각적 설명/의도 태그를 보관)"""
+        self.chapter_extras = None
+        if not STORY_STRUCTURED_OUTPUT:
+            return (raw_text or "").strip() or None
+        try:
+            chapter = parse_chapter(raw_text)
+        except ValueError as e:
+            print(f"구조화 응답 해석 오류: {str(e)}")
+            metrics.record("structured_output", "parse", "error")
+            return None
+        
+        self.chapter_extras = chapter
+        metrics.record("structured_output", "parse", "success" if chapter["visual_description"] else "partial")
+        return chapter["chapter"]
+    
+    def chapter_generation_kwargs(self):
+        """챕터 생성 호출에 붙일 구조화 출력 설정"""
+        return {"generation_config": CHAPTER_GENERATION_CONFIG} if STORY_STRUCTURED_OUTPUT else {}
+    
     def reset_input_attempts(self):
         """입력 시도 횟수 초기화"""
         self.input_attempts = 0
     
+    def build_initial_story_prompt(self):
+        """사용자 맞춤형 첫 번째 스토리 프롬프트 구성"""
+        return prompt_builder.build(
+            "initial_story",
+            task="개인 맞춤형 동화의 200자 내외 짧은 첫 번째 에피소드를 작성해주세요.",
+            sections=[
+                f"""
+                사용자 정보:
+                - 학습 주제: {self.learning_subject}
+                - 사용자 특성: {self.user_profile}
+                - 좋아하는 것들: {self.favorite_topic}
+                """,
+                f"""
+                동화 작성 가이드라인:
+                1. {self.learning_subject} 학습 요소를 자연스럽게 포함
+                2. {self.favorite_topic} 요소를 주인공이나 배경에 활용
+                3. 아이가 상호작용할 수 있는 질문이나 선택 상황 포함
+                
+                스토리 구조:
+                - 주인공 소개 (사용자 특성 반영)
+                - 문제 상황 또는 모험의 시작
+                - 학습 요소가 포함된 첫 번째 도전
+                - 다음 단계로 이어질 수 있는 열린 결말
+                """,
+                STRUCTURED_CHAPTER_GUIDE if STORY_STRUCTURED_OUTPUT else ""
+            ]
+        )
+    
+    def get_initial_story_fallback(self):
+        """초기 스토리 생성 실패 시 기본 스토리"""
+        return f"""
+        안녕하세요! 저는 {self.favorite_topic}을 좋아하는 친구예요! 
+        오늘은 {self.learning_subject}에 대해 재미있는 모험을 떠나볼 거예요.
+        
+        어떤 일이 일어날지 궁금하지 않나요? 
+        함께 모험을 시작해보아요!
+        """
+    
+    def get_initial_story_cache_key(self):
+        """초기 스토리 응답 캐시 키"""
+        return make_cache_key("initial_story", self.learning_subject, self.user_profile, self.favorite_topic,
+                              STORY_STRUCTURED_OUTPUT)
+    
     async def generate_initial_story(self):
         """사용자 정보를 바탕으로 초기 스토리 생성"""
         try:
             # 사용자 맞춤형 스토리 프롬프트 구성
-            story_prompt = f"""
-            경계선 지능 아동을 위한 개인 맞춤형 동화를 만들어주세요.
-            
-            사용자 정보:
-            - 학습 주제: {self.learning_subject}
-            - 사용자 특성: {self.user_profile}
-            - 좋아하는 것들: {self.favorite_topic}
-            
-            동화 작성 가이드라인:
-            1. 5-6세 아이가 이해할 수 있는 쉬운 언어 사용
-            2. 한 문장당 10-15단어 이내로 짧게 구성
-            3. {self.learning_subject} 학습 요소를 자연스럽게 포함
-            4. {self.favorite_topic} 요소를 주인공이나 배경에 활용
-            5. 따뜻하고 긍정적인 분위기 유지
-            6. 아이가 상호작용할 수 있는 질문이나 선택 상황 포함
-            
-            스토리 구조:
-            - 주인공 소개 (사용자 특성 반영)
-            - 문제 상황 또는 모험의 시작
-            - 학습 요소가 포함된 첫 번째 도전
-            - 다음 단계로 이어질 수 있는 열린 결말
-            
-            200자 내외의 짧은 첫 번째 에피소드를 작성해주세요.
-            """
-            
-            response = text_model.generate_content(story_prompt)
-            return response.text
+            with metrics.track("initial_story", "prompt_build"):
+                story_prompt = self.build_initial_story_prompt()
+            
+            async def generate():
+                with metrics.track("initial_story", "model_call"):
+                    response = await text_client.generate_content(story_prompt, **self.chapter_generation_kwargs())
+                self.record_usage("initial_story", story_prompt, response, response.text)
+                return response.text
+            
+            # 같은 입력 조합의 스토리가 캐시에 있으면 변형을 돌려가며 사용
+            story = self.read_chapter(
+                await response_cache.get_or_generate(self.get_initial_story_cache_key(), generate)
+            )
+            if not story:
+                raise ValueError("응답에서 동화 본문을 찾을 수 없습니다")
+            return story
             
         except Exception as e:
             print(f"초기 스토리 생성 오류: {str(e)}")
+            metrics.record("initial_story", "story", "fallback")
             error_message = await self.handle_error_gracefully("api_error", str(e), "초기 스토리 생성")
             await cl.Message(content=error_message).send()
             
-            return f"""
-            안녕하세요! 저는 {self.favorite_topic}을 좋아하는 친구예요! 
-            오늘은 {self.learning_subject}에 대해 재미있는 모험을 떠나볼 거예요.
-            
-            어떤 일이 일어날지 궁금하지 않나요? 
-            함께 모험을 시작해보아요!
-            """
+            return self.get_initial_story_fallback()
     
     def extract_character_name_from_story(self, story_text):
         """스토리에서 주인공 이름 추출 (기본값 설정)"""
-        # 간단한 이름 추출 로직 (추후 개선 가능)
-        if self.favorite_topic and any(animal in self.favorite_topic.lower() for animal in ['강아지', '고양이', '토끼', '곰']):
-            if '강아지' in self.favorite_topic.lower():
-                return "멍멍이"
-            elif '고양이' in self.favorite_topic.lower():
-                return "야옹이"
-            elif '토끼' in self.favorite_topic.lower():
-                return "토토"
-            elif '곰' in self.favorite_topic.lower():
-                return "곰돌이"
+        # 좋아하는 것에 동물이 있으면 그 동물의 이름 (lexicons/characters.json의 앞쪽 이름 우선)
+        name = keyword_matcher.first(self.favorite_topic, "characters")
+        if name:
+            return name
         
         # 기본 이름들 중 랜덤 선택
         default_names = ["꼬마", "아이", "친구", "탐험가"]
         return default_names[0]  # 일단 첫 번째로 고정
     
     def get_story_context_summary(self, last_n_chapters=3):
-        """최근 N개 챕터의 스토리 컨텍스트 요약"""
-        if not self.story_context:
-            return "아직 이야기가 시작되지 않았습니다."
-        
-        # 최근 N개 챕터만 가져오기
-        recent_context = self.story_context[-last_n_chapters:] if len(self.story_context) > last_n_chapters else self.story_context
-        
-        summary = []
-        for context in recent_context:
-            chapter_info = f"챕터 {context['chapter']}: {context['content'][:100]}..."
-            if context['user_input']:
-                chapter_info += f" (사용자 요청: {context['user_input'][:50]}...)"
-            summary.append(chapter_info)
-        
-        return "\n".join(summary)
+        """프롬프트용 스토리 컨텍스트 (시작 장면 + 줄거리 요약 + 최근 N개 챕터)"""
+        return self.story_memory.context_text(last_n_chapters)
     
     def add_to_story_context(self, content, user_input=None):
-        """스토리 컨텍스트에 새 챕터 추가"""
+        """스토리 컨텍스트에 새 챕터 추가 (밀려난 챕터는 백그라운드에서 요약에 합침)"""
         self.current_chapter += 1
         
         new_context = {
@@ -152,12 +466,26 @@ class StoryTeller:
             "timestamp": asyncio.get_event_loop().time()
         }
         
-        self.story_context.append(new_context)
-        
-        # 메모리 관리: 10개 이상이면 오래된 것 제거 (첫 번째는 유지)
-        if len(self.story_context) > 10:
-            # 첫 번째 챕터는 유지하고 중간 것들 제거
-            self.story_context = [self.story_context[0]] + self.story_context[-8:]
+        self.story_memory.add(new_context)
+    
+    async def summarize_story(self, previous_summary, chapters):
+        """이전 줄거리 요약에 새 챕터들을 합쳐 짧은 요약 생성 (백그라운드 호출)"""
+        prompt = prompt_builder.build(
+            "story_summary",
+            task="아래 동화의 줄거리 요약을 새 챕터 내용까지 반영해서 다시 써주세요.",
+            sections=[
+                f"지금까지의 요약: {previous_summary or '없음'}",
+                "새 챕터:\n" + "\n".join(f"챕터 {c['chapter']}: {c['content']}" for c in chapters),
+                f"""
+                - 주인공 {self.character_name}, 등장인물, 중요한 사건과 약속을 빠짐없이 유지
+                - {STORY_SUMMARY_CHARS}자 이내의 한 문단으로 작성
+                """
+            ]
+        )
+        with metrics.track("story_summary", "model_call"):
+            response = await text_client.generate_content(prompt, priority=PRIORITY_BACKGROUND)
+        self.record_usage("story_summary", prompt, response, response.text)
+        return response.text.strip()
     
     def get_character_consistency_info(self):
         """캐릭터 일관성을 위한 정보 반환"""
@@ -177,120 +505,212 @@ class StoryTeller:
         
         return {
             "main_subject": self.learning_subject,
-            "chapters_count": len(self.story_context),
+            "chapters_count": self.story_memory.chapter_count,
             "topics_covered": learning_topics_covered
         }
     
+    def build_continuation_prompt(self, user_input):
+        """사용자 입력을 반영한 다음 장면 프롬프트 구성 (예산을 넘으면 시작 장면/줄거리 요약은 두고 오래된 챕터 원문부터 제외)"""
+        return prompt_builder.build(
+            "continuation",
+            task="동화의 다음 장면을 150-200자 내외로 작성해주세요.",
+            pinned_context=self.story_memory.background_items(last_n_chapters=3),
+            context=self.story_memory.recent_items(last_n_chapters=3),
+            context_title="현재 상황:",
+            sections=[
+                f"캐릭터 정보:\n{self.get_character_consistency_info()}",
+                f"사용자 요청: {user_input}",
+                f"""
+                작성 가이드라인:
+                1. 이전 스토리와 자연스럽게 연결되도록 작성
+                2. 사용자의 요청을 창의적으로 반영
+                3. {self.learning_subject} 학습 요소를 자연스럽게 포함
+                4. 주인공 {self.character_name}의 특성 유지
+                5. 다음 상호작용을 유도하는 열린 결말
+                """,
+                STRUCTURED_CHAPTER_GUIDE if STORY_STRUCTURED_OUTPUT else ""
+            ]
+        )
+    
+    def get_continuation_fallback(self, user_input):
+        """연속 스토리 생성 실패 시 기본 장면"""
+        return f"""
+        {self.character_name}이/가 {user_input}을/를 보며 신기해했어요!
+        
+        "와, 정말 재미있겠다!" {self.character_name}이/가 말했어요.
+        
+        여러분이라면 {self.character_name}과/와 함께 무엇을 하고 싶나요?
+        """
+    
     async def generate_continuation_story(self, user_input):
         """사용자 입력을 바탕으로 연속 스토리 생성"""
         try:
-            # 최근 스토리 컨텍스트 가져오기
-            context_summary = self.get_story_context_summary(last_n_chapters=3)
-            character_info = self.get_character_consistency_info()
-            
-            # 연속 스토리 생성 프롬프트
-            continuation_prompt = f"""
-            경계선 지능 아동을 위한 동화의 다음 장면을 만들어주세요.
+            with metrics.track("continuation", "prompt_build"):
+                continuation_prompt = self.build_continuation_prompt(user_input)
             
-            현재 상황:
-            {context_summary}
-            
-            캐릭터 정보:
-            {character_info}
-            
-            사용자 요청: {user_input}
-            
-            작성 가이드라인:
-            1. 이전 스토리와 자연스럽게 연결되도록 작성
-            2. 사용자의 요청을 창의적으로 반영
-            3. 5-6세 아이가 이해할 수 있는 쉬운 언어 사용
-            4. 한 문장당 10-15단어 이내로 구성
-            5. {self.learning_subject} 학습 요소를 자연스럽게 포함
-            6. 주인공 {self.character_name}의 특성 유지
-            7. 따뜻하고 긍정적인 분위기 유지
-            8. 다음 상호작용을 유도하는 열린 결말
-            
-            150-200자 내외의 다음 장면을 작성해주세요.
-            """
-            
-            response = text_model.generate_content(continuation_prompt)
-            return response.text
+            with metrics.track("continuation", "model_call"):
+                response = await text_client.generate_content(continuation_prompt, **self.chapter_generation_kwargs())
+            self.record_usage("continuation", continuation_prompt, response, response.text)
+            story = self.read_chapter(response.text)
+            if not story:
+                raise ValueError("응답에서 동화 본문을 찾을 수 없습니다")
+            return story
             
         except Exception as e:
             print(f"연속 스토리 생성 오류: {str(e)}")
+            metrics.record("continuation", "story", "fallback")
             error_message = await self.handle_error_gracefully("api_error", str(e), "연속 스토리 생성")
             await cl.Message(content=error_message).send()
             
-            return f"""
-            {self.character_name}이/가 {user_input}을/를 보며 신기해했어요!
-            
-            "와, 정말 재미있겠다!" {self.character_name}이/가 말했어요.
-            
-            여러분이라면 {self.character_name}과/와 함께 무엇을 하고 싶나요?
-            """
+            return self.get_continuation_fallback(user_input)
     
-    def analyze_user_intent(self, user_input):
-        """사용자 입력 의도 분석 (간단한 키워드 기반)"""
-        user_input_lower = user_input.lower()
-        
-        # 감정/행동 키워드
-        if any(word in user_input_lower for word in ['무서', '겁', '두려']):
-            return "fear_concern"
-        elif any(word in user_input_lower for word in ['기쁘', '행복', '좋아', '재미']):
-            return "positive_emotion"
-        elif any(word in user_input_lower for word in ['도움', '도와', '구해']):
-            return "help_action"
-        elif any(word in user_input_lower for word in ['만나', '친구', '같이']):
-            return "social_interaction"
-        elif any(word in user_input_lower for word in ['가자', '가고', '이동', '떠나']):
-            return "movement_adventure"
-        elif any(word in user_input_lower for word in ['배우', '공부', '알아', '학습']):
-            return "learning_focus"
-        else:
-            return "general_continuation"
+    async def generate_continuation_candidate(self, user_input):
+        """추측 생성용 연속 스토리 원본 응답 (사용할 때 read_chapter로 해석, 실패 시 예외를 그대로 전달)"""
+        prompt = self.build_continuation_prompt(user_input)
+        with metrics.track("speculation", "model_call"):
+            response = await text_client.generate_content(
+                prompt, priority=PRIORITY_BACKGROUND, **self.chapter_generation_kwargs()
+            )
+        self.record_usage("speculation", prompt, response, response.text)
+        return response.text
     
-    async def generate_story_with_image(self, story_text, chapter_num, user_input=""):
-        """스토리 텍스트와 이미지를 병렬로 생성하여 함께 반환"""
+    async def stream_story_sentences(self, prompt, fallback_text, context="", on_complete=None, stage="story"):
+        """스토리를 스트리밍으로 생성하여 문장 단위로 전달 (성공 시 on_complete로 전체 응답 전달)"""
+        started = time.perf_counter()
+        first_token_time = None
+        buffer = ""
+        full_text = ""
+        sent_any = False
+        # 구조화 출력이면 JSON 청크에서 본문 문자열만 풀어서 문장으로 나눔
+        decoder = ChapterTextStream() if STORY_STRUCTURED_OUTPUT else None
+        
         try:
-            # 이미지 생성 프롬프트 구성
-            image_prompt = f"""
-            Create a children's book illustration for Chapter {chapter_num}:
+            async for chunk in text_client.stream_content(prompt, **self.chapter_generation_kwargs()):
+                full_text += chunk
+                if decoder:
+                    chunk = decoder.feed(chunk)
+                    # 닫는 따옴표만 따로 도착해도 남은 마지막 문장은 아래에서 바로 전달
+                    if not chunk and not (decoder.done and buffer.strip()):
+                        continue
+                if first_token_time is None:
+                    first_token_time = time.perf_counter() - started
+                    metrics.observe(stage, "first_token", first_token_time)
+                buffer += chunk
+                
+                # 완성된 문장까지만 잘라서 전달
+                sentence_end = 0
+                for match in SENTENCE_BOUNDARY.finditer(buffer):
+                    sentence_end = match.end()
+                if sentence_end:
+                    sent_any = True
+                    yield buffer[:sentence_end]
+                    buffer = buffer[sentence_end:]
+                # 본문 문자열이 끝났으면 마지막 문장은 나머지 JSON 항목을 기다리지 않고 바로 전달
+                if decoder and decoder.done and buffer.strip():
+                    sent_any = True
+                    yield buffer
+                    buffer = ""
+            
+            story = self.read_chapter(full_text)
+            if not story:
+                raise ValueError("응답에서 동화 본문을 찾을 수 없습니다")
+            if not sent_any:
+                # 본문을 하나도 풀지 못한 경우 (일반 텍스트 응답 등) 해석한 본문 전체를 전달
+                buffer = story
+            if buffer.strip():
+                sent_any = True
+                yield buffer
+            
+            if on_complete:
+                on_complete(full_text)
+            metrics.record(stage, "model_call", "success")
+            self.record_usage(stage, prompt, text=full_text)
+                
+        except Exception as e:
+            print(f"{context} 스트리밍 오류: {str(e)}")
+            metrics.record(stage, "model_call", "error")
+            if not sent_any:
+                metrics.record(stage, "story", "fallback")
+                error_message = await self.handle_error_gracefully("api_error", str(e), context)
+                await cl.Message(content=error_message).send()
+                yield fallback_text
+        
+        total_time = time.perf_counter() - started
+        metrics.observe(stage, "stream_total", total_time)
+        ttft = f"{first_token_time:.2f}초" if first_token_time is not None else "없음"
+        print(f"⏱️ {context} 스트리밍 - 첫 토큰: {ttft}, 전체: {total_time:.2f}초")
+    
+    async def stream_initial_story(self):
+        """초기 스토리를 문장 단위로 스트리밍 (캐시된 스토리가 있으면 바로 전달)"""
+        cache_key = self.get_initial_story_cache_key()
+        cached_story = await response_cache.lookup(cache_key)
+        if cached_story:
+            cached_story = self.read_chapter(cached_story)
+        if cached_story:
+            metrics.record("initial_story", "response_cache", "hit")
+            yield cached_story
+            return
+        
+        with metrics.track("initial_story", "prompt_build"):
+            prompt = self.build_initial_story_prompt()
+        async for sentence in self.stream_story_sentences(
+            prompt,
+            self.get_initial_story_fallback(),
+            "초기 스토리 생성",
+            on_complete=lambda story: response_cache.add(cache_key, story),
+            stage="initial_story"
+        ):
+            yield sentence
+    
+    def stream_continuation_story(self, user_input):
+        """연속 스토리를 문장 단위로 스트리밍"""
+        with metrics.track("continuation", "prompt_build"):
+            prompt = self.build_continuation_prompt(user_input)
+        return self.stream_story_sentences(
+            prompt,
+            self.get_continuation_fallback(user_input),
+            "연속 스토리 생성",
+            stage="continuation"
+        )
+    
+    def analyze_user_intent(self, user_input):
+        """사용자 입력 의도 분석 (키워드 기반, 여러 의도가 겹치면 lexicons/intent.json 앞쪽 우선)"""
+        return keyword_matcher.first(user_input, "intent") or "general_continuation"
+    
+    def get_illustration_character(self, chapter_num):
+        """삽화용 캐릭터 설명 (첫 장면은 여러 아이가 공유할 수 있도록 개인 특성 제외)"""
+        if chapter_num == 1:
+            return self.character_name
+        return f"{self.character_name} ({self.user_profile})"
+    
+    def build_scene_prompt(self, chapter_num, user_input=""):
+        """삽화용 장면 프롬프트 구성 (스토리 텍스트가 나오기 전에도 미리 계산 가능)"""
+        if self.story_context:
+            scene = f"Previous scene: {self.story_context[-1]['content'][:150]}\nWhat happens next: {user_input}"
+        else:
+            scene = f"The opening scene where {self.character_name} begins an adventure about {self.learning_subject}"
+        
+        return compact(f"""
+            Chapter {chapter_num} of a children's picture book:
             
-            Story content: {story_text[:200]}
-            Character: {self.character_name} ({self.user_profile})
+            {scene}
+            Character: {self.get_illustration_character(chapter_num)}
             Favorite elements: {self.favorite_topic}
             Learning subject: {self.learning_subject}
             User request context: {user_input}
             
-            Style requirements:
-            - Consistent character design throughout the series
-            - Warm, friendly children's book illustration
-            - Crayon delight style with soft textures
-            - Bright, cheerful colors appropriate for 5-6 year olds
-            - Simple, clear composition
             - Include elements related to {self.learning_subject}
             - Incorporate {self.favorite_topic} naturally in the scene
-            
-            Visual consistency: Maintain the same character appearance, proportions, and art style as previous chapters.
-            """
-            
-            # 이미지 생성 시작 메시지
-            await cl.Message(content="🎨 이미지를 생성하고 있습니다...").send()
-            
-            # 이미지 생성
-            image_data = await self.generate_story_image(
-                story_prompt=story_text,
-                character_description=f"{self.character_name} ({self.user_profile})",
-                style="consistent children's book crayon illustration"
-            )
-            
-            return story_text, image_data
-            
-        except Exception as e:
-            print(f"통합 생성 오류: {str(e)}")
-            error_message = await self.handle_error_gracefully("image_generation_error", str(e), "이미지 생성")
-            await cl.Message(content=error_message).send()
-            return story_text, None
+            - Maintain the same character appearance, proportions, and art style as previous chapters
+            """)
+    
+    def start_illustration(self, chapter_num, user_input=""):
+        """본문을 기다리지 않고 장면 프롬프트로 삽화 생성을 백그라운드에서 시작 (텍스트와 병렬)"""
+        return asyncio.create_task(self.generate_story_image(
+            story_prompt=self.build_scene_prompt(chapter_num, user_input),
+            character_description=self.get_illustration_character(chapter_num),
+            style="consistent children's book crayon illustration"
+        ))
     
     def should_generate_image(self, chapter_num):
         """이미지 생성 여부 결정 (성능 최적화)"""
@@ -299,7 +719,7 @@ class StoryTeller:
     
     def get_progress_indicator(self):
         """진행 상황 표시기 생성"""
-        total_chapters = len(self.story_context)
+        total_chapters = self.story_memory.chapter_count
         progress_bar = "🟢" * min(total_chapters, 5) + "⚪" * max(0, 5 - total_chapters)
         return f"진행도: {progress_bar} ({total_chapters}/5+ 챕터)"
     
@@ -417,91 +837,136 @@ class StoryTeller:
         return help_content.strip()
         
     def image_to_base64(self, image):
-        """PIL 이미지를 base64로 변환"""
-        buffer = io.BytesIO()
-        image.save(buffer, format='PNG')
-        return base64.b64encode(buffer.getvalue()).decode()
+        """이미지 바이트(또는 PIL 이미지)를 base64로 변환 (바이트는 다시 인코딩하지 않음)"""
+        if isinstance(image, Image.Image):
+            buffer = io.BytesIO()
+            image.save(buffer, format='WEBP', quality=image_pipeline.quality)
+            image = buffer.getvalue()
+        return base64.b64encode(image).decode()
     
-    async def generate_story_image(self, story_prompt, character_description="", style="동화책 일러스트 스타일"):
-        """Gemini Imagen을 사용한 실제 이미지 생성"""
+    async def generate_story_image(self, story_prompt, character_description="", style="동화책 일러스트 스타일",
+                                   visual_description=""):
+        """Gemini Imagen을 사용한 실제 이미지 생성 (실패 시 미리 받은 시각적 설명이 있으면 추가 호출 없이 사용)"""
         try:
-            # 이미지 생성 프롬프트 작성
-            image_prompt = f"""
-            Create a beautiful children's book illustration:
-            
-            Scene: {story_prompt}
-            Character: {character_description}
-            Style: Cute children's book illustration, watercolor style, soft pastel colors
-            
-            Requirements:
-            - Warm and friendly atmosphere
-            - Bright, cheerful colors suitable for children
-            - Simple, clear composition for young readers
-            - Hand-drawn watercolor texture
-            - Safe and positive content for 5-6 year olds
-            - Korean children's book style
-            - NO TEXT OR WORDS in the image
-            - NO Korean characters or any text elements
-            - Pure visual illustration without any written content
-            """
+            # 이미지 생성 프롬프트 작성 (장면 프롬프트는 만들 때 이미 길이를 제한함)
+            image_prompt = prompt_builder.build(
+                "illustration",
+                task="Create a beautiful children's book illustration:",
+                sections=[f"Scene: {story_prompt}", f"Character: {character_description}", IMAGE_STYLE_INSTRUCTIONS]
+            )
             
-            # Gemini 2.5 Flash Image 모델 사용 (generateContent 지원)
-            imagen_model = genai.GenerativeModel('gemini-2.5-flash-image')
+            # 같은 장면 프롬프트로 만든 이미지가 있으면 바로 사용 (후처리된 화면용/썸네일 그대로)
+            cache_key = make_cache_key(image_prompt)
+            thumbnail_key = make_cache_key(image_prompt, "thumbnail")
+            cached_image = await image_cache.get(cache_key)
+            if cached_image:
+                print("⚡ 캐시된 이미지 사용")
+                metrics.record("illustration", "image_cache", "hit")
+                return {
+                    "display": cached_image,
+                    # 썸네일은 같은 삽화에 딸린 조회라 적중/실패 통계에서 제외
+                    "thumbnail": await image_cache.get(thumbnail_key, count=False),
+                    "mime": guess_image_mime(cached_image)
+                }
             
             print(f"이미지 생성 시작: {story_prompt[:50]}...")
             
             # 이미지 생성 요청
-            response = imagen_model.generate_content(image_prompt)
+            with metrics.track("illustration", "model_call"):
+                response = await image_client.generate_content(
+                    image_prompt,
+                    priority=PRIORITY_ILLUSTRATION,
+                    max_wait=ILLUSTRATION_MAX_WAIT
+                )
+            self.record_usage("illustration", image_prompt, response)
             
             # 응답에서 이미지 데이터 추출
-            if response.candidates:
-                candidate = response.candidates[0]
-                
-                if candidate.content and candidate.content.parts:
-                    for part in candidate.content.parts:
-                        # 이미지 데이터가 있는지 확인
-                        if hasattr(part, 'inline_data') and part.inline_data and part.inline_data.data:
-                            print("✅ 이미지 생성 성공!")
-                            image_data = part.inline_data.data
-                            
-                            # base64 디코딩이 필요한지 확인
-                            if isinstance(image_data, str):
-                                return base64.b64decode(image_data)
-                            else:
-                                return image_data
+            image_data = None
+            with metrics.track("illustration", "image_decode"):
+                if response.candidates:
+                    candidate = response.candidates[0]
+                    
+                    if candidate.content and candidate.content.parts:
+                        for part in candidate.content.parts:
+                            # 이미지 데이터가 있는지 확인
+                            if hasattr(part, 'inline_data') and part.inline_data and part.inline_data.data:
+                                image_data = part.inline_data.data
+                                
+                                # base64 디코딩이 필요한지 확인
+                                if isinstance(image_data, str):
+                                    image_data = base64.b64decode(image_data)
+                                break
+            
+            if image_data:
+                print("✅ 이미지 생성 성공!")
+                metrics.record("illustration", "image", "success")
+                # 한 번만 디코딩해서 화면용 WebP + 썸네일 생성 (캐시에도 변환된 이미지만 보관)
+                variants = await image_pipeline.process(image_data)
+                await image_cache.put(cache_key, variants["display"])
+                await image_cache.put(thumbnail_key, variants["thumbnail"])
+                return variants
             
             print("⚠️ Imagen 응답에서 이미지 데이터를 찾을 수 없음")
+            metrics.record("illustration", "image", "fallback")
             
             # 대체 방법: 이미지 생성 대신 상세한 설명 제공
-            visual_description_prompt = f"""
-            다음 장면을 5-6세 아이가 머릿속으로 그려볼 수 있도록 아주 구체적이고 생생하게 묘사해주세요:
-            
-            장면: {story_prompt}
-            캐릭터: {character_description}
-            
-            "🎨 이런 그림을 상상해보세요!" 로 시작하는 2-3문장의 시각적 설명을 작성해주세요.
-            """
-            
-            response = text_model.generate_content(visual_description_prompt)
-            return f"🎨 {response.text}"
+            visual_description = self.fallback_visual_description(visual_description)
+            if visual_description:
+                return self.format_visual_description(visual_description)
+            return await self.describe_scene_visually(story_prompt, character_description)
             
         except Exception as e:
             print(f"이미지 생성 오류: {str(e)}")
-            # fallback으로 시각적 설명 제공
-            visual_description_prompt = f"""
-            다음 장면을 5-6세 아이가 머릿속으로 그려볼 수 있도록 아주 구체적이고 생생하게 묘사해주세요:
-            
-            장면: {story_prompt}
-            캐릭터: {character_description}
+            metrics.record("illustration", "image", "fallback")
+            visual_description = self.fallback_visual_description(visual_description)
+            if visual_description:
+                return self.format_visual_description(visual_description)
+            # API가 불안정한 상황(차단기 열림/과부하/일시적 오류)에서는 추가 호출 없이 기본 설명 사용
+            if isinstance(e, (CircuitOpenError, SchedulerOverloaded)) or is_transient_error(e):
+                return self.get_local_visual_description()
             
-            "🎨 이런 그림을 상상해보세요!" 로 시작하는 2-3문장의 시각적 설명을 작성해주세요.
-            """
-            
-            try:
-                response = text_model.generate_content(visual_description_prompt)
-                return f"🎨 {response.text}"
-            except:
-                return f"🎨 이런 그림을 상상해보세요! {self.character_name}이/가 {story_prompt} 하는 모습을 머릿속으로 그려보세요!"
+            # fallback으로 시각적 설명 제공
+            return await self.describe_scene_visually(story_prompt, character_description)
+    
+    def fallback_visual_description(self, visual_description=""):
+        """삽화 대체용 시각적 설명 (텍스트와 동시에 시작한 삽화는 그사이 받은 구조화 응답의 설명 사용)"""
+        return visual_description or (self.chapter_extras or {}).get("visual_description", "")
+    
+    def format_visual_description(self, description):
+        """구조화 응답의 시각적 설명을 삽화 대체 문구 형식으로"""
+        return f"🎨 {description.lstrip('🎨 ')}"
+    
+    def get_local_visual_description(self):
+        """네트워크 호출 없이 만드는 기본 시각적 설명"""
+        return f"🎨 이런 그림을 상상해보세요! {self.character_name}이/가 {self.favorite_topic}와/과 함께 모험하는 모습을 머릿속으로 그려보세요!"
+    
+    async def describe_scene_visually(self, story_prompt, character_description=""):
+        """이미지 대신 텍스트 모델로 장면의 시각적 설명 생성"""
+        # 텍스트 모델 차단기가 열려 있으면 바로 기본 설명 사용
+        if text_client.breaker.is_open:
+            return self.get_local_visual_description()
+        
+        visual_description_prompt = prompt_builder.build(
+            "visual_description",
+            task="다음 장면을 5-6세 아이가 머릿속으로 그려볼 수 있도록 아주 구체적이고 생생하게 묘사해주세요:",
+            sections=[
+                f"장면: {story_prompt}\n캐릭터: {character_description}",
+                '"🎨 이런 그림을 상상해보세요!" 로 시작하는 2-3문장의 시각적 설명을 작성해주세요.'
+            ]
+        )
+        
+        try:
+            with metrics.track("visual_description", "model_call"):
+                response = await text_client.generate_content(
+                    visual_description_prompt,
+                    priority=PRIORITY_FALLBACK,
+                    max_wait=FALLBACK_MAX_WAIT
+                )
+            self.record_usage("visual_description", visual_description_prompt, response, response.text)
+            return f"🎨 {response.text}"
+        except Exception as e:
+            print(f"시각적 설명 생성 오류: {str(e)}")
+            return self.get_local_visual_description()
     
     def set_user_profile(self, learning_subject, character_name, favorite_topic):
         """사용자 프로필 설정"""
@@ -531,8 +996,6 @@ class StoryTeller:
             """
             
             full_prompt = f"""
-            당신은 경계선 지능 아동을 위한 동화 작가입니다.
-            
             {profile_context}
             
             현재 단계: {stage}
@@ -540,16 +1003,14 @@ class StoryTeller:
             요청: {prompt}
             
             다음 가이드라인을 따라주세요:
-            - 간단하고 명확한 언어 사용 (5-6세 수준)
-            - 짧은 문장으로 구성 (10-15단어 이내)
-            - 따뜻하고 긍정적인 톤
-            - 아이들이 이해하기 쉬운 내용
             - {self.learning_subject} 학습 요소를 자연스럽게 포함
             - 주인공 이름을 {self.character_name}로 사용
             - {self.favorite_topic} 요소를 이야기에 포함
             """
             
-            response = text_model.generate_content(full_prompt)
+            full_prompt = compact(full_prompt)
+            response = await text_client.generate_content(full_prompt)
+            self.record_usage("story_text", full_prompt, response, response.text)
             return response.text
             
         except Exception as e:
@@ -557,35 +1018,28 @@ class StoryTeller:
             return "죄송해요. 이야기를 만드는 중에 문제가 생겼어요. 다시 시도해주세요."
     
     async def generate_learning_question(self):
-        """학습 문제 생성"""
+        """학습 문제 생성 (문제 은행에 있으면 모델 호출 없이 바로 반환)"""
+        question = question_bank.take(self.learning_subject)
+        if question:
+            self.correct_answer = question["answer"]
+            self.current_question = format_question(question, self.character_name)
+            return self.current_question
+        
         try:
-            prompt = f"""
-            {self.learning_subject}에 대한 간단한 문제를 만들어주세요.
-            
-            요구사항:
-            - 5-6세 아이가 답할 수 있는 수준
-            - 선택지 3개 (A, B, C)
-            - 정답 1개 표시
-            - {self.character_name}이나 {self.favorite_topic}과 연결된 내용
-            
-            형식:
-            문제: [문제 내용]
-            A) [선택지1]
-            B) [선택지2] 
-            C) [선택지3]
-            정답: [A/B/C]
-            """
-            
-            response = text_model.generate_content(prompt)
-            result = response.text
+            async def generate():
+                return await generate_question_batch(
+                    self.learning_subject, 1, priority=PRIORITY_QUESTION, ledger=self.token_ledger
+                )
             
-            # 정답 추출
-            if "정답:" in result:
-                answer_line = result.split("정답:")[-1].strip()
-                self.correct_answer = answer_line[0] if answer_line else "A"
+            # 문제는 JSON으로 받아 주인공 이름만 나중에 채우므로 캐시는 학습 주제 단위로 공유
+            cache_key = make_cache_key("learning_question", self.learning_subject)
+            questions = parse_question_batch(await response_cache.get_or_generate(cache_key, generate))
+            if not questions:
+                raise ValueError("형식에 맞는 문제가 없습니다")
             
-            self.current_question = result
-            return result
+            self.correct_answer = questions[0]["answer"]
+            self.current_question = format_question(questions[0], self.character_name)
+            return self.current_question
             
         except Exception as e:
             print(f"문제 생성 오류: {str(e)}")
@@ -604,11 +1058,204 @@ class StoryTeller:
             style="crayon delight 동화책 일러스트"
         )
 
-# 전역 스토리텔러 인스턴스
-storyteller = StoryTeller()
+# 문제 은행 보충 호출의 토큰 사용량 (세션에 속하지 않는 공용 작업)
+question_bank_ledger = TokenLedger()
+
+async def generate_question_batch(subject, count, avoid=(), priority=PRIORITY_BACKGROUND, ledger=None):
+    """학습 주제 하나의 문제 여러 개를 JSON으로 한 번에 생성 (문제 은행 보충/바로 필요한 문제 한 개)"""
+    prompt = prompt_builder.build(
+        "question_batch",
+        task=f"{subject}에 대한 5-6세 아이용 간단한 문제를 {count}개 만들어주세요.",
+        context=[f"- {question}" for question in avoid],
+        context_title="이미 나온 문제 (비슷한 문제 제외):",
+        sections=[f"""
+            요구사항:
+            - 문제마다 선택지 3개와 정답(A/B/C) 1개
+            - 주인공이 나오는 자리에는 {CHARACTER_PLACEHOLDER}라고 쓰기
+            - 서로 다른 내용의 문제
+            """]
+    )
+    with metrics.track("question_bank", "model_call"):
+        response = await text_client.generate_content(
+            prompt,
+            generation_config={"response_mime_type": "application/json", "response_schema": QUESTION_BATCH_SCHEMA},
+            priority=priority
+        )
+    if not joined_flight():
+        (ledger or question_bank_ledger).record("question_bank", *usage_from_response(response, prompt, response.text))
+    return response.text
+
+# 학습 주제별 문제 은행 (프로세스 전체가 공유)
+question_bank = QuestionBank(
+    generate_question_batch,
+    batch_size=QUESTION_BATCH_SIZE,
+    low_watermark=QUESTION_POOL_LOW_WATERMARK
+)
+
+def format_chapter_message(storyteller, story_text, chapter_num, intent_message, progress_indicator, suggestions):
+    """챕터 메시지 본문 구성"""
+    content_message = f"📖 **{storyteller.character_name}의 모험 - 챕터 {chapter_num}**\n\n"
+    content_message += f"{story_text}\n\n"
+    
+    if intent_message:
+        content_message += f"{intent_message}\n\n"
+    
+    content_message += f"📊 **{progress_indicator}**\n\n"
+    content_message += "**또 어떤 일이 일어났으면 좋겠나요?**\n"
+    content_message += f"💡 **제안**: {' | '.join(suggestions)}\n\n"
+    content_message += "🌟 자유롭게 여러분의 아이디어를 말해주세요!"
+    return content_message
+
+async def stream_chapter_text(story_message, sentences, stage="story"):
+    """문장 단위로 챕터 텍스트를 메시지에 스트리밍하고 전체 텍스트 반환"""
+    story_text = ""
+    async for sentence in sentences:
+        story_text += sentence
+        with metrics.track(stage, "message_send"):
+            await story_message.stream_token(sentence)
+    return story_text.strip()
+
+async def attach_chapter_image(storyteller, story_message, image_task, chapter_num):
+    """미리 시작한 삽화 생성이 끝나면 이미 보낸 챕터 메시지에 붙이기"""
+    try:
+        image_data = await image_task
+    except Exception as e:
+        print(f"삽화 생성 오류: {str(e)}")
+        error_message = await storyteller.handle_error_gracefully("image_generation_error", str(e), "이미지 생성")
+        await cl.Message(content=error_message).send()
+        return
+    
+    # 이미지가 있는 경우 메시지에 이미지 요소 추가 (후처리된 화면용 이미지 전송)
+    if image_data and isinstance(image_data, dict):
+        # 세션별 저장소에 보관하고 메모리의 바이트를 그대로 전달 (작업 폴더에 파일 쓰지 않음)
+        extension = image_data["mime"].split("/")[-1]
+        image_name = f"story_chapter_{chapter_num}.{extension}"
+        with metrics.track("illustration", "artifact_save"):
+            artifact_store.save(cl.context.session.id, image_name, image_data["display"])
+            if image_data["thumbnail"]:
+                artifact_store.save(
+                    cl.context.session.id, f"story_chapter_{chapter_num}_thumb.webp", image_data["thumbnail"]
+                )
+        
+        image_element = cl.Image(
+            name=image_name,
+            display="inline",
+            content=image_data["display"],
+            mime=image_data["mime"]
+        )
+        with metrics.track("illustration", "message_send"):
+            await image_element.send(for_id=story_message.id)
+    elif image_data and isinstance(image_data, str) and image_data.startswith("🎨"):
+        # 이미지 대신 시각적 설명이 온 경우 메시지 본문에 추가
+        story_message.content += f"\n\n{image_data}"
+        with metrics.track("illustration", "message_send"):
+            await story_message.update()
+
+# 세션별 스토리텔러 저장소
+session_registry = SessionRegistry(
+    StoryTeller,
+    max_sessions=MAX_SESSIONS,
+    idle_ttl=SESSION_IDLE_TTL,
+    max_memory_bytes=SESSION_MEMORY_LIMIT_MB * 1024 * 1024,
+    # 유휴/메모리 상한으로 정리된 세션의 삽화도 함께 해제 (세션 종료 때만 해제하면 재시작 전까지 남음)
+    on_close=lambda session_id, storyteller: artifact_store.remove_session(session_id)
+)
+
+def get_storyteller():
+    """현재 Chainlit 세션의 스토리텔러 반환"""
+    return session_registry.get(cl.context.session.id)
+
+# 전역 명령어 (이야기 이어가기 요청과 합치지 않음)
+HELP_COMMANDS = ['도움말', 'help', '도움', '헬프']
+RESTART_COMMANDS = ['처음부터', '다시시작', 'restart', '새로시작']
+BACK_COMMANDS = ['이전단계', '뒤로', 'back', '이전']
+
+# 세션별 입력 대기열 (한 번에 한 턴씩 처리)
+input_queues = {}
+
+def is_story_request(user_input):
+    """생성 중에 이어 보낸 입력과 합쳐서 한 챕터로 만들어도 되는 입력인지 (이야기 진행 중의 일반 입력)"""
+    command = user_input.strip().lower()
+    if command in HELP_COMMANDS or command in RESTART_COMMANDS or command in BACK_COMMANDS:
+        return False
+    return get_storyteller().story_stage == "story_ongoing"
+
+def get_input_queue():
+    """현재 Chainlit 세션의 입력 대기열 반환"""
+    session_id = cl.context.session.id
+    if session_id not in input_queues:
+        input_queues[session_id] = InputQueue(run_turn, mergeable=is_story_request)
+    return input_queues[session_id]
+
+def get_session_key():
+    """세션 저장소 키 (로그인한 사용자면 사용자 식별자, 아니면 Chainlit 세션 ID)"""
+    user = getattr(cl.context.session, "user", None)
+    return f"user:{user.identifier}" if user else cl.context.session.id
+
+async def restore_session(storyteller):
+    """저장된 세션이 있으면 최근 챕터와 요약만 읽어서 복원 (복원했으면 True)"""
+    if session_store is None:
+        return False
+    try:
+        saved = await session_store.load(get_session_key(), STORY_RECENT_CHAPTERS * 2)
+    except Exception as e:
+        print(f"세션 불러오기 오류: {str(e)}")
+        return False
+    if not saved or saved["state"].get("story_stage") in (None, "setup", "input_subject"):
+        return False
+    
+    storyteller.restore_state(saved["state"], saved["chapters"])
+    metrics.record("session_store", "resume", "success", chapter=storyteller.current_chapter)
+    print(f"📂 세션 복원: {get_session_key()} ({storyteller.story_stage}, 챕터 {storyteller.current_chapter})")
+    return True
+
+def persist_session(storyteller):
+    """이번 턴의 상태와 새 챕터를 저장 대기열에 추가 (실제 쓰기는 백그라운드에서 모아서)"""
+    if session_store is None:
+        return
+    session_key = get_session_key()
+    for chapter in storyteller.story_context:
+        if chapter["chapter"] > storyteller.persisted_chapter:
+            session_store.append_chapter(session_key, chapter)
+            storyteller.persisted_chapter = chapter["chapter"]
+    session_store.save_state(session_key, storyteller.export_state())
+
+def format_resume_message(storyteller):
+    """복원한 세션의 이어하기 안내 (현재 단계에 맞춰)"""
+    if storyteller.story_stage == "story_ongoing" and storyteller.story_context:
+        last_chapter = storyteller.story_context[-1]
+        return (
+            "🔄 **지난 이야기를 이어갈게요!**\n\n"
+            f"📖 **{storyteller.character_name}의 모험 - 챕터 {last_chapter['chapter']}**\n\n"
+            f"{last_chapter['content']}\n\n"
+            "**다음에 어떤 일이 일어났으면 좋겠나요?**\n"
+            "💡 '처음부터'라고 말하면 새로운 이야기를 시작할 수 있어요."
+        )
+    
+    next_step = {
+        "input_profile": "**2단계: 여러분에 대해 소개해주세요**\n나이, 성격, 특징 등을 자유롭게 알려주세요!",
+        "input_favorite": "**3단계: 좋아하는 것들을 알려주세요**\n좋아하는 동물, 색깔, 음식, 놀이 등 무엇이든 좋아요!",
+        "ready_to_start": "🚀 **'동화 시작'**이라고 말하면 모험이 시작됩니다!"
+    }.get(storyteller.story_stage, "💬 '도움말'을 입력하면 할 수 있는 것들을 볼 수 있어요.")
+    return (
+        "🔄 **하던 곳에서 이어서 할게요!**\n\n"
+        f"{next_step}\n\n"
+        "💡 '처음부터'라고 말하면 새로 시작할 수 있어요."
+    )
 
 @cl.on_chat_start
 async def start():
+    storyteller = session_registry.reset(cl.context.session.id)
+    
+    # 첫 세션에서 모델 연결 워밍업 (백그라운드, 프로세스당 한 번)
+    if MODEL_WARMUP:
+        model_registry.schedule_warm_up()
+    
+    # 재시작/재접속한 세션이면 저장된 상태에서 바로 이어하기 (설정 단계와 첫 챕터를 다시 만들지 않음)
+    if await restore_session(storyteller):
+        await cl.Message(content=format_resume_message(storyteller)).send()
+        return
+    
     await cl.Message(
         content="🍌 **동화 나노바나나에 오신 것을 환영합니다!** 📚✨\n\n"
         "저는 여러분만의 특별한 동화책을 만들어드리는 AI 도우미입니다.\n\n"
@@ -629,17 +1276,45 @@ async def start():
 
 @cl.on_message
 async def main(message: cl.Message):
-    user_input = message.content.strip()
+    # 세션별 대기열에서 한 번에 한 턴씩 처리
+    # (챕터 생성 중에 이어 보낸 입력은 합쳐서 다시 만들고, '처음부터'는 진행 중인 작업을 모두 취소)
+    input_queue = get_input_queue()
+    if message.content.strip().lower() in RESTART_COMMANDS:
+        input_queue.cancel_all()
+    await input_queue.submit(message.content)
+
+async def run_turn(user_input):
+    # 유휴/메모리 상한으로 정리된 세션이 다시 말을 걸면 저장소에서 조용히 복원
+    restoring = cl.context.session.id not in session_registry
+    storyteller = get_storyteller()
+    if restoring:
+        await restore_session(storyteller)
+    
+    # 대화 단계별 한 턴 전체 처리 시간 기록
+    with metrics.track(storyteller.story_stage, "turn"):
+        await handle_message(user_input, storyteller)
+    
+    # 이번 턴의 상태와 새 챕터는 요청 경로에서 쓰지 않고 대기열에만 추가
+    # (턴 도중 세션이 정리돼도 다시 조회하지 않고 이 턴을 처리한 스토리텔러를 저장,
+    #  새로 만든 빈 스토리텔러로 저장된 이야기를 덮어쓰지 않도록. '처음부터'만 새 스토리텔러로 교체됨)
+    if user_input.strip().lower() in RESTART_COMMANDS:
+        storyteller = get_storyteller()
+    persist_session(storyteller)
+
+async def handle_message(user_input, storyteller):
+    user_input = user_input.strip()
     
     # 전역 명령어 처리
-    if user_input.lower() in ['도움말', 'help', '도움', '헬프']:
+    if user_input.lower() in HELP_COMMANDS:
         help_content = await storyteller.show_help_menu()
         await cl.Message(content=help_content).send()
         return
     
-    elif user_input.lower() in ['처음부터', '다시시작', 'restart', '새로시작']:
-        # 전체 초기화
-        storyteller.__init__()
+    elif user_input.lower() in RESTART_COMMANDS:
+        # 전체 초기화 (현재 세션만, 저장된 이야기도 삭제)
+        storyteller = session_registry.reset(cl.context.session.id)
+        if session_store:
+            session_store.delete(get_session_key())
         await cl.Message(
             content="🔄 **처음부터 다시 시작합니다!**\n\n"
             "🍌 **동화 나노바나나에 다시 오신 것을 환영합니다!**\n\n"
@@ -649,7 +1324,7 @@ async def main(message: cl.Message):
         storyteller.story_stage = "input_subject"
         return
     
-    elif user_input.lower() in ['이전단계', '뒤로', 'back', '이전']:
+    elif user_input.lower() in BACK_COMMANDS:
         # 이전 단계로 복귀
         if storyteller.story_stage == "input_profile":
             storyteller.story_stage = "input_subject"
@@ -800,64 +1475,58 @@ async def main(message: cl.Message):
         
     elif storyteller.story_stage == "ready_to_start":
         # 동화 시작 준비 완료 상태
-        if any(keyword in user_input.lower() for keyword in ['동화', '시작', '만들어', '스토리']):
+        if keyword_matcher.first(user_input, "story_start"):
             storyteller.story_stage = "story_generation"
             await cl.Message(content="🎨 여러분만의 특별한 동화를 만들고 있습니다... 잠시만 기다려주세요! ✨").send()
             
-            # 개인 맞춤형 초기 스토리 생성
-            initial_story = await storyteller.generate_initial_story()
-            
-            # 주인공 이름 설정
-            storyteller.character_name = storyteller.extract_character_name_from_story(initial_story)
-            
-            # 스토리 컨텍스트에 추가 (새로운 함수 사용)
-            storyteller.current_chapter = 0  # add_to_story_context에서 증가시킴
-            storyteller.add_to_story_context(initial_story, user_input=None)
-            storyteller.story_stage = "story_ongoing"
-            
-            # 첫 번째 챕터는 항상 이미지와 함께
-            await cl.Message(content="🎨 첫 번째 장면을 위한 특별한 이미지를 만들고 있어요...").send()
-            
-            story_text, image_data = await storyteller.generate_story_with_image(
-                initial_story, 
-                1, 
-                "story_start"
-            )
+            # 주인공 이름 설정 (삽화 프롬프트를 미리 만들 수 있도록 먼저 결정)
+            storyteller.character_name = storyteller.extract_character_name_from_story("")
             
-            # 이미지가 있는 경우 이미지와 함께 표시
-            if image_data and isinstance(image_data, bytes):
-                # 바이너리 이미지 데이터를 파일로 저장
-                image_filename = f"story_chapter_1.png"
-                with open(image_filename, 'wb') as f:
-                    f.write(image_data)
+            # 첫 번째 챕터는 항상 이미지와 함께 - 텍스트 생성과 동시에 삽화 생성 시작
+            # (본문을 기다렸다 시작하면 대기 시간이 텍스트 + 이미지 시간으로 늘어남)
+            storyteller.chapter_extras = None
+            image_task = storyteller.start_illustration(1, "story_start")
+            story_message = None
+            story_sent = False
+            try:
+                await cl.Message(content="🎨 첫 번째 장면을 위한 특별한 이미지를 만들고 있어요...").send()
                 
-                # 이미지 요소 생성
-                image_element = cl.Image(
-                    name=image_filename,
-                    display="inline",
-                    path=image_filename
-                )
+                # 개인 맞춤형 초기 스토리 생성 (스트리밍 모드에서는 문장 단위로 바로 표시)
+                story_header = f"📖 **{storyteller.character_name}의 모험이 시작됩니다!**\n\n"
+                story_message = cl.Message(content=story_header)
+                if STORY_STREAMING:
+                    initial_story = await stream_chapter_text(
+                        story_message, storyteller.stream_initial_story(), stage="initial_story"
+                    )
+                else:
+                    initial_story = await storyteller.generate_initial_story()
                 
-                await cl.Message(
-                    content=f"📖 **{storyteller.character_name}의 모험이 시작됩니다!**\n\n"
+                # 스토리 컨텍스트에 추가 (새로운 함수 사용)
+                storyteller.current_chapter = 0  # add_to_story_context에서 증가시킴
+                storyteller.add_to_story_context(initial_story, user_input=None)
+                storyteller.story_stage = "story_ongoing"
+                
+                # 텍스트는 준비되는 즉시 보여주고, 삽화는 완성되면 같은 메시지에 붙임
+                story_message.content = (
+                    story_header +
                     f"{initial_story}\n\n"
                     "**다음에 어떤 일이 일어났으면 좋겠나요?**\n"
-                    "자유롭게 말해보세요! 여러분의 아이디어로 이야기가 계속됩니다! 🌟",
-                    elements=[image_element]
-                ).send()
-            else:
-                # 이미지 설명이나 이미지가 없는 경우
-                content_message = f"📖 **{storyteller.character_name}의 모험이 시작됩니다!**\n\n"
-                
-                # 이미지 설명 추가
-                if image_data and isinstance(image_data, str) and image_data.startswith("🎨"):
-                    content_message += f"{image_data}\n\n"
-                
-                content_message += f"{initial_story}\n\n"
-                content_message += "**다음에 어떤 일이 일어났으면 좋겠나요?**\n"
-                content_message += "자유롭게 말해보세요! 여러분의 아이디어로 이야기가 계속됩니다! 🌟"
-                
-                await cl.Message(content=content_message).send()
+                    "자유롭게 말해보세요! 여러분의 아이디어로 이야기가 계속됩니다! 🌟"
+                )
+                with metrics.track("initial_story", "message_send"):
+                    await story_message.send()
+                story_sent = True
+                await attach_chapter_image(storyteller, story_message, image_task, 1)
+            except asyncio.CancelledError:
+                # '처음부터'/세션 종료로 취소되면 만들던 삽화와 스트리밍 중이던 첫 장면 메시지 정리
+                image_task.cancel()
+                if story_message is not None and STORY_STREAMING and not story_sent:
+                    try:
+                        await story_message.remove()
+                    except Exception as e:
+                        print(f"취소된 챕터 메시지 정리 오류: {str(e)}")
+                metrics.record("initial_story", "turn", "cancelled")
+                raise
         else:
             await cl.Message(
                 content="**'동화 시작'**이라고 말씀해주시면 여러분만의 동화가 시작됩니다! 🍌"
@@ -865,20 +1534,59 @@ async def main(message: cl.Message):
             
     elif storyteller.story_stage == "story_ongoing":
         # 동화 진행 중 - 사용자 응답을 받아 다음 스토리 생성
-        await cl.Message(content="🎨 다음 장면을 만들고 있습니다... ✨").send()
-        
-        # 사용자 의도 분석
-        user_intent = storyteller.analyze_user_intent(user_input)
-        
-        # 연속 스토리 생성
-        continuation_story = await storyteller.generate_continuation_story(user_input)
+        # 챕터가 완성되기 전에 새 입력이 오면 이 생성은 취소하고 입력을 합쳐서 다시 만듦
+        # (아이가 보지 않을 챕터에 호출 할당량을 쓰지 않도록)
+        image_task = None
+        story_message = None
+        try:
+            with get_input_queue().supersedable():
+                await cl.Message(content="🎨 다음 장면을 만들고 있습니다... ✨").send()
+                
+                # 사용자 의도 분석
+                user_intent = storyteller.analyze_user_intent(user_input)
+                
+                # 이미지 생성 여부 결정 - 이미지 챕터는 텍스트 생성과 동시에 삽화 생성 시작
+                current_chapter = storyteller.current_chapter + 1
+                storyteller.chapter_extras = None
+                if storyteller.should_generate_image(current_chapter):
+                    image_task = storyteller.start_illustration(current_chapter, user_input)
+                    await cl.Message(content="🎨 특별한 장면을 위해 이미지도 함께 만들고 있어요...").send()
+                
+                # 연속 스토리 생성 (스트리밍 모드에서는 문장 단위로 바로 표시)
+                story_message = cl.Message(
+                    content=f"📖 **{storyteller.character_name}의 모험 - 챕터 {current_chapter}**\n\n"
+                )
+                # 아이가 제안 문구를 골랐다면 미리 만들어 둔 챕터를 바로 사용
+                speculative_story = await storyteller.speculation.take(user_input, storyteller.current_chapter)
+                if speculative_story:
+                    metrics.record("continuation", "speculation", "hit")
+                    continuation_story = storyteller.read_chapter(speculative_story) or storyteller.get_continuation_fallback(user_input)
+                elif STORY_STREAMING:
+                    continuation_story = await stream_chapter_text(
+                        story_message, storyteller.stream_continuation_story(user_input), stage="continuation"
+                    )
+                else:
+                    continuation_story = await storyteller.generate_continuation_story(user_input)
+                
+                # 구조화 응답의 의도 태그가 있으면 키워드 분석 대신 사용
+                extras = storyteller.chapter_extras
+                if extras and extras["intent_tags"]:
+                    user_intent = extras["intent_tags"][0]
+        except asyncio.CancelledError:
+            # 만들던 삽화와 스트리밍 중이던 챕터 메시지 정리
+            if image_task:
+                image_task.cancel()
+            if story_message is not None and STORY_STREAMING:
+                try:
+                    await story_message.remove()
+                except Exception as e:
+                    print(f"취소된 챕터 메시지 정리 오류: {str(e)}")
+            metrics.record("continuation", "turn", "cancelled")
+            raise
         
         # 스토리 컨텍스트에 추가
         storyteller.add_to_story_context(continuation_story, user_input)
         
-        # 학습 진행도 확인
-        learning_info = storyteller.get_learning_progression()
-        
         # 의도에 따른 추가 메시지 생성
         intent_message = ""
         if user_intent == "learning_focus":
@@ -890,78 +1598,32 @@ async def main(message: cl.Message):
         elif user_intent == "social_interaction":
             intent_message = "👫 **친구 만들기**: 새로운 친구와의 만남이 기대되네요!"
         
-        # 이미지 생성 여부 결정
-        current_chapter = learning_info['chapters_count']
-        should_create_image = storyteller.should_generate_image(current_chapter)
-        
         # 진행 상황 및 도움말 생성
         progress_indicator = storyteller.get_progress_indicator()
         suggestions = storyteller.get_helpful_suggestions(user_intent)
         
-        if should_create_image:
-            # 텍스트와 이미지를 함께 생성
-            await cl.Message(content="🎨 특별한 장면을 위해 이미지도 함께 만들고 있어요...").send()
-            
-            story_text, image_data = await storyteller.generate_story_with_image(
-                continuation_story, 
-                current_chapter, 
-                user_input
-            )
-            
-            # 이미지가 있는 경우 이미지와 함께 표시
-            if image_data and isinstance(image_data, bytes):
-                # 바이너리 이미지 데이터를 파일로 저장
-                image_filename = f"story_chapter_{current_chapter}.png"
-                with open(image_filename, 'wb') as f:
-                    f.write(image_data)
-                
-                # 이미지 요소 생성
-                image_element = cl.Image(
-                    name=image_filename,
-                    display="inline",
-                    path=image_filename
-                )
-                
-                await cl.Message(
-                    content=f"📖 **{storyteller.character_name}의 모험 - 챕터 {current_chapter}**\n\n"
-                    f"{continuation_story}\n\n"
-                    f"{intent_message}\n\n" if intent_message else ""
-                    f"📊 **{progress_indicator}**\n\n"
-                    "**또 어떤 일이 일어났으면 좋겠나요?**\n"
-                    f"💡 **제안**: {' | '.join(suggestions)}\n\n"
-                    "🌟 자유롭게 여러분의 아이디어를 말해주세요!",
-                    elements=[image_element]
-                ).send()
-            else:
-                # 이미지 설명이나 이미지가 없는 경우
-                content_message = f"📖 **{storyteller.character_name}의 모험 - 챕터 {current_chapter}**\n\n"
-                
-                # 이미지 설명 추가 (있는 경우)
-                if image_data and isinstance(image_data, str) and image_data.startswith("🎨"):
-                    content_message += f"{image_data}\n\n"
-                
-                content_message += f"{continuation_story}\n\n"
-                
-                if intent_message:
-                    content_message += f"{intent_message}\n\n"
-                
-                content_message += f"📊 **{progress_indicator}**\n\n"
-                content_message += "**또 어떤 일이 일어났으면 좋겠나요?**\n"
-                content_message += f"💡 **제안**: {' | '.join(suggestions)}\n\n"
-                content_message += "🌟 자유롭게 여러분의 아이디어를 말해주세요!"
-                
-                await cl.Message(content=content_message).send()
-        else:
-            # 텍스트만 표시 (성능 최적화)
-            await cl.Message(
-                content=f"📖 **{storyteller.character_name}의 모험 - 챕터 {current_chapter}**\n\n"
-                f"{continuation_story}\n\n"
-                f"{intent_message}\n\n" if intent_message else ""
-                f"📊 **{progress_indicator}**\n\n"
-                "**또 어떤 일이 일어났으면 좋겠나요?**\n"
-                f"💡 **제안**: {' | '.join(suggestions)}\n\n"
-                "🌟 자유롭게 여러분의 아이디어를 말해주세요!"
-            ).send()
+        # 텍스트는 준비되는 즉시 전송 (스트리밍한 메시지는 완성본으로 마무리)
+        story_message.content = format_chapter_message(
+            storyteller, continuation_story, current_chapter,
+            intent_message, progress_indicator, suggestions
+        )
+        try:
+            with metrics.track("continuation", "message_send"):
+                await story_message.send()
+            
+            # 아이가 읽는 동안 제안 문구별 다음 챕터를 미리 생성
+            if SPECULATION_BUDGET > 0:
+                storyteller.speculation.start(suggestions, storyteller.current_chapter)
+            
+            # 삽화는 완성되는 대로 같은 메시지에 붙임
+            if image_task:
+                await attach_chapter_image(storyteller, story_message, image_task, current_chapter)
+        except asyncio.CancelledError:
+            # 챕터를 보낸 뒤 취소돼도 만들던 삽화는 멈춤 (보낸 챕터 메시지는 그대로 둠)
+            if image_task:
+                image_task.cancel()
+            metrics.record("continuation", "turn", "cancelled")
+            raise
             
     else:
         # 예상하지 못한 상태 - 에러 처리
@@ -975,3 +1637,10 @@ async def main(message: cl.Message):
             "\n\n💬 또는 '도움말'을 입력해보세요!"
         ).send()
 
+@cl.on_chat_end
+async def end():
+    # 세션 종료 시 진행 중인 생성 취소, 스토리 상태와 삽화 정리 (삽화는 세션 저장소의 on_close에서 해제)
+    input_queue = input_queues.pop(cl.context.session.id, None)
+    if input_queue:
+        input_queue.cancel_all()
+    session_registry.remove(cl.context.session.id)
@@ -0,0 +1,118 @@
+import asyncio
+import os
+import re
+import shutil
+import time
+from collections import OrderedDict
+
+from metrics import track
+
+SAFE_NAME = re.compile(r"[^0-9A-Za-z._-]+")
+
+
+def guess_image_mime(data):
+    """이미지 바이트의 시작 부분으로 MIME 타입 추정"""
+    if data[:8] == b"\x89PNG\r\n\x1a\n":
+        return "image/png"
+    if data[:3] == b"\xff\xd8\xff":
+        return "image/jpeg"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    if data[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    return "image/png"
+
+
+class ImageArtifactStore:
+    """세션별 삽화 저장소 (메모리 우선, 메모리에서 밀려난 이미지만 디스크로 비동기 저장)"""
+
+    def __init__(self, max_items_per_session=6, spill_dir=None, retention_seconds=24 * 3600,
+                 gc_interval=600):
+        self.max_items_per_session = max_items_per_session
+        self.spill_dir = spill_dir
+        self.retention_seconds = retention_seconds
+        self.gc_interval = gc_interval
+        # session_id -> OrderedDict(name -> bytes)
+        self._sessions = {}
+        self._last_gc = 0.0
+        self._background = set()
+
+    def _session_dir(self, session_id):
+        return os.path.join(self.spill_dir, SAFE_NAME.sub("_", session_id))
+
+    def _path(self, session_id, name):
+        return os.path.join(self._session_dir(session_id), SAFE_NAME.sub("_", name))
+
+    def save(self, session_id, name, data):
+        """세션 네임스페이스에 이미지 저장 (디스크 쓰기는 이벤트 루프 밖에서 처리)"""
+        artifacts = self._sessions.setdefault(session_id, OrderedDict())
+        artifacts[name] = data
+        artifacts.move_to_end(name)
+
+        # 세션당 메모리 보관 개수를 넘으면 오래된 이미지를 디스크로 내보내거나 버림
+        while len(artifacts) > self.max_items_per_session:
+            old_name, old_data = artifacts.popitem(last=False)
+            if self.spill_dir:
+                self._run_background(asyncio.to_thread(self._write, session_id, old_name, old_data))
+
+        if self.spill_dir and time.monotonic() - self._last_gc > self.gc_interval:
+            self._last_gc = time.monotonic()
+            self._run_background(self.collect_garbage())
+
+    def _run_background(self, coroutine):
+        task = asyncio.create_task(coroutine)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def get(self, session_id, name):
+        """세션의 이미지 조회 (메모리 → 디스크 순)"""
+        data = self._sessions.get(session_id, {}).get(name)
+        if data is not None or not self.spill_dir:
+            return data
+        return await asyncio.to_thread(self._read, session_id, name)
+
+    def _write(self, session_id, name, data):
+        os.makedirs(self._session_dir(session_id), exist_ok=True)
+        with track("artifact_store", "file_write"):
+            with open(self._path(session_id, name), "wb") as f:
+                f.write(data)
+
+    def _read(self, session_id, name):
+        try:
+            with open(self._path(session_id, name), "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def remove_session(self, session_id):
+        """세션 종료 시 메모리에 있는 이미지 해제 (디스크 파일은 보관 기간 후 정리)"""
+        self._sessions.pop(session_id, None)
+
+    async def collect_garbage(self):
+        """보관 기간이 지난 디스크 이미지와 빈 세션 폴더 정리"""
+        if self.spill_dir:
+            await asyncio.to_thread(self._collect_garbage)
+
+    def _collect_garbage(self):
+        if not os.path.isdir(self.spill_dir):
+            return
+        cutoff = time.time() - self.retention_seconds
+        for session_entry in os.scandir(self.spill_dir):
+            if not session_entry.is_dir():
+                continue
+            remaining = 0
+            for file_entry in os.scandir(session_entry.path):
+                if file_entry.stat().st_mtime < cutoff:
+                    os.remove(file_entry.path)
+                else:
+                    remaining += 1
+            if remaining == 0:
+                shutil.rmtree(session_entry.path, ignore_errors=True)
+
+    def stats(self):
+        """메모리에 있는 세션/이미지 현황"""
+        return {
+            "sessions": len(self._sessions),
+            "images": sum(len(artifacts) for artifacts in self._sessions.values()),
+            "bytes": sum(len(data) for artifacts in self._sessions.values() for data in artifacts.values()),
+        }
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+동화 나노바나나 부하 테스트 / 벤치마크 스크립트
+
+start()/main()을 세션 N개로 동시에 실행해 전체 흐름
+(주제 → 소개 → 좋아하는 것 → '동화 시작' → 이어가기 k번)을 측정합니다.
+기본으로 로컬 스텁 모델(STORY_MODEL_BACKEND=stub)을 사용합니다.
+
+사용 예:
+    python benchmark.py --sessions 50 --concurrency 20 --continuations 3 --latency-ms 800
+    python benchmark.py --baseline benchmark_baseline.json   # p95 회귀 확인
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from types import SimpleNamespace
+
+SETUP_INPUTS = [
+    ("subject", "숫자"),
+    ("profile", "6살이고 호기심이 많아요"),
+    ("favorite", "강아지와 파란색"),
+    ("story_start", "동화 시작"),
+]
+
+CONTINUATION_INPUTS = [
+    "숲속으로 들어가서 친구를 만나요",
+    "사과를 세 개 세어 봐요",
+    "무지개 다리를 건너요",
+    "길을 잃은 토끼를 도와줘요",
+    "하늘을 날아서 구름 위로 가요",
+]
+
+
+def percentile(values, fraction):
+    """정렬된 값에서 백분위수 (nearest-rank)"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(fraction * len(ordered)))
+    return ordered[index]
+
+
+def summarize(values):
+    """지연 시간 목록 요약 (초)"""
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "mean": sum(values) / len(values),
+        "p50": percentile(values, 0.50),
+        "p95": percentile(values, 0.95),
+        "p99": percentile(values, 0.99),
+        "max": max(values),
+    }
+
+
+def current_rss_mb():
+    """현재 RSS (MB, /proc을 읽을 수 없으면 None)"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+
+def peak_rss_mb():
+    """최대 RSS (MB)"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS는 바이트, Linux는 KB 단위
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+class LoopLagMonitor:
+    """일정 간격으로 잠들었다가 늦게 깨어난 시간으로 이벤트 루프 지연 측정"""
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.samples = []
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, loop.time() - started - self.interval))
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+
+def configure_environment(args):
+    """app을 불러오기 전에 스텁 백엔드와 임시 캐시 경로 설정"""
+    os.environ["STORY_MODEL_BACKEND"] = args.backend
+    os.environ["STUB_LATENCY_MS"] = str(args.latency_ms)
+    os.environ["STUB_IMAGE_LATENCY_MS"] = str(args.image_latency_ms)
+    os.environ["STUB_LATENCY_JITTER_MS"] = str(args.jitter_ms)
+    os.environ["STUB_TEXT_CHARS"] = str(args.text_chars)
+    os.environ["STUB_IMAGE_SIZE"] = str(args.image_size)
+    # 실행할 때마다 디스크 캐시가 섞이지 않도록 임시 디렉터리 사용
+    cache_dir = tempfile.mkdtemp(prefix="storybook-bench-")
+    os.environ.setdefault("IMAGE_CACHE_DIR", os.path.join(cache_dir, "images"))
+    os.environ.setdefault("SESSION_STORE_PATH", os.path.join(cache_dir, "sessions.sqlite3"))
+    if not args.response_cache:
+        # TTL 0이면 저장한 응답이 바로 만료되어 매번 모델을 호출
+        os.environ["RESPONSE_CACHE_TTL"] = "0"
+    if args.no_coalescing:
+        # 같은 프롬프트 동시 호출 합치기를 끄고 비교
+        os.environ["MODEL_COALESCING"] = "0"
+
+
+async def run_session(app, index, args, stage_latencies, errors):
+    """세션 하나의 전체 흐름 실행"""
+    from chainlit.context import init_http_context
+
+    # 태스크마다 독립된 chainlit 컨텍스트(세션 ID)를 가짐
+    init_http_context()
+
+    steps = list(SETUP_INPUTS)
+    for chapter in range(args.continuations):
+        text = CONTINUATION_INPUTS[(index + chapter) % len(CONTINUATION_INPUTS)]
+        steps.append((f"continuation_{chapter + 1}", text))
+
+    try:
+        started = time.perf_counter()
+        await app.start()
+        stage_latencies["chat_start"].append(time.perf_counter() - started)
+
+        for stage, text in steps:
+            started = time.perf_counter()
+            try:
+                await app.main(SimpleNamespace(content=text))
+            except Exception as e:
+                errors[stage] += 1
+                print(f"❌ 세션 {index} {stage} 오류: {str(e)}")
+                return False
+            stage_latencies[stage].append(time.perf_counter() - started)
+        return True
+    finally:
+        await app.end()
+
+
+async def run_benchmark(args):
+    import app
+
+    stage_latencies = defaultdict(list)
+    errors = defaultdict(int)
+    limiter = asyncio.Semaphore(args.concurrency)
+
+    async def limited(index):
+        async with limiter:
+            return await run_session(app, index, args, stage_latencies, errors)
+
+    rss_start = current_rss_mb()
+    monitor = LoopLagMonitor()
+    monitor.start()
+    started = time.perf_counter()
+    results = await asyncio.gather(*(limited(i) for i in range(args.sessions)))
+    wall = time.perf_counter() - started
+    await monitor.stop()
+
+    completed = sum(1 for ok in results if ok)
+    return {
+        "config": vars(args),
+        "wall_seconds": wall,
+        "sessions": args.sessions,
+        "completed_sessions": completed,
+        "sessions_per_second": completed / wall if wall else None,
+        "stages": {stage: summarize(values) for stage, values in stage_latencies.items()},
+        "errors": dict(errors),
+        "event_loop_lag": summarize(monitor.samples),
+        "rss_mb": {"start": rss_start, "end": current_rss_mb(), "peak": peak_rss_mb()},
+        "model_clients": {name: client.stats() for name, client in app.model_registry.clients().items()},
+        "caches": {
+            "image_cache": app.image_cache.stats(),
+            "response_cache": app.response_cache.stats(),
+            "artifact_store": app.artifact_store.stats(),
+        },
+    }
+
+
+def compare_with_baseline(result, baseline_path, max_regression):
+    """기준 결과와 단계별 p95 비교, 허용 폭을 넘은 단계 목록 반환"""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+
+    regressions = []
+    for stage, summary in result["stages"].items():
+        before = baseline.get("stages", {}).get(stage, {}).get("p95")
+        after = summary.get("p95")
+        if not before or after is None:
+            continue
+        change = (after - before) / before
+        marker = "❌" if change > max_regression else "✅"
+        print(f"{marker} {stage}: p95 {before:.3f}초 → {after:.3f}초 ({change:+.0%})")
+        if change > max_regression:
+            regressions.append(stage)
+    return regressions
+
+
+def print_report(result):
+    print(f"\n📊 세션 {result['completed_sessions']}/{result['sessions']}개 완료 "
+          f"({result['wall_seconds']:.1f}초, 초당 {result['sessions_per_second']:.2f}세션)")
+    print(f"{'단계':<18}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}")
+    for stage, summary in result["stages"].items():
+        print(f"{stage:<18}{summary['p50']:>8.3f}s{summary['p95']:>8.3f}s"
+              f"{summary['p99']:>8.3f}s{summary['max']:>8.3f}s")
+    lag = result["event_loop_lag"]
+    if lag["count"]:
+        print(f"⏱️ 이벤트 루프 지연: p50 {lag['p50'] * 1000:.1f}ms, p99 {lag['p99'] * 1000:.1f}ms, "
+              f"최대 {lag['max'] * 1000:.1f}ms")
+    rss = result["rss_mb"]
+    print(f"💾 RSS: 시작 {rss['start'] or 0:.0f}MB → 종료 {rss['end'] or 0:.0f}MB (최대 {rss['peak']:.0f}MB)")
+    if result["errors"]:
+        print(f"⚠️ 오류: {result['errors']}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="동화 나노바나나 부하 테스트")
+    parser.add_argument("--sessions", type=int, default=20, help="실행할 세션 수")
+    parser.add_argument("--concurrency", type=int, default=10, help="동시에 진행할 세션 수")
+    parser.add_argument("--continuations", type=int, default=3, help="세션당 이어가기 횟수")
+    parser.add_argument("--backend", default="stub", help="모델 백엔드 (stub, replay, gemini)")
+    parser.add_argument("--latency-ms", type=int, default=500, help="스텁 텍스트 응답 지연(ms)")
+    parser.add_argument("--image-latency-ms", type=int, default=2000, help="스텁 이미지 응답 지연(ms)")
+    parser.add_argument("--jitter-ms", type=int, default=100, help="스텁 지연 흔들림 폭(ms)")
+    parser.add_argument("--text-chars", type=int, default=300, help="스텁 텍스트 길이(글자)")
+    parser.add_argument("--image-size", type=int, default=512, help="스텁 이미지 한 변 크기(px)")
+    parser.add_argument("--response-cache", action="store_true", help="응답 캐시 사용 (기본은 끔)")
+    parser.add_argument("--no-coalescing", action="store_true", help="같은 요청 합치기 끄기")
+    parser.add_argument("--output", default="benchmark_results.json", help="결과 JSON 파일 경로")
+    parser.add_argument("--baseline", help="비교할 이전 결과 JSON 파일")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="허용할 p95 증가율")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    configure_environment(args)
+    print(f"🚀 부하 테스트 시작: 세션 {args.sessions}개, 동시 {args.concurrency}개, "
+          f"이어가기 {args.continuations}번 ({args.backend} 백엔드)")
+
+    result = asyncio.run(run_benchmark(args))
+    print_report(result)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"📝 결과 저장: {args.output}")
+
+    if args.baseline:
+        regressions = compare_with_baseline(result, args.baseline, args.max_regression)
+        if regressions:
+            print(f"❌ 성능 회귀: {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
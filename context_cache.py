@@ -0,0 +1,83 @@
+import threading
+import time
+
+import metrics
+from model_backends import estimate_tokens
+
+# Gemini 명시적 컨텐츠 캐시의 최소 크기 (2.5 Flash 기준, 이보다 작으면 생성 요청이 항상 실패)
+MIN_CACHE_TOKENS = 1024
+
+
+class CachedInstructionModel:
+    """공통 시스템 지시문을 캐시된 컨텐츠로 한 번만 올려 두고 핸들로 참조하는 모델
+
+    지시문이 캐시 최소 크기보다 작으면 캐시를 만들지 않고(매번 실패하는 생성 요청 방지),
+    백엔드가 컨텐츠 캐시를 지원하지 않거나 생성에 실패하면 system_instruction을 가진 모델로 대체하고,
+    만료 시각이 지나면 다시 시도한다.
+    """
+
+    def __init__(self, backend, model_name, system_instruction, ttl=3600, refresh_margin=60,
+                 use_cache=True, min_tokens=MIN_CACHE_TOKENS):
+        self.backend = backend
+        self.model_name = model_name
+        self.system_instruction = system_instruction
+        self.ttl = ttl
+        self.refresh_margin = refresh_margin
+        self.use_cache = use_cache
+        if use_cache and estimate_tokens(system_instruction) < min_tokens:
+            print(f"🗂️ 시스템 지시문이 캐시 최소 크기({min_tokens}토큰)보다 작아 캐시 없이 사용: {model_name}")
+            self.use_cache = False
+        self._model = None
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+        self.cached = False
+        self.refreshes = 0
+
+    def _refresh(self):
+        """캐시 핸들 새로 만들기 (실패하면 system_instruction 모델 사용)"""
+        self.refreshes += 1
+        if self.use_cache:
+            try:
+                self._model, self._expires_at = self.backend.create_cached_model(
+                    self.model_name, self.system_instruction, self.ttl
+                )
+                self.cached = True
+                metrics.record("context_cache", "create", "success", model=self.model_name)
+                print(f"🗂️ 시스템 지시문 캐시 생성: {self.model_name} ({self.ttl}초)")
+                return
+            except NotImplementedError:
+                pass
+            except Exception as e:
+                print(f"시스템 지시문 캐시 생성 실패 (system_instruction 사용): {str(e)}")
+        self._model = self.backend.create_model(self.model_name, system_instruction=self.system_instruction)
+        self._expires_at = time.time() + self.ttl
+        self.cached = False
+        metrics.record("context_cache", "create", "fallback", model=self.model_name)
+
+    def _handle(self):
+        with self._lock:
+            if self._model is None or time.time() >= self._expires_at - self.refresh_margin:
+                self._refresh()
+            return self._model
+
+    def invalidate(self):
+        with self._lock:
+            self._model = None
+
+    def _call(self, method, *args, **kwargs):
+        model = self._handle()
+        try:
+            return getattr(model, method)(*args, **kwargs)
+        except Exception as e:
+            # 서버 쪽에서 캐시가 먼저 사라진 경우 핸들을 새로 만들어 한 번만 재시도
+            if not (self.cached and "cache" in str(e).lower()):
+                raise
+            print(f"🗂️ 캐시 핸들 만료, 새로 생성: {str(e)}")
+            self.invalidate()
+            return getattr(self._handle(), method)(*args, **kwargs)
+
+    def generate_content(self, *args, **kwargs):
+        return self._call("generate_content", *args, **kwargs)
+
+    def count_tokens(self, *args, **kwargs):
+        return self._call("count_tokens", *args, **kwargs)
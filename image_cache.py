@@ -0,0 +1,170 @@
+import asyncio
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from metrics import track
+
+WHITESPACE = re.compile(r"\s+")
+
+
+def make_cache_key(*parts):
+    """프롬프트 입력을 정규화(공백/대소문자)하여 해시 키 생성"""
+    normalized = "\x1f".join(WHITESPACE.sub(" ", str(part)).strip().lower() for part in parts)
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+class ImageCache:
+    """삽화 캐시 (메모리 LRU + 용량 제한 디스크 저장소 + 워커 공유 저장소)"""
+
+    def __init__(self, memory_limit_bytes=64 * 1024 * 1024, disk_dir=".cache/images",
+                 disk_limit_bytes=512 * 1024 * 1024, shared=None):
+        self.memory_limit_bytes = memory_limit_bytes
+        self.disk_dir = disk_dir
+        self.disk_limit_bytes = disk_limit_bytes
+        # 여러 워커 프로세스가 함께 쓰는 캐시 (SharedCache, 다른 워커가 만든 삽화도 적중)
+        self.shared = shared
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        # 디스크 인덱스: key -> [크기, 마지막 접근 시각]
+        self._disk_index = {}
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        if self.disk_dir:
+            self._load_disk_index()
+
+    def _load_disk_index(self):
+        """기존 디스크 캐시 파일 목록 읽기"""
+        os.makedirs(self.disk_dir, exist_ok=True)
+        for entry in os.scandir(self.disk_dir):
+            if entry.is_file() and entry.name.endswith(".img"):
+                stat = entry.stat()
+                self._disk_index[entry.name[:-4]] = [stat.st_size, stat.st_mtime]
+                self._disk_bytes += stat.st_size
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.img")
+
+    async def get(self, key, count=True):
+        """캐시에서 이미지 바이트 조회 (메모리 → 디스크 → 공유 저장소 순)
+
+        count=False면 적중/실패 통계에 넣지 않음 (이미 센 삽화에 딸린 썸네일 조회 등).
+        """
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += count
+                return data
+
+        if self.disk_dir and key in self._disk_index:
+            data = await asyncio.to_thread(self._read_disk, key)
+            if data is not None:
+                self.disk_hits += count
+                self._put_memory(key, data)
+                return data
+
+        if self.shared:
+            data = await asyncio.to_thread(self.shared.get, "image", key)
+            if data is not None:
+                self.shared_hits += count
+                self._put_memory(key, data)
+                return bytes(data)
+
+        self.misses += count
+        return None
+
+    async def put(self, key, data):
+        """이미지 바이트를 메모리와 디스크(또는 공유 저장소)에 저장"""
+        if not isinstance(data, bytes) or not data:
+            return
+        self._put_memory(key, data)
+        if self.disk_dir:
+            await asyncio.to_thread(self._write_disk, key, data)
+        if self.shared:
+            await asyncio.to_thread(self.shared.put, "image", key, data)
+
+    def _put_memory(self, key, data):
+        if len(data) > self.memory_limit_bytes:
+            return
+        with self._lock:
+            previous = self._memory.pop(key, None)
+            if previous is not None:
+                self._memory_bytes -= len(previous)
+            self._memory[key] = data
+            self._memory_bytes += len(data)
+            # 메모리 상한을 넘으면 가장 오래 안 쓴 이미지부터 제거
+            while self._memory_bytes > self.memory_limit_bytes:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_bytes -= len(evicted)
+
+    def _read_disk(self, key):
+        try:
+            with open(self._disk_path(key), "rb") as f:
+                data = f.read()
+        except OSError:
+            with self._lock:
+                entry = self._disk_index.pop(key, None)
+                if entry:
+                    self._disk_bytes -= entry[0]
+            return None
+        with self._lock:
+            if key in self._disk_index:
+                self._disk_index[key][1] = time.time()
+        return data
+
+    def _write_disk(self, key, data):
+        path = self._disk_path(key)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with track("image_cache", "file_write"):
+            with open(temp_path, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, path)
+
+        with self._lock:
+            previous = self._disk_index.get(key)
+            if previous:
+                self._disk_bytes -= previous[0]
+            self._disk_index[key] = [len(data), time.time()]
+            self._disk_bytes += len(data)
+            # 디스크 상한을 넘으면 가장 오래 안 쓴 파일부터 삭제
+            victims = []
+            if self._disk_bytes > self.disk_limit_bytes:
+                for victim_key, (size, _) in sorted(self._disk_index.items(), key=lambda item: item[1][1]):
+                    if self._disk_bytes <= self.disk_limit_bytes:
+                        break
+                    if victim_key == key:
+                        continue
+                    victims.append(victim_key)
+                    self._disk_bytes -= size
+                for victim_key in victims:
+                    del self._disk_index[victim_key]
+
+        for victim_key in victims:
+            try:
+                os.remove(self._disk_path(victim_key))
+            except OSError:
+                pass
+
+    def stats(self):
+        """캐시 적중/실패 통계"""
+        hits = self.memory_hits + self.disk_hits + self.shared_hits
+        lookups = hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "memory_bytes": self._memory_bytes,
+            "disk_bytes": self._disk_bytes,
+            "memory_items": len(self._memory),
+            "disk_items": len(self._disk_index),
+        }
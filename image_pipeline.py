@@ -0,0 +1,75 @@
+import asyncio
+import io
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+from artifact_store import guess_image_mime
+from metrics import track
+
+
+def encode_webp(image, quality):
+    """PIL 이미지를 WebP 바이트로 인코딩 (exif/icc/xmp를 넘기지 않으므로 메타데이터는 남지 않음)"""
+    buffer = io.BytesIO()
+    image.save(buffer, format="WEBP", quality=quality, method=4)
+    return buffer.getvalue()
+
+
+def render_variants(data, display_size=1024, thumbnail_size=256, quality=80, thumbnail_quality=70):
+    """이미지를 한 번만 디코딩해서 화면용 WebP와 썸네일 WebP 생성"""
+    # BytesIO는 원본 bytes를 복사하지 않고 그대로 읽음
+    with Image.open(io.BytesIO(data)) as source:
+        # JPEG은 디코딩 단계에서 바로 축소 (다른 형식은 영향 없음)
+        source.draft("RGB", (display_size, display_size))
+        mode = "RGBA" if source.mode in ("RGBA", "LA", "PA") or "transparency" in source.info else "RGB"
+        display = source.convert(mode)
+
+    display.thumbnail((display_size, display_size), Image.LANCZOS)
+    ratio = min(1.0, thumbnail_size / max(display.size))
+    thumbnail = display.resize(
+        (max(1, round(display.width * ratio)), max(1, round(display.height * ratio))),
+        Image.LANCZOS,
+        reducing_gap=2.0
+    )
+    return {
+        "display": encode_webp(display, quality),
+        "thumbnail": encode_webp(thumbnail, thumbnail_quality),
+        "mime": "image/webp",
+    }
+
+
+class ImagePipeline:
+    """삽화 후처리 (디코딩/축소/WebP 변환을 이벤트 루프 밖의 스레드 풀에서 실행)"""
+
+    def __init__(self, max_workers=2, display_size=1024, thumbnail_size=256, quality=80,
+                 thumbnail_quality=70):
+        self.display_size = display_size
+        self.thumbnail_size = thumbnail_size
+        self.quality = quality
+        self.thumbnail_quality = thumbnail_quality
+        # Pillow는 디코딩/리사이즈/인코딩 중 GIL을 놓기 때문에 스레드 풀로 충분 (프로세스 간 바이트 복사 없음)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="image-pipeline")
+        self.processed = 0
+        self.failed = 0
+
+    async def process(self, data):
+        """원본 바이트를 화면용/썸네일 변형으로 변환 (실패하면 원본을 그대로 화면용으로 사용)"""
+        loop = asyncio.get_running_loop()
+        with track("illustration", "image_process") as span:
+            try:
+                variants = await loop.run_in_executor(
+                    self._executor, render_variants, data, self.display_size, self.thumbnail_size,
+                    self.quality, self.thumbnail_quality
+                )
+            except Exception as e:
+                print(f"이미지 후처리 오류 (원본 사용): {str(e)}")
+                span["outcome"] = "fallback"
+                self.failed += 1
+                return {"display": data, "thumbnail": None, "mime": guess_image_mime(data)}
+        self.processed += 1
+        print(f"🖼️ 이미지 후처리: {len(data) / 1024:.1f}KB → 화면용 {len(variants['display']) / 1024:.1f}KB, "
+              f"썸네일 {len(variants['thumbnail']) / 1024:.1f}KB")
+        return variants
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
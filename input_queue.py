@@ -0,0 +1,108 @@
+import asyncio
+import contextlib
+from collections import deque
+
+
+class InputQueue:
+    """세션별 입력 대기열 (한 번에 한 턴씩 처리, 빠르게 이어진 입력은 합치고 밀려난 생성은 취소)"""
+
+    def __init__(self, handle, mergeable=None, separator=" "):
+        # handle(텍스트): 한 턴을 처리하는 코루틴 함수
+        # mergeable(텍스트): 다른 입력과 합쳐서 한 번에 처리해도 되는 입력인지 (이야기 이어가기 요청 등)
+        self.handle = handle
+        self.mergeable = mergeable or (lambda text: False)
+        self.separator = separator
+        self._pending = deque()
+        self._task = None
+        self._draining = False
+        self._supersedable = False
+        self._superseded = False
+        self.turns = 0
+        self.merged = 0
+        self.superseded = 0
+        self.cancelled = 0
+
+    async def submit(self, text):
+        """입력 추가 후 차례대로 처리 (이미 처리 중이면 대기열에만 넣고 바로 반환)"""
+        self._pending.append(text)
+        if self._supersedable and self.mergeable(text):
+            self._supersede()
+        if self._draining:
+            return
+        self._draining = True
+        try:
+            await self._drain()
+        finally:
+            self._draining = False
+
+    async def _drain(self):
+        while self._pending:
+            batch = self._take_batch()
+            self._superseded = False
+            self._task = asyncio.create_task(self.handle(self.separator.join(batch)))
+            try:
+                # 턴 태스크가 취소돼도 대기열 처리는 계속 (이 코루틴 자체가 취소되면 턴도 취소)
+                await asyncio.wait({self._task})
+            except asyncio.CancelledError:
+                self.cancel_all()
+                raise
+            finally:
+                self._supersedable = False
+
+            if self._task.cancelled():
+                if self._superseded:
+                    # 밀려난 입력은 새 입력과 합쳐서 다시 처리
+                    self._pending.extendleft(reversed(batch))
+                continue
+            self.turns += 1
+            self.merged += len(batch) - 1
+            if self._task.exception() is not None:
+                error = self._task.exception()
+                print(f"입력 처리 오류: {type(error).__name__}: {str(error)}")
+
+    def _take_batch(self):
+        batch = [self._pending.popleft()]
+        if self.mergeable(batch[0]):
+            while self._pending and self.mergeable(self._pending[0]):
+                batch.append(self._pending.popleft())
+        if len(batch) > 1:
+            print(f"🧺 빠르게 이어진 입력 {len(batch)}개를 합쳐서 처리")
+        return batch
+
+    def _supersede(self):
+        if self._task is None or self._task.done() or self._superseded:
+            return
+        self._superseded = True
+        self.superseded += 1
+        self._task.cancel()
+        print("✂️ 새 입력이 와서 진행 중인 생성을 취소하고 합쳐서 다시 만듭니다")
+
+    @contextlib.contextmanager
+    def supersedable(self):
+        """이 구간(아직 아이에게 보여주지 않은 생성)에서 새 입력이 오면 턴을 취소하고 입력을 합쳐 다시 처리"""
+        self._supersedable = True
+        # 구간에 들어오기 전에 이미 도착한 입력이 있으면 바로 다시 처리
+        if any(self.mergeable(text) for text in self._pending):
+            self._supersede()
+        try:
+            yield
+        finally:
+            self._supersedable = False
+
+    def cancel_all(self):
+        """대기 중인 입력을 버리고 진행 중인 턴 취소 ('처음부터', 세션 종료)"""
+        self._pending.clear()
+        self._supersedable = False
+        self._superseded = False
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            self.cancelled += 1
+
+    def stats(self):
+        return {
+            "turns": self.turns,
+            "merged": self.merged,
+            "superseded": self.superseded,
+            "cancelled": self.cancelled,
+            "pending": len(self._pending),
+        }
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+키워드 사전 매칭 마이크로벤치마크
+
+기존 방식(분류마다 any(word in text ...) 선형 스캔)과 KeywordMatcher(Aho-Corasick 한 번 스캔)를
+사전 크기별로 비교합니다. 실제 lexicons/*.json에 합성 단어를 더해 수천 개 규모를 흉내냅니다.
+
+사용 예:
+    python keyword_benchmark.py
+    python keyword_benchmark.py --terms 1000 5000 20000 --messages 2000
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+from keyword_engine import KeywordMatcher, load_lexicons
+
+SYLLABLES = [chr(code) for code in range(ord("가"), ord("힣") + 1, 97)]
+
+SAMPLE_MESSAGES = [
+    "친구를 만나러 숲속으로 가고 싶어요",
+    "무서운 괴물이 나타나면 어떡해요",
+    "사과를 세 개 세어 보면서 숫자를 배우고 싶어요",
+    "강아지랑 같이 무지개 다리를 건너요",
+    "길을 잃은 토끼를 도와줘요",
+    "하늘을 날아서 구름 위로 떠나요",
+    "재미있는 이야기 더 해 주세요",
+]
+
+
+def synthetic_lexicons(base, extra_terms, categories=20, seed=7):
+    """실제 사전에 합성 단어(2-4음절)를 분류별로 나눠 추가"""
+    rng = random.Random(seed)
+    lexicons = {name: {category: list(terms) for category, terms in data.items()} for name, data in base.items()}
+    synthetic = lexicons.setdefault("synthetic", {})
+    for index in range(extra_terms):
+        term = "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+        synthetic.setdefault(f"category_{index % categories}", []).append(term)
+    return lexicons
+
+
+def linear_scan(lexicons, text):
+    """기존 방식: 사전/분류마다 단어를 하나씩 확인"""
+    text = text.lower()
+    hits = {}
+    for lexicon, categories in lexicons.items():
+        matched = [category for category, terms in categories.items() if any(term in text for term in terms)]
+        if matched:
+            hits[lexicon] = matched
+    return hits
+
+
+def time_per_message(scan, messages, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for message in messages:
+            scan(message)
+    return (time.perf_counter() - started) / (repeat * len(messages))
+
+
+def run(args):
+    base = load_lexicons(args.lexicon_dir)
+    rng = random.Random(args.seed)
+    messages = [rng.choice(SAMPLE_MESSAGES) for _ in range(args.messages)]
+
+    print(f"🔤 키워드 매칭 벤치마크: 메시지 {len(messages)}개 × {args.repeat}회")
+    print(f"{'단어 수':>8} {'컴파일':>10} {'선형 스캔':>12} {'오토마톤':>12} {'배속':>8}")
+    for extra_terms in args.terms:
+        lexicons = synthetic_lexicons(base, extra_terms, seed=args.seed)
+        started = time.perf_counter()
+        matcher = KeywordMatcher(lexicons)
+        build_seconds = time.perf_counter() - started
+
+        # 두 방식이 같은 결과를 내는지 먼저 확인
+        for message in SAMPLE_MESSAGES:
+            assert matcher.scan(message) == linear_scan(lexicons, message), message
+
+        linear = time_per_message(lambda text: linear_scan(lexicons, text), messages, args.repeat)
+        compiled = time_per_message(matcher.scan, messages, args.repeat)
+        print(f"{len(matcher):>8} {build_seconds * 1000:>8.1f}ms {linear * 1e6:>10.1f}µs "
+              f"{compiled * 1e6:>10.1f}µs {linear / compiled:>7.1f}x")
+    return 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="키워드 사전 매칭 마이크로벤치마크")
+    parser.add_argument("--terms", type=int, nargs="+", default=[0, 1000, 5000, 20000],
+                        help="추가할 합성 단어 수 (여러 개 지정 가능)")
+    parser.add_argument("--messages", type=int, default=1000, help="메시지 수")
+    parser.add_argument("--repeat", type=int, default=3, help="반복 횟수")
+    parser.add_argument("--seed", type=int, default=7, help="난수 시드")
+    parser.add_argument("--lexicon-dir", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "lexicons"),
+                        help="기본 사전 폴더")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    sys.exit(run(parse_args()))
@@ -0,0 +1,108 @@
+import glob
+import json
+import os
+from collections import deque
+
+
+def load_lexicons(directory):
+    """lexicons/*.json 읽기 (파일 이름이 사전 이름, {분류: [단어, ...]} 순서가 우선순위)"""
+    lexicons = {}
+    for path in sorted(glob.glob(os.path.join(directory, "*.json"))):
+        name = os.path.splitext(os.path.basename(path))[0]
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        if not isinstance(data, dict) or not all(isinstance(terms, list) for terms in data.values()):
+            raise ValueError(f"사전 형식 오류 ({path}): {{분류: [단어, ...]}} 형태여야 합니다")
+        lexicons[name] = data
+    return lexicons
+
+
+class KeywordMatcher:
+    """여러 사전의 단어를 한 번에 찾는 Aho-Corasick 오토마톤 (한 번 만들어 모든 세션이 공유)
+
+    입력 길이에 비례하는 한 번의 스캔으로 모든 사전/분류의 일치를 찾으므로 단어 수가 늘어도 느려지지 않는다.
+    """
+
+    def __init__(self, lexicons):
+        # 상태별 전이 / 실패 링크 / 이 상태에서 끝나는 단어 번호
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [()]
+        # 단어 번호 -> (사전, 분류, 단어)
+        self._patterns = []
+        # 사전별 분류 우선순위 (파일에 적힌 순서)
+        self._ranks = {}
+        for lexicon, categories in lexicons.items():
+            self._ranks[lexicon] = {category: rank for rank, category in enumerate(categories)}
+            for category, terms in categories.items():
+                for term in terms:
+                    term = term.strip().lower()
+                    if term:
+                        self._add(term, (lexicon, category, term))
+        self._build()
+
+    @classmethod
+    def from_directory(cls, directory):
+        return cls(load_lexicons(directory))
+
+    def _add(self, term, pattern):
+        state = 0
+        for ch in term:
+            next_state = self._goto[state].get(ch)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][ch] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(())
+            state = next_state
+        self._output[state] += (len(self._patterns),)
+        self._patterns.append(pattern)
+
+    def _build(self):
+        """실패 링크 계산 (너비 우선, 실패 상태의 출력도 미리 합쳐 둠)"""
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(ch, 0)
+                self._output[next_state] += self._output[self._fail[next_state]]
+
+    def __len__(self):
+        return len(self._patterns)
+
+    def find(self, text):
+        """모든 일치 위치 [(시작, 끝, 사전, 분류, 단어)] (겹치는 일치 포함)"""
+        goto, fail, output, patterns = self._goto, self._fail, self._output, self._patterns
+        matches = []
+        state = 0
+        for index, ch in enumerate((text or "").lower()):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for pattern_id in output[state]:
+                lexicon, category, term = patterns[pattern_id]
+                matches.append((index - len(term) + 1, index + 1, lexicon, category, term))
+        return matches
+
+    def scan(self, text):
+        """한 번의 스캔으로 사전별 일치한 분류 {사전: [분류, ...]} (우선순위 순)"""
+        hits = {}
+        for _, _, lexicon, category, _ in self.find(text):
+            hits.setdefault(lexicon, set()).add(category)
+        return {
+            lexicon: sorted(categories, key=self._ranks[lexicon].get)
+            for lexicon, categories in hits.items()
+        }
+
+    def first(self, text, lexicon):
+        """사전에서 일치한 분류 중 우선순위가 가장 높은 것 (없으면 None)"""
+        categories = self.scan(text).get(lexicon)
+        return categories[0] if categories else None
+
+    def stats(self):
+        return {"lexicons": len(self._ranks), "terms": len(self._patterns), "states": len(self._goto)}
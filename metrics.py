@@ -0,0 +1,250 @@
+import contextlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 지연 시간 히스토그램 구간 (초) - 프롬프트 구성(ms)부터 이미지 생성(수십 초)까지
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 15, 30, 60)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    """증가만 하는 카운터"""
+
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def render(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_number(value)}"
+            for key, value in items
+        ]
+
+
+class Gauge(Counter):
+    """현재 값 (진행 중인 요청 수 등)"""
+
+    kind = "gauge"
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    """구간별 누적 개수 + 합계로 지연 시간 분포 기록"""
+
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state["counts"][index] += 1
+                    break
+            state["sum"] += value
+            state["count"] += 1
+
+    def count(self, **labels):
+        state = self._values.get(self._key(labels))
+        return state["count"] if state else 0
+
+    def render(self):
+        with self._lock:
+            items = sorted((key, dict(state, counts=list(state["counts"])))
+                           for key, state in self._values.items())
+        lines = self.header()
+        for key, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, state["counts"]):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, f'le="{_format_number(float(bound))}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{labels} {state['count']}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_number(state['sum'])}")
+            lines.append(f"{self.name}_count{labels} {state['count']}")
+        return lines
+
+
+class MetricsRegistry:
+    """프로세스 안의 메트릭 모음 (Prometheus 텍스트 형식으로 출력)"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+        self.json_logs = False
+
+    def _register(self, cls, name, *args, **kwargs):
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = cls(name, *args, **kwargs)
+            return self._metrics[name]
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._register(Counter, name, help_text, labelnames)
+
+    def gauge(self, name, help_text, labelnames=()):
+        return self._register(Gauge, name, help_text, labelnames)
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram, name, help_text, labelnames, buckets)
+
+    def render(self):
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+# 스토리 단계(stage)별 세부 작업(step) 지연 시간 / 결과 / 진행 중 개수
+STEP_SECONDS = registry.histogram(
+    "storybook_step_seconds", "Duration of each step of a story stage", ("stage", "step")
+)
+STEP_TOTAL = registry.counter(
+    "storybook_step_total", "Step results by outcome (success, fallback, error, hit, miss)",
+    ("stage", "step", "outcome")
+)
+STEP_IN_FLIGHT = registry.gauge(
+    "storybook_step_in_flight", "Steps currently running", ("stage", "step")
+)
+# 모델별 호출 지연 시간 / 진행 중 요청 수
+MODEL_CALL_SECONDS = registry.histogram(
+    "storybook_model_call_seconds", "Duration of a single model call", ("model", "mode", "outcome")
+)
+MODEL_IN_FLIGHT = registry.gauge(
+    "storybook_model_in_flight", "Model calls currently running", ("model",)
+)
+# 진행 중인 같은 요청에 합류해서 아낀 모델 호출 수
+MODEL_COALESCED = registry.counter(
+    "storybook_model_coalesced_total", "Model calls saved by joining an identical in-flight call",
+    ("model", "mode")
+)
+
+
+def log_event(event, **fields):
+    """구조화 로그 한 줄 출력 (JSON 로그를 켠 경우만)"""
+    if not registry.json_logs:
+        return
+    record = {"ts": round(time.time(), 3), "event": event, **fields}
+    print(json.dumps(record, ensure_ascii=False, default=str), flush=True)
+
+
+def record(stage, step, outcome, **fields):
+    """결과 카운터만 올림 (캐시 적중, 대체 경로 사용 등)"""
+    STEP_TOTAL.inc(stage=stage, step=step, outcome=outcome)
+    log_event("step", stage=stage, step=step, outcome=outcome, **fields)
+
+
+def observe(stage, step, seconds, **fields):
+    """이미 잰 지연 시간 기록 (첫 토큰 시간 등)"""
+    STEP_SECONDS.observe(seconds, stage=stage, step=step)
+    log_event("step", stage=stage, step=step, seconds=round(seconds, 4), **fields)
+
+
+@contextlib.contextmanager
+def track(stage, step, **fields):
+    """블록 실행 시간/결과/진행 중 개수 기록 (span["outcome"]으로 결과를 바꿀 수 있음)"""
+    span = {"outcome": "success"}
+    STEP_IN_FLIGHT.inc(stage=stage, step=step)
+    started = time.perf_counter()
+    try:
+        yield span
+    except BaseException:
+        span["outcome"] = "error"
+        raise
+    finally:
+        seconds = time.perf_counter() - started
+        STEP_IN_FLIGHT.dec(stage=stage, step=step)
+        STEP_SECONDS.observe(seconds, stage=stage, step=step)
+        STEP_TOTAL.inc(stage=stage, step=step, outcome=span["outcome"])
+        log_event("step", stage=stage, step=step, outcome=span["outcome"],
+                  seconds=round(seconds, 4), **fields)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # 수집기 요청마다 콘솔에 찍히지 않도록
+        pass
+
+
+_server = None
+
+
+def start_metrics_server(port, host="0.0.0.0"):
+    """/metrics 엔드포인트를 백그라운드 스레드에서 실행 (프로세스당 한 번)"""
+    global _server
+    if _server is None:
+        _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+        _server.daemon_threads = True
+        threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True).start()
+        print(f"📈 메트릭 엔드포인트: http://{host}:{_server.server_address[1]}/metrics")
+    return _server
@@ -0,0 +1,400 @@
+import base64
+import datetime
+import hashlib
+import json
+import os
+import random
+import struct
+import threading
+import time
+import zlib
+
+
+class ReplayMissError(Exception):
+    """녹화 파일에 없는 요청을 재생하려 할 때 발생"""
+
+
+class ModelBackend:
+    """모델 백엔드 인터페이스 (generate_content/count_tokens를 가진 모델 핸들을 만듦)"""
+
+    name = "base"
+
+    def create_model(self, model_name, **model_kwargs):
+        raise NotImplementedError
+
+    def create_cached_model(self, model_name, system_instruction, ttl_seconds):
+        """시스템 지시문을 캐시에 올리고 (모델 핸들, 만료 시각) 반환 (지원하지 않으면 NotImplementedError)"""
+        raise NotImplementedError
+
+
+class GeminiBackend(ModelBackend):
+    """google.generativeai를 사용하는 실제 Gemini 백엔드"""
+
+    name = "gemini"
+
+    def __init__(self, api_key=None, transport=None):
+        self.api_key = api_key
+        self.transport = transport
+        self._configured = False
+        self._lock = threading.Lock()
+
+    def configure(self):
+        """google.generativeai 설정 (처음 한 번만)"""
+        import google.generativeai as genai
+        with self._lock:
+            if not self._configured:
+                options = {"api_key": self.api_key}
+                if self.transport:
+                    options["transport"] = self.transport
+                genai.configure(**options)
+                self._configured = True
+        return genai
+
+    def create_model(self, model_name, **model_kwargs):
+        genai = self.configure()
+        return genai.GenerativeModel(model_name, **model_kwargs)
+
+    def create_cached_model(self, model_name, system_instruction, ttl_seconds):
+        genai = self.configure()
+        from google.generativeai import caching
+        cache = caching.CachedContent.create(
+            model=model_name,
+            display_name="storybook-system-instruction",
+            system_instruction=system_instruction,
+            ttl=datetime.timedelta(seconds=ttl_seconds),
+        )
+        return genai.GenerativeModel.from_cached_content(cache), cache.expire_time.timestamp()
+
+
+# ---------------------------------------------------------------------------
+# 스텁/재생 백엔드가 돌려주는 Gemini 응답 모양의 객체
+# ---------------------------------------------------------------------------
+
+class _Blob:
+    def __init__(self, data, mime_type):
+        self.data = data
+        self.mime_type = mime_type
+
+
+class _Part:
+    def __init__(self, text=None, inline_data=None):
+        self.text = text
+        self.inline_data = inline_data
+
+
+class _Content:
+    def __init__(self, parts):
+        self.parts = parts
+
+
+class _Candidate:
+    def __init__(self, parts):
+        self.content = _Content(parts)
+
+
+class _UsageMetadata:
+    def __init__(self, prompt_token_count, candidates_token_count):
+        self.prompt_token_count = prompt_token_count
+        self.candidates_token_count = candidates_token_count
+        self.total_token_count = prompt_token_count + candidates_token_count
+
+
+class BackendResponse:
+    """Gemini GenerateContentResponse와 같은 방식으로 읽을 수 있는 응답"""
+
+    def __init__(self, text="", image_bytes=None, prompt_tokens=0):
+        parts = []
+        if text:
+            parts.append(_Part(text=text))
+        if image_bytes:
+            parts.append(_Part(inline_data=_Blob(image_bytes, "image/png")))
+        self.candidates = [_Candidate(parts)]
+        self._text = text
+        self.usage_metadata = _UsageMetadata(prompt_tokens, estimate_tokens(text))
+
+    @property
+    def text(self):
+        if not self._text:
+            raise ValueError("응답에 텍스트가 없습니다")
+        return self._text
+
+
+class _TokenCount:
+    def __init__(self, total_tokens):
+        self.total_tokens = total_tokens
+
+
+def estimate_tokens(text):
+    """대략적인 토큰 수 (한글 1.5자/영문 4자 ≈ 1토큰)"""
+    if not text:
+        return 0
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    return int(ascii_chars / 4 + (len(text) - ascii_chars) / 1.5) + 1
+
+
+def prompt_to_text(contents):
+    """generate_content 입력을 문자열로 변환 (녹화 키/토큰 추정용)"""
+    if isinstance(contents, str):
+        return contents
+    return json.dumps(contents, ensure_ascii=False, sort_keys=True, default=str)
+
+
+def make_png(width, height, seed=0):
+    """Pillow 없이 단색 PNG 생성 (스텁 이미지용)"""
+    rng = random.Random(seed)
+    pixel = bytes(rng.randrange(256) for _ in range(3))
+    raw = b"".join(b"\x00" + pixel * width for _ in range(height))
+
+    def chunk(kind, data):
+        body = kind + data
+        return struct.pack(">I", len(data)) + body + struct.pack(">I", zlib.crc32(body) & 0xffffffff)
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header)
+            + chunk(b"IDAT", zlib.compress(raw)) + chunk(b"IEND", b""))
+
+
+STUB_SENTENCES = [
+    "{name}는 반짝이는 숲길을 걸어갔어요.",
+    "길가에 빨간 꽃이 세 송이 피어 있었어요.",
+    "{name}는 꽃을 하나, 둘, 셋 세어 보았어요.",
+    "그때 작은 새가 노래를 불렀어요.",
+    "\"안녕! 같이 놀자!\" 새가 말했어요.",
+    "{name}는 활짝 웃으며 손을 흔들었어요.",
+    "둘은 함께 무지개 다리를 건넜어요.",
+    "다음에는 어떤 일이 생길까요?",
+]
+
+
+class StubModel:
+    """네트워크 없이 정해진 지연 시간과 크기의 응답을 돌려주는 모델 (부하 테스트용)"""
+
+    def __init__(self, model_name, latency=0.5, jitter=0.0, text_chars=200, image_size=256):
+        self.model_name = model_name
+        self.latency = latency
+        self.jitter = jitter
+        self.text_chars = text_chars
+        self.image_size = image_size
+        self.is_image_model = "image" in model_name
+
+    def _seed(self, prompt):
+        return int(hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:8], 16)
+
+    def _delay(self, seed):
+        jitter = random.Random(seed).uniform(-self.jitter, self.jitter) if self.jitter else 0
+        return max(0.0, self.latency + jitter)
+
+    def _text(self, seed):
+        rng = random.Random(seed)
+        sentences = []
+        while sum(len(sentence) for sentence in sentences) < self.text_chars:
+            sentences.append(rng.choice(STUB_SENTENCES).format(name="멍멍이"))
+        return " ".join(sentences)
+
+    def _from_schema(self, schema, rng, name=""):
+        """JSON 스키마 모양의 가짜 값 생성 (구조화 출력 요청용)"""
+        kind = str(schema.get("type", "STRING")).upper()
+        if kind == "OBJECT":
+            return {key: self._from_schema(prop, rng, key) for key, prop in schema.get("properties", {}).items()}
+        if kind == "ARRAY":
+            return [self._from_schema(schema.get("items", {}), rng, name) for _ in range(3)]
+        if schema.get("enum"):
+            return rng.choice(schema["enum"])
+        if kind in ("INTEGER", "NUMBER"):
+            return rng.randrange(1, 10)
+        if kind == "BOOLEAN":
+            return rng.random() < 0.5
+        if name in ("text", "story", "chapter"):
+            return self._text(rng.randrange(1 << 30))
+        return rng.choice(STUB_SENTENCES).format(name="멍멍이")
+
+    def generate_content(self, contents, stream=False, **kwargs):
+        prompt = prompt_to_text(contents)
+        seed = self._seed(prompt)
+        prompt_tokens = estimate_tokens(prompt)
+        if self.is_image_model:
+            time.sleep(self._delay(seed))
+            return BackendResponse(image_bytes=make_png(self.image_size, self.image_size, seed),
+                                   prompt_tokens=prompt_tokens)
+
+        config = kwargs.get("generation_config") or {}
+        schema = config.get("response_schema") if isinstance(config, dict) else getattr(config, "response_schema", None)
+        if schema:
+            text = json.dumps(self._from_schema(schema, random.Random(seed)), ensure_ascii=False)
+        else:
+            text = self._text(seed)
+        if not stream:
+            time.sleep(self._delay(seed))
+            return BackendResponse(text, prompt_tokens=prompt_tokens)
+        return self._stream(text, self._delay(seed), prompt_tokens)
+
+    def _stream(self, text, delay, prompt_tokens):
+        # 전체 지연 시간의 절반은 첫 토큰까지, 나머지는 청크 사이에 나눠서
+        pieces = [text[i:i + 20] for i in range(0, len(text), 20)]
+        time.sleep(delay / 2)
+        for piece in pieces:
+            yield BackendResponse(piece, prompt_tokens=prompt_tokens)
+            time.sleep(delay / 2 / len(pieces))
+
+    def count_tokens(self, contents, **kwargs):
+        return _TokenCount(estimate_tokens(prompt_to_text(contents)))
+
+
+class StubBackend(ModelBackend):
+    """로컬 스텁 백엔드 (지연 시간/응답 크기 설정 가능)"""
+
+    name = "stub"
+
+    def __init__(self, latency=0.5, jitter=0.0, text_chars=200, image_size=256, image_latency=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.text_chars = text_chars
+        self.image_size = image_size
+        self.image_latency = latency if image_latency is None else image_latency
+
+    def create_model(self, model_name, **model_kwargs):
+        latency = self.image_latency if "image" in model_name else self.latency
+        return StubModel(model_name, latency, self.jitter, self.text_chars, self.image_size)
+
+
+class RecordReplayModel:
+    """실제 응답을 JSONL로 녹화하거나, 녹화된 응답을 네트워크 없이 재생하는 모델"""
+
+    def __init__(self, model_name, backend, model_kwargs=None):
+        self.model_name = model_name
+        self.backend = backend
+        self.model_kwargs = model_kwargs or {}
+        self._inner = None
+
+    def _key(self, contents, kwargs):
+        options = json.dumps({k: v for k, v in kwargs.items() if k != "stream"},
+                             sort_keys=True, default=str)
+        # system_instruction 등 모델 설정이 다르면 다른 응답으로 취급
+        model_options = json.dumps(self.model_kwargs, sort_keys=True, default=str)
+        payload = f"{self.model_name}\x1f{model_options}\x1f{prompt_to_text(contents)}\x1f{options}"
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _inner_model(self):
+        if self._inner is None:
+            self._inner = self.backend.inner.create_model(self.model_name, **self.model_kwargs)
+        return self._inner
+
+    def generate_content(self, contents, stream=False, **kwargs):
+        key = self._key(contents, kwargs)
+        prompt_tokens = estimate_tokens(prompt_to_text(contents))
+
+        if self.backend.mode == "replay":
+            record = self.backend.lookup(key)
+            if record is None:
+                raise ReplayMissError(f"녹화된 응답 없음: {self.model_name} {key[:12]}")
+            text = record.get("text", "")
+            image_bytes = base64.b64decode(record["image"]) if record.get("image") else None
+            if stream:
+                return iter([BackendResponse(text[i:i + 20], prompt_tokens=prompt_tokens)
+                             for i in range(0, len(text), 20)])
+            return BackendResponse(text, image_bytes, prompt_tokens)
+
+        # 녹화 모드: 실제 백엔드 호출 후 결과 저장
+        if stream:
+            return self._record_stream(key, contents, kwargs)
+        response = self._inner_model().generate_content(contents, **kwargs)
+        self.backend.record(key, self.model_name, *extract_payload(response))
+        return response
+
+    def _record_stream(self, key, contents, kwargs):
+        pieces = []
+        for chunk in self._inner_model().generate_content(contents, stream=True, **kwargs):
+            try:
+                pieces.append(chunk.text)
+            except ValueError:
+                pass
+            yield chunk
+        self.backend.record(key, self.model_name, "".join(pieces), None)
+
+    def count_tokens(self, contents, **kwargs):
+        return _TokenCount(estimate_tokens(prompt_to_text(contents)))
+
+
+def extract_payload(response):
+    """응답에서 (텍스트, 이미지 바이트) 추출"""
+    text = ""
+    image_bytes = None
+    for candidate in getattr(response, "candidates", None) or []:
+        for part in getattr(candidate.content, "parts", None) or []:
+            if getattr(part, "text", None):
+                text += part.text
+            inline_data = getattr(part, "inline_data", None)
+            if inline_data is not None and getattr(inline_data, "data", None):
+                image_bytes = inline_data.data
+                if isinstance(image_bytes, str):
+                    image_bytes = base64.b64decode(image_bytes)
+        break
+    return text, image_bytes
+
+
+class RecordReplayBackend(ModelBackend):
+    """녹화/재생 백엔드 (mode='record'는 inner 백엔드 호출 결과를 저장, 'replay'는 저장본만 사용)"""
+
+    name = "replay"
+
+    def __init__(self, path, mode="replay", inner=None):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"지원하지 않는 모드: {mode}")
+        if mode == "record" and inner is None:
+            raise ValueError("녹화 모드에는 실제 호출에 쓸 백엔드가 필요합니다")
+        self.path = path
+        self.mode = mode
+        self.inner = inner
+        self._records = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    self._records[record["key"]] = record
+
+    def lookup(self, key):
+        return self._records.get(key)
+
+    def record(self, key, model_name, text, image_bytes):
+        record = {
+            "key": key,
+            "model": model_name,
+            "text": text,
+            "image": base64.b64encode(image_bytes).decode() if image_bytes else None,
+        }
+        with self._lock:
+            self._records[key] = record
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def create_model(self, model_name, **model_kwargs):
+        return RecordReplayModel(model_name, self, model_kwargs)
+
+
+def create_backend_from_env(api_key=None):
+    """STORY_MODEL_BACKEND 환경변수로 백엔드 선택 (gemini, stub, record, replay)"""
+    kind = os.getenv("STORY_MODEL_BACKEND", "gemini")
+    if kind == "stub":
+        return StubBackend(
+            latency=float(os.getenv("STUB_LATENCY_MS", "500")) / 1000,
+            jitter=float(os.getenv("STUB_LATENCY_JITTER_MS", "0")) / 1000,
+            text_chars=int(os.getenv("STUB_TEXT_CHARS", "200")),
+            image_size=int(os.getenv("STUB_IMAGE_SIZE", "256")),
+            image_latency=float(os.getenv("STUB_IMAGE_LATENCY_MS", os.getenv("STUB_LATENCY_MS", "500"))) / 1000,
+        )
+    gemini = GeminiBackend(api_key=api_key, transport=os.getenv("GEMINI_TRANSPORT") or None)
+    if kind in ("record", "replay"):
+        path = os.getenv("MODEL_RECORDING_PATH", ".cache/model_recordings.jsonl")
+        return RecordReplayBackend(path, mode=kind, inner=gemini if kind == "record" else None)
+    if kind != "gemini":
+        raise ValueError(f"지원하지 않는 모델 백엔드: {kind}")
+    return gemini
@@ -0,0 +1,257 @@
+import asyncio
+import functools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import MODEL_CALL_SECONDS, MODEL_IN_FLIGHT
+from model_coalescing import SingleFlight, request_key
+from model_scheduler import (
+    ModelLane, SchedulerOverloaded, PRIORITY_STORY, PRIORITY_QUESTION, PRIORITY_FALLBACK
+)
+from model_resilience import (
+    CircuitBreaker, CircuitOpenError, LatencyTracker, backoff_delay, is_transient_error
+)
+
+# 헤지 요청은 아이가 기다리는 호출에만 (추측 생성/요약 같은 백그라운드 호출은 중복 요청하지 않음)
+HEDGED_PRIORITIES = (PRIORITY_STORY, PRIORITY_QUESTION, PRIORITY_FALLBACK)
+
+
+class AsyncModelClient:
+    """동기 Gemini 모델 호출을 전용 스레드 풀에서 실행하는 비동기 래퍼"""
+
+    def __init__(self, model, max_concurrency=4, name=None, rate_per_minute=0, burst=None,
+                 max_retries=2, retry_base_delay=0.5, hedging=False,
+                 failure_threshold=5, reset_timeout=30.0, coalesce=True):
+        self.model = model
+        self.name = name or getattr(model, "model_name", "model")
+        self.max_concurrency = max_concurrency
+        # 모델별 동시 호출 제한 + 분당 요청 제한 + 우선순위 대기열 (이벤트 루프는 막지 않고 대기)
+        self.lane = ModelLane(self.name, max_concurrency, rate_per_minute, burst)
+        # 헤지 요청에서 진 호출이 스레드를 잠시 더 쓰므로 여유분 확보
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_concurrency * 2,
+            thread_name_prefix=f"model-{self.name}"
+        )
+        self.in_flight = 0
+        # 재시도 / 헤지 요청 / 회로 차단기
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.hedging = hedging
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.latency = LatencyTracker()
+        self.retries = 0
+        self.hedges_sent = 0
+        self.hedges_won = 0
+        # 같은 프롬프트로 동시에 들어온 호출은 하나만 보내고 결과 공유
+        # (합류한 호출은 먼저 시작한 호출의 우선순위/대기 시간을 따름)
+        self.coalesce = coalesce
+        self.single_flight = SingleFlight(self.name)
+
+    async def generate_content(self, *args, priority=PRIORITY_STORY, max_wait=None, **kwargs):
+        """generate_content를 스레드 풀에서 실행하고 결과를 기다림 (우선순위 순서로 호출)"""
+        if not self.coalesce:
+            return await self._generate(args, kwargs, priority, max_wait)
+        return await self.single_flight.call(
+            request_key(args, kwargs), lambda: self._generate(args, kwargs, priority, max_wait)
+        )
+
+    async def _generate(self, args, kwargs, priority, max_wait):
+        """재시도/회로 차단기를 거쳐 모델 호출"""
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"{self.name} 회로 차단기 열림")
+
+        attempt = 0
+        while True:
+            try:
+                result = await self._hedged_call(args, kwargs, priority, max_wait)
+            except (SchedulerOverloaded, asyncio.CancelledError):
+                # 판정 없이 끝난 시험 호출은 다음 호출이 이어서 시험
+                self.breaker.release_probe()
+                raise
+            except Exception as e:
+                if not is_transient_error(e):
+                    self.breaker.release_probe()
+                    raise
+                self.breaker.record_failure()
+                if attempt >= self.max_retries or not self.breaker.allow():
+                    raise
+                delay = backoff_delay(attempt, self.retry_base_delay)
+                print(f"🔁 {self.name} 재시도 {attempt + 1}/{self.max_retries} ({delay:.2f}초 후): {str(e)}")
+                self.retries += 1
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+
+            self.breaker.record_success()
+            return result
+
+    async def _call_once(self, args, kwargs, priority, max_wait):
+        """호출 차례를 얻어 모델을 한 번 호출"""
+        async with self.lane.slot(priority, max_wait):
+            self.in_flight += 1
+            MODEL_IN_FLIGHT.inc(model=self.name)
+            started = time.perf_counter()
+            outcome = "error"
+            try:
+                loop = asyncio.get_running_loop()
+                call = functools.partial(self.model.generate_content, *args, **kwargs)
+                result = await loop.run_in_executor(self._executor, call)
+                outcome = "success"
+            finally:
+                self.in_flight -= 1
+                MODEL_IN_FLIGHT.dec(model=self.name)
+                MODEL_CALL_SECONDS.observe(time.perf_counter() - started,
+                                           model=self.name, mode="unary", outcome=outcome)
+            self.latency.record(time.perf_counter() - started)
+            return result
+
+    async def _hedged_call(self, args, kwargs, priority, max_wait):
+        """p95 지연 시간을 넘기면 같은 요청을 한 번 더 보내 먼저 끝난 결과 사용"""
+        hedged = self.hedging and priority in HEDGED_PRIORITIES
+        p95 = self.latency.percentile(0.95) if hedged else None
+        if p95 is None:
+            return await self._call_once(args, kwargs, priority, max_wait)
+
+        primary = asyncio.create_task(self._call_once(args, kwargs, priority, max_wait))
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=p95)
+            if done:
+                return primary.result()
+
+            # 빈 자리가 있을 때만 헤지 요청 (대기열을 늘리지 않음)
+            if self.lane.active >= self.max_concurrency or self.lane.queued:
+                return await primary
+            self.hedges_sent += 1
+            hedge = asyncio.create_task(self._call_once(args, kwargs, priority, 0))
+            pending = {primary, hedge}
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self.hedges_won += 1
+                        for other in pending:
+                            other.cancel()
+                        return task.result()
+                    if task is primary or error is None:
+                        error = task.exception()
+            raise error
+        finally:
+            if not primary.done():
+                primary.cancel()
+
+    async def stream_content(self, *args, priority=PRIORITY_STORY, max_wait=None, **kwargs):
+        """stream=True 호출의 청크 텍스트를 도착하는 대로 전달하는 비동기 제너레이터"""
+        if self.coalesce:
+            stream = self.single_flight.stream(
+                request_key(args, kwargs), lambda: self._stream(args, kwargs, priority, max_wait)
+            )
+        else:
+            stream = self._stream(args, kwargs, priority, max_wait)
+        async for text in stream:
+            yield text
+
+    async def _stream(self, args, kwargs, priority, max_wait):
+        """재시도/회로 차단기를 거쳐 스트리밍 호출"""
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"{self.name} 회로 차단기 열림")
+
+        attempt = 0
+        while True:
+            received = False
+            try:
+                async for text in self._stream_once(args, kwargs, priority, max_wait):
+                    received = True
+                    yield text
+            except (SchedulerOverloaded, asyncio.CancelledError, GeneratorExit):
+                # 판정 없이 끝난 시험 호출은 다음 호출이 이어서 시험 (받는 쪽이 스트림을 중간에 닫은 경우 포함)
+                self.breaker.release_probe()
+                raise
+            except Exception as e:
+                if not is_transient_error(e):
+                    self.breaker.release_probe()
+                    raise
+                self.breaker.record_failure()
+                # 이미 아이에게 보여준 내용이 있으면 재시도하지 않음
+                if received or attempt >= self.max_retries or not self.breaker.allow():
+                    raise
+                delay = backoff_delay(attempt, self.retry_base_delay)
+                print(f"🔁 {self.name} 스트리밍 재시도 {attempt + 1}/{self.max_retries} ({delay:.2f}초 후): {str(e)}")
+                self.retries += 1
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+
+            self.breaker.record_success()
+            return
+
+    async def _stream_once(self, args, kwargs, priority, max_wait):
+        async with self.lane.slot(priority, max_wait):
+            self.in_flight += 1
+            MODEL_IN_FLIGHT.inc(model=self.name)
+            started = time.perf_counter()
+            outcome = "error"
+            loop = asyncio.get_running_loop()
+            queue = asyncio.Queue()
+            finished = object()
+            stop_event = threading.Event()
+
+            def produce():
+                # 워커 스레드에서 스트림을 읽어 이벤트 루프 큐로 전달
+                try:
+                    for chunk in self.model.generate_content(*args, stream=True, **kwargs):
+                        if stop_event.is_set():
+                            break
+                        try:
+                            text = chunk.text
+                        except ValueError:
+                            # 안전 필터 등으로 텍스트가 없는 청크
+                            continue
+                        loop.call_soon_threadsafe(queue.put_nowait, text)
+                except Exception as e:
+                    loop.call_soon_threadsafe(queue.put_nowait, e)
+                finally:
+                    loop.call_soon_threadsafe(queue.put_nowait, finished)
+
+            loop.run_in_executor(self._executor, produce)
+            try:
+                while True:
+                    item = await queue.get()
+                    if item is finished:
+                        outcome = "success"
+                        break
+                    if isinstance(item, Exception):
+                        raise item
+                    yield item
+            finally:
+                # 소비자가 중간에 멈추면 워커 스레드도 스트림 읽기를 중단
+                stop_event.set()
+                self.in_flight -= 1
+                MODEL_IN_FLIGHT.dec(model=self.name)
+                MODEL_CALL_SECONDS.observe(time.perf_counter() - started,
+                                           model=self.name, mode="stream", outcome=outcome)
+
+    async def count_tokens(self, *args, **kwargs):
+        """토큰 수 계산 (생성 없이 연결만 확인하는 가벼운 호출, 스케줄러를 거치지 않음)"""
+        loop = asyncio.get_running_loop()
+        call = functools.partial(self.model.count_tokens, *args, **kwargs)
+        return await loop.run_in_executor(self._executor, call)
+
+    def stats(self):
+        """호출 현황 (스케줄러/재시도/헤지/회로 차단기)"""
+        return {
+            **self.lane.stats(),
+            "in_flight": self.in_flight,
+            "retries": self.retries,
+            "hedges_sent": self.hedges_sent,
+            "hedges_won": self.hedges_won,
+            "coalesced_calls": self.single_flight.coalesced,
+            "circuit": self.breaker.state,
+            "p95_seconds": self.latency.percentile(0.95),
+        }
+
+    def shutdown(self):
+        """스레드 풀 종료"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,139 @@
+import asyncio
+import contextvars
+import hashlib
+import json
+
+from metrics import MODEL_COALESCED
+
+# 현재 태스크의 마지막 호출이 진행 중인 같은 호출에 합류했는지 (토큰 사용량은 처음 호출한 쪽만 기록)
+_joined = contextvars.ContextVar("model_coalescing_joined", default=False)
+
+
+def joined_flight():
+    """현재 태스크의 마지막 모델 호출이 다른 호출의 결과를 함께 받은 것인지"""
+    return _joined.get()
+
+
+def _normalize(value):
+    """요청 키용 정규화 (문자열 공백 정리, dict는 키 순서 무관)"""
+    if isinstance(value, str):
+        return " ".join(value.split())
+    if isinstance(value, dict):
+        return {str(k): _normalize(v) for k, v in sorted(value.items(), key=lambda item: str(item[0]))}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    if value is None or isinstance(value, (int, float, bool)):
+        return value
+    # 설정 객체 등은 repr로 구분 (주소가 들어가면 합쳐지지 않을 뿐 잘못 합쳐지지는 않음)
+    return repr(value)
+
+
+def request_key(args, kwargs):
+    """모델 호출 인자로 만든 정규화된 요청 키"""
+    payload = json.dumps([_normalize(list(args)), _normalize(kwargs)], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class _Flight:
+    """진행 중인 호출 하나 (기다리는 쪽이 모두 떠나면 호출도 취소)"""
+
+    def __init__(self):
+        self.task = None
+        self.waiters = 0
+        # 스트리밍 호출: 지금까지 받은 청크 (늦게 합류한 쪽은 처음부터 다시 받음)
+        self.chunks = []
+        self.changed = asyncio.Event()
+        self.done = False
+        self.error = None
+
+    def release(self):
+        self.waiters -= 1
+        if self.waiters == 0 and not self.task.done():
+            self.task.cancel()
+
+
+class SingleFlight:
+    """같은 요청 키로 동시에 들어온 모델 호출을 하나로 합쳐 결과를 공유"""
+
+    def __init__(self, name="model"):
+        self.name = name
+        self._flights = {}
+        self._streams = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    def _start(self, flights, key, make_coroutine):
+        flight = _Flight()
+        flight.task = asyncio.ensure_future(make_coroutine(flight))
+        flights[key] = flight
+        self.calls += 1
+
+        def forget(_):
+            if flights.get(key) is flight:
+                del flights[key]
+        flight.task.add_done_callback(forget)
+        return flight
+
+    def _join(self, mode):
+        self.coalesced += 1
+        MODEL_COALESCED.inc(model=self.name, mode=mode)
+
+    async def call(self, key, call):
+        """진행 중인 같은 호출이 있으면 그 결과를 함께 기다리고, 없으면 call()로 새로 시작"""
+        flight = self._flights.get(key)
+        _joined.set(flight is not None)
+        if flight is None:
+            flight = self._start(self._flights, key, lambda _: call())
+        else:
+            self._join("unary")
+        flight.waiters += 1
+        try:
+            # 한 쪽이 취소돼도 다른 쪽이 기다리는 호출은 계속 진행
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.release()
+
+    async def stream(self, key, open_stream):
+        """스트리밍 호출 공유 (늦게 합류하면 받은 청크를 먼저 전달하고 이어서 실시간 전달)"""
+        flight = self._streams.get(key)
+        _joined.set(flight is not None)
+        if flight is None:
+            flight = self._start(self._streams, key, lambda new: self._produce(new, open_stream))
+        else:
+            self._join("stream")
+        flight.waiters += 1
+        try:
+            index = 0
+            while True:
+                if index < len(flight.chunks):
+                    index += 1
+                    yield flight.chunks[index - 1]
+                elif flight.done:
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+                else:
+                    await flight.changed.wait()
+        finally:
+            flight.release()
+
+    async def _produce(self, flight, open_stream):
+        try:
+            async for chunk in open_stream():
+                flight.chunks.append(chunk)
+                self._notify(flight)
+        except asyncio.CancelledError:
+            flight.error = asyncio.CancelledError()
+            raise
+        except Exception as e:
+            flight.error = e
+        finally:
+            flight.done = True
+            self._notify(flight)
+
+    def _notify(self, flight):
+        changed, flight.changed = flight.changed, asyncio.Event()
+        changed.set()
+
+    def stats(self):
+        return {"calls": self.calls, "coalesced": self.coalesced}
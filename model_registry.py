@@ -0,0 +1,73 @@
+import asyncio
+import time
+
+from model_backends import GeminiBackend
+from context_cache import CachedInstructionModel, MIN_CACHE_TOKENS
+from model_client import AsyncModelClient
+
+
+class ModelRegistry:
+    """모델 핸들과 비동기 클라이언트를 프로세스당 한 번만 만들어 재사용하는 저장소"""
+
+    def __init__(self, backend=None, context_cache_ttl=3600, use_context_cache=True,
+                 context_cache_min_tokens=MIN_CACHE_TOKENS):
+        # 백엔드 교체로 실제 Gemini / 로컬 스텁 / 녹화 재생을 선택
+        self.backend = backend or GeminiBackend()
+        self.context_cache_ttl = context_cache_ttl
+        self.use_context_cache = use_context_cache
+        self.context_cache_min_tokens = context_cache_min_tokens
+        self._models = {}
+        self._clients = {}
+        self._warm_up_task = None
+        self.warm_up_report = {}
+
+    def model(self, name, system_instruction=None, **model_kwargs):
+        """모델 핸들 반환 (같은 이름은 같은 핸들과 연결 재사용)
+
+        system_instruction을 주면 모든 세션이 공유하는 캐시된 지시문 핸들을 참조하는 모델을 만든다.
+        """
+        if name not in self._models:
+            if system_instruction:
+                self._models[name] = CachedInstructionModel(
+                    self.backend, name, system_instruction,
+                    ttl=self.context_cache_ttl, use_cache=self.use_context_cache,
+                    min_tokens=self.context_cache_min_tokens
+                )
+            else:
+                self._models[name] = self.backend.create_model(name, **model_kwargs)
+        return self._models[name]
+
+    def client(self, name, system_instruction=None, **client_kwargs):
+        """모델별 비동기 클라이언트 반환 (스레드 풀/스케줄러/회로 차단기 공유)"""
+        if name not in self._clients:
+            model = self.model(name, system_instruction=system_instruction)
+            self._clients[name] = AsyncModelClient(model, name=name, **client_kwargs)
+        return self._clients[name]
+
+    def clients(self):
+        return dict(self._clients)
+
+    def schedule_warm_up(self):
+        """첫 세션 시작 시 백그라운드에서 한 번만 워밍업 실행"""
+        if self._warm_up_task is None:
+            self._warm_up_task = asyncio.create_task(self.warm_up())
+        return self._warm_up_task
+
+    async def warm_up(self):
+        """모델별로 가벼운 요청(count_tokens)을 두 번 보내 콜드/웜 지연 시간 비교"""
+        for name, client in self._clients.items():
+            try:
+                started = time.perf_counter()
+                await client.count_tokens("안녕")
+                cold = time.perf_counter() - started
+
+                started = time.perf_counter()
+                await client.count_tokens("안녕")
+                warm = time.perf_counter() - started
+            except Exception as e:
+                print(f"모델 워밍업 오류 ({name}): {str(e)}")
+                continue
+
+            self.warm_up_report[name] = {"cold_seconds": cold, "warm_seconds": warm}
+            print(f"🔥 모델 워밍업 {name}: 콜드 {cold:.2f}초 → 웜 {warm:.2f}초")
+        return self.warm_up_report
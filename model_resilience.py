@@ -0,0 +1,108 @@
+import random
+import time
+from collections import deque
+
+try:
+    from google.api_core import exceptions as google_exceptions
+    TRANSIENT_EXCEPTIONS = (
+        google_exceptions.ResourceExhausted,
+        google_exceptions.ServiceUnavailable,
+        google_exceptions.DeadlineExceeded,
+        google_exceptions.InternalServerError,
+        google_exceptions.TooManyRequests,
+    )
+except ImportError:
+    TRANSIENT_EXCEPTIONS = ()
+
+# 일시적인 오류로 보는 HTTP 상태 코드
+TRANSIENT_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    """회로 차단기가 열려 있어 모델 호출을 건너뛸 때 발생"""
+
+
+def is_transient_error(error):
+    """재시도하면 성공할 수 있는 일시적인 오류인지 판단"""
+    if isinstance(error, TRANSIENT_EXCEPTIONS):
+        return True
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    code = getattr(error, "code", None)
+    return isinstance(code, int) and code in TRANSIENT_STATUS_CODES
+
+
+def backoff_delay(attempt, base_delay=0.5, max_delay=8.0):
+    """지터를 적용한 지수 백오프 대기 시간 (full jitter)"""
+    return random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+
+
+class CircuitBreaker:
+    """모델별 회로 차단기 (연속 실패 시 일정 시간 호출 차단 후 시험 호출로 복구)"""
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"  # closed, open, half_open
+        self.failures = 0
+        self.opened_at = 0.0
+        self.open_count = 0
+        # 반쯤 열린 상태에서 진행 중인 시험 호출 시작 시각 (없으면 None)
+        self.probe_started_at = None
+
+    @property
+    def is_open(self):
+        """현재 호출이 차단되는 상태인지 (복구 시간이 지났으면 시험 호출 허용)"""
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = "half_open"
+        return self.state == "open"
+
+    def allow(self):
+        """호출 허용 여부 (반쯤 열린 상태에서는 시험 호출 하나만 통과시키고 끝날 때까지 나머지는 차단)"""
+        if self.is_open:
+            return False
+        if self.state == "half_open":
+            # 판정 없이 사라진 시험 호출이 있어도 복구 시간이 지나면 다시 시험
+            now = time.monotonic()
+            if self.probe_started_at is not None and now - self.probe_started_at < self.reset_timeout:
+                return False
+            self.probe_started_at = now
+        return True
+
+    def release_probe(self):
+        """시험 호출이 성공/실패 판정 없이 끝났을 때 (취소, 요청 오류 등) 다음 호출이 시험하도록 함"""
+        self.probe_started_at = None
+
+    def record_success(self):
+        self.failures = 0
+        self.state = "closed"
+        self.probe_started_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        self.probe_started_at = None
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                self.open_count += 1
+                print(f"🔌 회로 차단기 열림 ({self.failures}회 연속 실패, {self.reset_timeout:.0f}초 동안 대체 경로 사용)")
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+
+class LatencyTracker:
+    """최근 호출 지연 시간으로 p95 계산 (헤지 요청 기준)"""
+
+    def __init__(self, window=200, min_samples=20):
+        self.samples = deque(maxlen=window)
+        self.min_samples = min_samples
+
+    def record(self, seconds):
+        self.samples.append(seconds)
+
+    def percentile(self, fraction):
+        """표본이 부족하면 None"""
+        if len(self.samples) < self.min_samples:
+            return None
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(fraction * len(ordered)))
+        return ordered[index]
@@ -0,0 +1,120 @@
+import asyncio
+import contextlib
+import heapq
+import itertools
+import time
+
+# 우선순위 (숫자가 작을수록 먼저 처리)
+PRIORITY_STORY = 0          # 아이가 기다리는 동화 텍스트
+PRIORITY_QUESTION = 1       # 학습 문제
+PRIORITY_ILLUSTRATION = 2   # 삽화
+PRIORITY_FALLBACK = 3       # 삽화 대신 보여줄 시각적 설명
+PRIORITY_BACKGROUND = 4     # 추측 생성 등 백그라운드 작업
+
+
+class SchedulerOverloaded(Exception):
+    """대기 시간 안에 모델 호출 차례가 오지 않을 때 발생 (호출자는 대체 경로로 전환)"""
+
+
+class TokenBucket:
+    """분당 요청 수 제한용 토큰 버킷"""
+
+    def __init__(self, rate_per_minute, burst):
+        self.rate_per_second = rate_per_minute / 60.0
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate_per_second)
+        self.updated_at = now
+
+    def try_take(self):
+        """토큰을 하나 꺼냄. 꺼냈으면 0, 아니면 다음 토큰까지 기다릴 시간(초) 반환"""
+        if self.rate_per_second <= 0:
+            return 0
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate_per_second
+
+
+class ModelLane:
+    """모델 하나의 동시 호출 제한 + 토큰 버킷 + 우선순위 대기열"""
+
+    def __init__(self, name, max_concurrency=4, rate_per_minute=0, burst=None):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.bucket = TokenBucket(rate_per_minute, burst or max_concurrency)
+        self.active = 0
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._wakeup = None
+        self.rejected = 0
+
+    @property
+    def queued(self):
+        return sum(1 for _, _, future in self._waiters if not future.done())
+
+    def _dispatch(self):
+        """빈 자리와 토큰이 있으면 우선순위가 높은 대기자부터 호출 허용"""
+        while self._waiters and self.active < self.max_concurrency:
+            if self._waiters[0][2].done():
+                heapq.heappop(self._waiters)
+                continue
+            wait = self.bucket.try_take()
+            if wait > 0:
+                # 토큰이 다시 찰 때 대기열을 다시 확인
+                if self._wakeup is None:
+                    loop = asyncio.get_running_loop()
+                    self._wakeup = loop.call_later(wait, self._on_wakeup)
+                return
+            _, _, future = heapq.heappop(self._waiters)
+            self.active += 1
+            future.set_result(True)
+
+    def _on_wakeup(self):
+        self._wakeup = None
+        self._dispatch()
+
+    def release(self):
+        self.active -= 1
+        self._dispatch()
+
+    async def acquire(self, priority=PRIORITY_STORY, max_wait=None):
+        """호출 차례를 기다림 (max_wait 초 안에 차례가 오지 않으면 SchedulerOverloaded)"""
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+        self._dispatch()
+        try:
+            done, _ = await asyncio.wait({future}, timeout=max_wait)
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release()
+            else:
+                future.cancel()
+            raise
+
+        if not done:
+            future.cancel()
+            self.rejected += 1
+            raise SchedulerOverloaded(f"{self.name} 대기 시간 초과 ({max_wait}초)")
+
+    @contextlib.asynccontextmanager
+    async def slot(self, priority=PRIORITY_STORY, max_wait=None):
+        """호출 차례를 얻고 끝나면 반납하는 컨텍스트"""
+        await self.acquire(priority, max_wait)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self):
+        return {
+            "active": self.active,
+            "queued": self.queued,
+            "tokens": round(self.bucket.tokens, 2),
+            "rejected": self.rejected,
+        }
@@ -0,0 +1,110 @@
+import re
+import textwrap
+import threading
+
+import metrics
+from model_backends import estimate_tokens
+
+BLANK_LINES = re.compile(r"\n{3,}")
+
+# 프롬프트/응답 토큰 수 (단계별 누적, 프롬프트 크기 분포)
+TOKENS_TOTAL = metrics.registry.counter(
+    "storybook_tokens_total", "Prompt and completion tokens by stage", ("stage", "kind")
+)
+PROMPT_TOKENS = metrics.registry.histogram(
+    "storybook_prompt_tokens", "Estimated prompt size by stage", ("stage",),
+    buckets=(50, 100, 200, 400, 600, 800, 1000, 1500, 2000, 3000, 5000)
+)
+
+
+def compact(text):
+    """들여쓰기/줄 끝 공백/연속 빈 줄 제거 (전송되는 공백 줄이기)"""
+    if not text:
+        return ""
+    lines = [line.strip() for line in textwrap.dedent(text).splitlines()]
+    return BLANK_LINES.sub("\n\n", "\n".join(lines)).strip()
+
+
+class PromptBuilder:
+    """호출 종류별 토큰 예산 안에서 프롬프트 구성 (넘치면 고정 컨텍스트는 두고 오래된 컨텍스트부터 제외)"""
+
+    def __init__(self, budgets=None, default_budget=2000):
+        self.budgets = dict(budgets or {})
+        self.default_budget = default_budget
+        self.trimmed = 0
+
+    def budget(self, stage):
+        return self.budgets.get(stage, self.default_budget)
+
+    def _render(self, system, task, context_title, context, sections):
+        blocks = [system, task]
+        if context:
+            blocks.append((f"{context_title}\n" if context_title else "") + "\n".join(context))
+        blocks.extend(sections)
+        return "\n\n".join(block for block in blocks if block)
+
+    def build(self, stage, system="", task="", context=(), context_title="", sections=(), pinned_context=()):
+        """system → task → 컨텍스트(고정 컨텍스트, 오래된 것부터) → 나머지 섹션 순서로 프롬프트 생성
+
+        pinned_context(시작 장면, 줄거리 요약 등)는 예산을 넘어도 빼지 않고 context만 오래된 것부터 제외한다.
+        """
+        system = compact(system)
+        task = compact(task)
+        sections = [compact(section) for section in sections if section]
+        pinned = [compact(item) for item in pinned_context if item]
+        context = [compact(item) for item in context if item]
+
+        budget = self.budget(stage)
+        prompt = self._render(system, task, context_title, pinned + context, sections)
+        dropped = 0
+        while context and estimate_tokens(prompt) > budget:
+            context.pop(0)
+            dropped += 1
+            prompt = self._render(system, task, context_title, pinned + context, sections)
+
+        if dropped:
+            self.trimmed += dropped
+            metrics.record(stage, "prompt_budget", "trimmed", dropped=dropped)
+        tokens = estimate_tokens(prompt)
+        if tokens > budget:
+            # 고정 지시문만으로 예산을 넘는 경우 (잘라내지 않고 기록만)
+            metrics.record(stage, "prompt_budget", "over_budget", tokens=tokens)
+        PROMPT_TOKENS.observe(tokens, stage=stage)
+        return prompt
+
+
+def usage_from_response(response, prompt="", text=""):
+    """응답의 usage_metadata에서 (프롬프트, 응답) 토큰 수 추출 (없으면 글자 수로 추정)"""
+    usage = getattr(response, "usage_metadata", None) if response is not None else None
+    prompt_tokens = getattr(usage, "prompt_token_count", None) if usage else None
+    completion_tokens = getattr(usage, "candidates_token_count", None) if usage else None
+    if not prompt_tokens:
+        prompt_tokens = estimate_tokens(prompt)
+    if completion_tokens is None:
+        completion_tokens = estimate_tokens(text)
+    return prompt_tokens, completion_tokens
+
+
+class TokenLedger:
+    """세션 하나의 단계별 토큰 사용량 장부"""
+
+    def __init__(self):
+        self.stages = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage, prompt_tokens, completion_tokens):
+        with self._lock:
+            entry = self.stages.setdefault(stage, {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0})
+            entry["calls"] += 1
+            entry["prompt_tokens"] += prompt_tokens
+            entry["completion_tokens"] += completion_tokens
+        TOKENS_TOTAL.inc(prompt_tokens, stage=stage, kind="prompt")
+        TOKENS_TOTAL.inc(completion_tokens, stage=stage, kind="completion")
+
+    def totals(self):
+        with self._lock:
+            return {
+                "calls": sum(entry["calls"] for entry in self.stages.values()),
+                "prompt_tokens": sum(entry["prompt_tokens"] for entry in self.stages.values()),
+                "completion_tokens": sum(entry["completion_tokens"] for entry in self.stages.values()),
+            }
@@ -0,0 +1,174 @@
+import asyncio
+import functools
+import json
+import re
+from collections import OrderedDict, deque
+
+WHITESPACE = re.compile(r"\s+")
+CODE_FENCE = re.compile(r"^```(?:json)?\s*|\s*```$")
+CHARACTER_PLACEHOLDER = "{주인공}"
+
+# 문제 하나의 JSON 스키마 (선택지 3개 + 정답)
+QUESTION_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "question": {"type": "STRING"},
+        "choices": {"type": "ARRAY", "items": {"type": "STRING"}},
+        "answer": {"type": "STRING", "enum": ["A", "B", "C"]},
+    },
+    "required": ["question", "choices", "answer"],
+}
+
+# 배치 생성용 JSON 스키마 (문제 목록)
+QUESTION_BATCH_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "questions": {"type": "ARRAY", "items": QUESTION_SCHEMA},
+    },
+    "required": ["questions"],
+}
+
+
+def normalize_question(text):
+    """중복 판정용 문제 문장 정규화"""
+    return WHITESPACE.sub("", text).lower()
+
+
+def validate_question(item):
+    """문제 dict 정리 (문제/선택지 3개/정답 A-C 형식이 아니면 None)"""
+    if not isinstance(item, dict):
+        return None
+    question = str(item.get("question", "")).strip()
+    choices = [str(choice).strip() for choice in item.get("choices") or []]
+    answer = str(item.get("answer", "")).strip().upper()[:1]
+    if question and len(choices) == 3 and all(choices) and answer in ("A", "B", "C"):
+        return {"question": question, "choices": choices, "answer": answer}
+    return None
+
+
+def parse_question_batch(text):
+    """배치 응답(JSON)에서 형식이 올바른 문제만 추출"""
+    data = json.loads(CODE_FENCE.sub("", text.strip()))
+    items = data.get("questions", []) if isinstance(data, dict) else data
+    return [question for question in map(validate_question, items) if question]
+
+
+def format_question(question, character_name=""):
+    """문제 dict를 화면용 텍스트(문제/선택지/정답)로 변환"""
+    name = character_name or "주인공"
+    lines = [f"문제: {question['question'].replace(CHARACTER_PLACEHOLDER, name)}"]
+    for letter, choice in zip("ABC", question["choices"]):
+        lines.append(f"{letter}) {choice.replace(CHARACTER_PLACEHOLDER, name)}")
+    lines.append(f"정답: {question['answer']}")
+    return "\n".join(lines)
+
+
+class QuestionBank:
+    """학습 주제별 문제 풀 (한 번의 호출로 여러 문제 생성 + 백그라운드 보충 + 중복 제거)"""
+
+    def __init__(self, generate_batch, batch_size=8, low_watermark=3, max_pool=24,
+                 max_subjects=50, seen_limit=500):
+        # generate_batch(학습 주제, 문제 수, 피할 최근 문제 목록) -> JSON 텍스트
+        self.generate_batch = generate_batch
+        self.batch_size = batch_size
+        self.low_watermark = low_watermark
+        self.max_pool = max_pool
+        self.max_subjects = max_subjects
+        self.seen_limit = seen_limit
+        # 주제 -> {"pool": 문제 deque, "seen": 정규화 문장 집합, "order": 기억 순서, "recent": 최근 문제}
+        self._subjects = OrderedDict()
+        self._refills = {}
+        self.hits = 0
+        self.misses = 0
+        self.duplicates = 0
+        self.batches = 0
+
+    def _entry(self, subject):
+        entry = self._subjects.get(subject)
+        if entry is None:
+            entry = self._subjects[subject] = {
+                "pool": deque(), "seen": set(), "order": deque(), "recent": deque(maxlen=10)
+            }
+            while len(self._subjects) > self.max_subjects:
+                self._subjects.popitem(last=False)
+        self._subjects.move_to_end(subject)
+        return entry
+
+    def size(self, subject):
+        entry = self._subjects.get(subject)
+        return len(entry["pool"]) if entry else 0
+
+    def prefetch(self, subject):
+        """풀이 부족하면 백그라운드에서 한 배치 보충 (이미 보충 중이면 그 작업 반환)"""
+        if not subject:
+            return None
+        task = self._refills.get(subject)
+        if task is not None and not task.done():
+            return task
+        if self.size(subject) > self.low_watermark:
+            return None
+        task = asyncio.create_task(self.refill(subject))
+        self._refills[subject] = task
+        task.add_done_callback(functools.partial(self._forget_refill, subject))
+        return task
+
+    def _forget_refill(self, subject, task):
+        if self._refills.get(subject) is task:
+            del self._refills[subject]
+
+    async def refill(self, subject):
+        """문제 한 배치 생성 후 중복을 빼고 풀에 추가 (추가한 개수 반환)"""
+        recent = list(self._entry(subject)["recent"])
+        try:
+            text = await self.generate_batch(subject, self.batch_size, recent)
+            questions = parse_question_batch(text)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"문제 배치 생성 오류 ({subject}): {str(e)}")
+            return 0
+
+        self.batches += 1
+        added = self.add(subject, questions)
+        print(f"📚 문제 풀 보충 ({subject}): {added}개 추가, 남은 문제 {self.size(subject)}개")
+        return added
+
+    def add(self, subject, questions):
+        """이미 나온 문제를 빼고 풀에 추가 (추가한 개수 반환)"""
+        entry = self._entry(subject)
+        added = 0
+        for question in questions:
+            key = normalize_question(question["question"])
+            if key in entry["seen"]:
+                self.duplicates += 1
+                continue
+            entry["seen"].add(key)
+            entry["order"].append(key)
+            entry["recent"].append(question["question"])
+            if len(entry["order"]) > self.seen_limit:
+                entry["seen"].discard(entry["order"].popleft())
+            if len(entry["pool"]) < self.max_pool:
+                entry["pool"].append(question)
+                added += 1
+        return added
+
+    def take(self, subject):
+        """풀에서 문제 하나를 바로 꺼냄 (없으면 None), 부족해지면 보충 시작"""
+        entry = self._subjects.get(subject)
+        question = entry["pool"].popleft() if entry and entry["pool"] else None
+        if question is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        self.prefetch(subject)
+        return question
+
+    def stats(self):
+        return {
+            "subjects": len(self._subjects),
+            "pooled": sum(len(entry["pool"]) for entry in self._subjects.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+            "duplicates": self.duplicates,
+            "batches": self.batches,
+        }
@@ -0,0 +1,154 @@
+import asyncio
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+class ResponseCache:
+    """텍스트 생성 응답 캐시 (키별 변형 풀 순환 + TTL + 메모리 예산)"""
+
+    def __init__(self, ttl=3600, variants=3, memory_limit_bytes=16 * 1024 * 1024, shared=None):
+        self.ttl = ttl
+        self.variants = variants
+        self.memory_limit_bytes = memory_limit_bytes
+        # 여러 워커 프로세스가 함께 쓰는 캐시 (SharedCache, 변형 풀을 JSON으로 공유)
+        self.shared = shared
+        # key -> {"variants": [(텍스트, 생성 시각)], "cursor": 다음 순번}
+        self._entries = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.shared_hits = 0
+
+    def _size(self, text):
+        return len(text.encode("utf-8"))
+
+    def _prune(self, key, entry, now):
+        """TTL이 지난 변형 제거"""
+        fresh = []
+        for text, created_at in entry["variants"]:
+            if now - created_at <= self.ttl:
+                fresh.append((text, created_at))
+            else:
+                self._memory_bytes -= self._size(text)
+        entry["variants"] = fresh
+        if not fresh:
+            del self._entries[key]
+
+    def take(self, key):
+        """변형 풀이 다 찼으면 순서대로 돌려가며 반환 (아니면 None → 새로 생성)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._prune(key, entry, time.time())
+            entry = self._entries.get(key)
+            if entry is None or len(entry["variants"]) < self.variants:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            text = entry["variants"][entry["cursor"] % len(entry["variants"])][0]
+            entry["cursor"] += 1
+            self.hits += 1
+            return text
+
+    def _append(self, key, text, created_at):
+        entry = self._entries.setdefault(key, {"variants": [], "cursor": 0})
+        self._entries.move_to_end(key)
+        if any(existing == text for existing, _ in entry["variants"]):
+            return entry
+        if len(entry["variants"]) >= self.variants:
+            # 풀이 가득 찼으면 가장 오래된 변형 교체
+            old_text, _ = entry["variants"].pop(0)
+            self._memory_bytes -= self._size(old_text)
+        entry["variants"].append((text, created_at))
+        self._memory_bytes += self._size(text)
+
+        # 메모리 예산을 넘으면 가장 오래 안 쓴 키부터 제거
+        while self._memory_bytes > self.memory_limit_bytes and len(self._entries) > 1:
+            _, evicted = self._entries.popitem(last=False)
+            for old_text, _ in evicted["variants"]:
+                self._memory_bytes -= self._size(old_text)
+        return entry
+
+    def add(self, key, text):
+        """새로 생성한 응답을 변형 풀에 추가 (공유 캐시가 있으면 백그라운드로 함께 기록)"""
+        if not text or self._size(text) > self.memory_limit_bytes:
+            return
+        with self._lock:
+            entry = self._append(key, text, time.time())
+            variants = list(entry["variants"])
+        if self.shared:
+            self._write_shared(key, variants)
+
+    def _write_shared(self, key, variants):
+        payload = json.dumps(variants, ensure_ascii=False)
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.shared.put("response", key, payload, ttl=self.ttl)
+            return
+        future = loop.run_in_executor(None, self.shared.put, "response", key, payload, self.ttl)
+        future.add_done_callback(_log_shared_error)
+
+    def _merge_shared(self, key):
+        """다른 워커가 만든 변형을 공유 캐시에서 가져와 로컬 풀에 합침"""
+        payload = self.shared.get("response", key)
+        if payload is None:
+            return 0
+        now = time.time()
+        merged = 0
+        with self._lock:
+            for text, created_at in json.loads(payload):
+                if now - created_at <= self.ttl and self._size(text) <= self.memory_limit_bytes:
+                    self._append(key, text, created_at)
+                    merged += 1
+        return merged
+
+    async def lookup(self, key):
+        """take()와 같지만 로컬 풀이 부족하면 공유 캐시의 변형까지 확인"""
+        cached = self.take(key)
+        if cached is not None or not self.shared:
+            return cached
+        try:
+            merged = await asyncio.to_thread(self._merge_shared, key)
+        except Exception as e:
+            print(f"공유 캐시 조회 오류: {str(e)}")
+            return None
+        if not merged:
+            return None
+        with self._lock:
+            # 첫 take()에서 이미 실패로 셌으므로 공유 캐시 적중은 따로 집계
+            self.misses -= 1
+        cached = self.take(key)
+        if cached is not None:
+            self.shared_hits += 1
+        return cached
+
+    async def get_or_generate(self, key, generate):
+        """캐시된 변형을 반환하거나 generate()로 새로 만들어 풀에 추가"""
+        cached = await self.lookup(key)
+        if cached is not None:
+            return cached
+        text = await generate()
+        self.add(key, text)
+        return text
+
+    def stats(self):
+        """캐시 적중/실패 통계"""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "keys": len(self._entries),
+            "memory_bytes": self._memory_bytes,
+        }
+
+
+def _log_shared_error(future):
+    if not future.cancelled() and future.exception() is not None:
+        print(f"공유 캐시 기록 오류: {str(future.exception())}")
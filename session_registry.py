@@ -0,0 +1,91 @@
+import time
+import threading
+from collections import OrderedDict
+
+
+class SessionRegistry:
+    """Chainlit 세션별 객체 저장소 (유휴 세션 정리 + 메모리 상한)"""
+
+    def __init__(self, factory, max_sessions=200, idle_ttl=1800, max_memory_bytes=64 * 1024 * 1024,
+                 on_close=None):
+        self.factory = factory
+        # on_close(session_id, 객체): 세션이 종료/정리될 때 세션에 딸린 다른 자원 해제 (삽화 저장소 등)
+        self.on_close = on_close
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.max_memory_bytes = max_memory_bytes
+        # session_id -> [객체, 마지막 접근 시각] (가장 오래 안 쓴 세션이 앞쪽)
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self.evicted_count = 0
+
+    def get(self, session_id):
+        """세션 객체 반환 (없으면 새로 생성)"""
+        with self._lock:
+            now = time.monotonic()
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                entry = [self.factory(), now]
+                self._sessions[session_id] = entry
+            else:
+                entry[1] = now
+                self._sessions.move_to_end(session_id)
+            self._evict(now, keep=session_id)
+            return entry[0]
+
+    def reset(self, session_id):
+        """세션 객체를 새 객체로 교체 ('처음부터' 처리용)"""
+        self.remove(session_id)
+        return self.get(session_id)
+
+    def remove(self, session_id):
+        """세션 종료 시 객체 제거"""
+        with self._lock:
+            entry = self._sessions.pop(session_id, None)
+        if entry is None:
+            return None
+        self._close(session_id, entry[0])
+        return entry[0]
+
+    def __contains__(self, session_id):
+        return session_id in self._sessions
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def estimate_memory_bytes(self):
+        """전체 세션의 대략적인 메모리 사용량"""
+        return sum(self._object_size(entry[0]) for entry in self._sessions.values())
+
+    def _close(self, session_id, obj):
+        # 세션 객체가 가진 백그라운드 작업과 세션에 딸린 자원 정리
+        close = getattr(obj, "close", None)
+        if close:
+            close()
+        if self.on_close:
+            self.on_close(session_id, obj)
+
+    def _object_size(self, obj):
+        estimate = getattr(obj, "estimate_memory_bytes", None)
+        return estimate() if estimate else 0
+
+    def _evict(self, now, keep=None):
+        """유휴 세션 제거 후 세션 수/메모리 상한을 넘으면 오래된 세션부터 제거"""
+        for session_id, entry in list(self._sessions.items()):
+            if session_id != keep and now - entry[1] > self.idle_ttl:
+                del self._sessions[session_id]
+                self._close(session_id, entry[0])
+                self.evicted_count += 1
+
+        total_bytes = self.estimate_memory_bytes()
+        while len(self._sessions) > 1 and (
+            len(self._sessions) > self.max_sessions or total_bytes > self.max_memory_bytes
+        ):
+            session_id = next(iter(self._sessions))
+            if session_id == keep:
+                break
+            entry = self._sessions.pop(session_id)
+            total_bytes -= self._object_size(entry[0])
+            self._close(session_id, entry[0])
+            self.evicted_count += 1
+            print(f"🧹 세션 정리: {session_id} (남은 세션 {len(self._sessions)}개)")
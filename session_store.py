@@ -0,0 +1,176 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from metrics import track
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_key TEXT PRIMARY KEY,
+    state TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS chapters (
+    session_key TEXT NOT NULL,
+    chapter INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (session_key, chapter)
+);
+CREATE INDEX IF NOT EXISTS sessions_updated_at ON sessions (updated_at);
+"""
+
+
+class SessionStore:
+    """세션 상태 영구 저장소 (SQLite, 요청 경로에서는 대기열에만 넣고 모아서 백그라운드 쓰기)"""
+
+    def __init__(self, path, flush_interval=1.0, retention_seconds=72 * 3600, gc_interval=3600):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.retention_seconds = retention_seconds
+        self.gc_interval = gc_interval
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._db_lock = threading.Lock()
+        # 쓰기 대기열: 삭제할 세션, 세션별 마지막 상태(덮어쓰기), 추가할 챕터
+        self._deletes = set()
+        self._states = {}
+        self._chapters = []
+        self._pending_lock = threading.Lock()
+        self._task = None
+        self._last_gc = 0.0
+        self.flushes = 0
+        self.rows_written = 0
+
+    def save_state(self, session_key, state):
+        """세션 상태 저장 예약 (같은 세션의 이전 예약은 덮어씀)"""
+        with self._pending_lock:
+            self._states[session_key] = (json.dumps(state, ensure_ascii=False, default=str), time.time())
+        self._schedule_flush()
+
+    def append_chapter(self, session_key, chapter):
+        """챕터 추가 저장 예약"""
+        with self._pending_lock:
+            self._chapters.append(
+                (session_key, chapter["chapter"], json.dumps(chapter, ensure_ascii=False, default=str))
+            )
+        self._schedule_flush()
+
+    def delete(self, session_key):
+        """세션 삭제 예약 ('처음부터' 처리용, 아직 쓰지 않은 예약도 버림)"""
+        with self._pending_lock:
+            self._deletes.add(session_key)
+            self._states.pop(session_key, None)
+            self._chapters = [row for row in self._chapters if row[0] != session_key]
+        self._schedule_flush()
+
+    def _schedule_flush(self):
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            # 이벤트 루프 밖(동기 코드)에서는 바로 기록
+            self._write()
+            return
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._flush_later())
+
+    def _has_pending(self):
+        return bool(self._deletes or self._states or self._chapters)
+
+    async def _flush_later(self):
+        # 짧은 시간 동안 들어온 예약을 모아서 한 트랜잭션으로 기록 (기록 중에 들어온 예약도 이어서)
+        while self._has_pending():
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"세션 저장 오류: {str(e)}")
+
+    async def flush(self):
+        """대기 중인 쓰기를 스레드 풀에서 기록"""
+        await asyncio.to_thread(self._write)
+
+    def _take_pending(self):
+        with self._pending_lock:
+            batch = (self._deletes, self._states, self._chapters)
+            self._deletes, self._states, self._chapters = set(), {}, []
+        return batch
+
+    def _write(self):
+        # 대기열을 꺼내는 것부터 잠금 안에서 해야 나중 상태가 먼저 기록된 뒤 덮어써지지 않음
+        with self._db_lock:
+            deletes, states, chapters = self._take_pending()
+            if not (deletes or states or chapters):
+                return
+            self._commit(deletes, states, chapters)
+        self.flushes += 1
+        self.rows_written += len(deletes) + len(states) + len(chapters)
+        if time.monotonic() - self._last_gc > self.gc_interval:
+            self._last_gc = time.monotonic()
+            self._collect_garbage()
+
+    def _commit(self, deletes, states, chapters):
+        with track("session_store", "flush"):
+            try:
+                self._conn.execute("BEGIN")
+                for session_key in deletes:
+                    self._conn.execute("DELETE FROM sessions WHERE session_key = ?", (session_key,))
+                    self._conn.execute("DELETE FROM chapters WHERE session_key = ?", (session_key,))
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO sessions (session_key, state, updated_at) VALUES (?, ?, ?)",
+                    [(session_key, state, updated_at) for session_key, (state, updated_at) in states.items()]
+                )
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO chapters (session_key, chapter, data) VALUES (?, ?, ?)", chapters
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _collect_garbage(self):
+        """보관 기간 동안 갱신되지 않은 세션 정리"""
+        cutoff = time.time() - self.retention_seconds
+        with self._db_lock:
+            stale = [row[0] for row in self._conn.execute(
+                "SELECT session_key FROM sessions WHERE updated_at < ?", (cutoff,)
+            )]
+            for session_key in stale:
+                self._conn.execute("DELETE FROM sessions WHERE session_key = ?", (session_key,))
+                self._conn.execute("DELETE FROM chapters WHERE session_key = ?", (session_key,))
+        if stale:
+            print(f"🧹 저장된 세션 정리: {len(stale)}개")
+
+    async def load(self, session_key, last_n_chapters=4):
+        """저장된 상태와 최근 N개 챕터만 읽기 (없으면 None)"""
+        await self.flush()
+        return await asyncio.to_thread(self._load, session_key, last_n_chapters)
+
+    def _load(self, session_key, last_n_chapters):
+        with self._db_lock, track("session_store", "load"):
+            row = self._conn.execute(
+                "SELECT state FROM sessions WHERE session_key = ?", (session_key,)
+            ).fetchone()
+            if row is None:
+                return None
+            chapters = self._conn.execute(
+                "SELECT data FROM chapters WHERE session_key = ? ORDER BY chapter DESC LIMIT ?",
+                (session_key, last_n_chapters)
+            ).fetchall()
+        return {
+            "state": json.loads(row[0]),
+            "chapters": [json.loads(data) for (data,) in reversed(chapters)],
+        }
+
+    def close(self):
+        """남은 쓰기를 기록하고 연결 종료 (프로세스 종료 시)"""
+        self._write()
+        with self._db_lock:
+            self._conn.close()
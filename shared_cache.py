@@ -0,0 +1,106 @@
+import os
+import sqlite3
+import threading
+import time
+
+from metrics import track
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    expires_at REAL,
+    accessed_at REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+);
+CREATE INDEX IF NOT EXISTS entries_accessed_at ON entries (accessed_at);
+"""
+
+
+class SharedCache:
+    """한 호스트의 여러 워커 프로세스가 함께 쓰는 캐시 (SQLite WAL, 프로세스마다 연결 하나)
+
+    동기 메서드이므로 이벤트 루프에서는 asyncio.to_thread로 호출한다.
+    """
+
+    def __init__(self, path, max_bytes=512 * 1024 * 1024, touch_interval=60, busy_timeout=5.0):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.touch_interval = touch_interval
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=busy_timeout, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, namespace, key):
+        """값 조회 (없거나 만료됐으면 None)"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at, accessed_at FROM entries WHERE namespace = ? AND key = ?",
+                (namespace, key)
+            ).fetchone()
+            if row is None or (row[1] is not None and row[1] < now):
+                self.misses += 1
+                return None
+            # 읽을 때마다 쓰기 잠금을 잡지 않도록 접근 시각은 가끔만 갱신
+            if now - row[2] > self.touch_interval:
+                self._conn.execute(
+                    "UPDATE entries SET accessed_at = ? WHERE namespace = ? AND key = ?", (now, namespace, key)
+                )
+            self.hits += 1
+            return row[0]
+
+    def put(self, namespace, key, value, ttl=None):
+        """값 저장 (용량 상한을 넘으면 가장 오래 안 쓴 항목부터 삭제)"""
+        if isinstance(value, str):
+            value = value.encode("utf-8")
+        if not value or len(value) > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock, track("shared_cache", "write"):
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO entries (namespace, key, value, size, expires_at, accessed_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (namespace, key, value, len(value), now + ttl if ttl else None, now)
+                )
+                self._evict()
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _evict(self):
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        self._conn.execute("DELETE FROM entries WHERE expires_at IS NOT NULL AND expires_at < ?", (time.time(),))
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        victims = []
+        for namespace, key, size in self._conn.execute(
+            "SELECT namespace, key, size FROM entries ORDER BY accessed_at"
+        ):
+            if total <= self.max_bytes:
+                break
+            victims.append((namespace, key))
+            total -= size
+        self._conn.executemany("DELETE FROM entries WHERE namespace = ? AND key = ?", victims)
+
+    def stats(self):
+        with self._lock:
+            items, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        return {"items": items, "bytes": total, "hits": self.hits, "misses": self.misses}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,96 @@
+import asyncio
+import re
+
+# 제안 문구 비교 시 이모지/문장부호/공백은 무시
+NON_WORD = re.compile(r"[^0-9a-zA-Z가-힣]+")
+# 제안 문구 앞의 이모지 제거용
+LEADING_SYMBOLS = re.compile(r"^[^0-9a-zA-Z가-힣]+")
+
+
+def normalize_suggestion(text):
+    """제안 문구 비교용 정규화 (이모지, 공백, 문장부호 제거)"""
+    return NON_WORD.sub("", text or "").lower()
+
+
+def strip_suggestion_symbols(text):
+    """제안 문구 앞의 이모지 제거"""
+    return LEADING_SYMBOLS.sub("", text or "").strip()
+
+
+class SpeculativeEngine:
+    """아이가 읽는 동안 제안 문구별 다음 챕터를 미리 생성해두는 엔진"""
+
+    def __init__(self, generate, budget=3, limiter=None):
+        # generate: 사용자 입력을 받아 챕터 텍스트를 돌려주는 코루틴 함수 (실패 시 예외)
+        self.generate = generate
+        self.budget = budget
+        # 여러 세션이 공유하는 추측 생성 동시 실행 제한
+        self.limiter = limiter
+        self._tasks = {}
+        self._chapter = None
+        self.hits = 0
+        self.misses = 0
+        self.cancelled = 0
+
+    def start(self, suggestions, chapter):
+        """제안 문구마다 다음 챕터 생성을 백그라운드에서 시작 (세션 예산 내에서)"""
+        self.cancel_all()
+        self._chapter = chapter
+        for suggestion in suggestions[:self.budget]:
+            key = normalize_suggestion(suggestion)
+            if key and key not in self._tasks:
+                request = strip_suggestion_symbols(suggestion)
+                self._tasks[key] = asyncio.create_task(self._run(request))
+
+    async def _run(self, request):
+        try:
+            if self.limiter is None:
+                return await self.generate(request)
+            async with self.limiter:
+                return await self.generate(request)
+        except Exception as e:
+            # 추측 생성 실패는 조용히 무시 (실제 요청 시 다시 생성)
+            print(f"추측 생성 실패: {str(e)}")
+            return None
+
+    def match(self, user_input):
+        """입력과 일치하는 제안 키 찾기"""
+        key = normalize_suggestion(user_input)
+        if not key:
+            return None
+        if key in self._tasks:
+            return key
+        # '새로운 친구를 만나게' 처럼 제안 앞부분만 입력한 경우도 허용
+        # (제안보다 더 많은 내용을 담은 입력은 미리 만든 챕터로 대신하면 추가 요청이 사라지므로 제외)
+        for suggestion_key in self._tasks:
+            if len(key) >= 6 and suggestion_key.startswith(key):
+                return suggestion_key
+        return None
+
+    async def take(self, user_input, chapter):
+        """입력이 제안과 일치하면 미리 만든 챕터를 반환하고 나머지 추측은 취소"""
+        key = self.match(user_input) if chapter == self._chapter else None
+        task = self._tasks.pop(key, None) if key else None
+        self.cancel_all()
+
+        if task is None:
+            self.misses += 1
+            return None
+
+        result = await task
+        if not result:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        print(f"⚡ 미리 만든 챕터 사용 (적중 {self.hits}회 / 실패 {self.misses}회)")
+        return result
+
+    def cancel_all(self):
+        """사용하지 않을 추측 생성 작업 모두 취소"""
+        for task in self._tasks.values():
+            if not task.done():
+                task.cancel()
+                self.cancelled += 1
+        self._tasks = {}
+        self._chapter = None
@@ -0,0 +1,164 @@
+import asyncio
+import re
+from collections import deque
+
+SENTENCE_END = re.compile(r"(?<=[.!?。])\s+|\n+")
+
+
+def first_sentence(text, limit=80):
+    """텍스트의 첫 문장 (limit 글자 이내)"""
+    text = " ".join(text.split())
+    sentence = SENTENCE_END.split(text, maxsplit=1)[0] if text else ""
+    return sentence if len(sentence) <= limit else sentence[:limit - 1] + "…"
+
+
+def compress_locally(previous_summary, chapters, limit):
+    """모델 없이 만드는 요약 (챕터별 첫 문장을 이어 붙이고 앞부분부터 덜어냄)"""
+    lines = [previous_summary] if previous_summary else []
+    for chapter in chapters:
+        line = f"챕터 {chapter['chapter']}: {first_sentence(chapter['content'])}"
+        if chapter.get("user_input"):
+            line += f" ({first_sentence(chapter['user_input'], 30)})"
+        lines.append(line)
+    summary = " ".join(lines)
+    if len(summary) > limit:
+        summary = "…" + summary[-(limit - 1):]
+    return summary
+
+
+class StoryMemory:
+    """최근 챕터 링 버퍼 + 밀려난 챕터를 백그라운드에서 합쳐 가는 압축 요약"""
+
+    def __init__(self, summarize=None, recent_size=4, summary_chars=500, chapter_chars=200):
+        # summarize(이전 요약, 밀려난 챕터 목록) -> 새 요약 (없거나 실패하면 로컬 요약)
+        self.summarize = summarize
+        self.recent = deque(maxlen=recent_size)
+        self.summary_chars = summary_chars
+        self.chapter_chars = chapter_chars
+        self.opening = ""
+        self.summary = ""
+        self.summarized_through = 0
+        self.chapter_count = 0
+        self._pending = []
+        self._in_progress = []
+        self._task = None
+
+    def __len__(self):
+        return len(self.recent)
+
+    def add(self, chapter):
+        """새 챕터 추가 (링 버퍼에서 밀려난 챕터는 요약 대기열로)"""
+        if not self.opening:
+            self.opening = chapter["content"][:self.chapter_chars]
+        if len(self.recent) == self.recent.maxlen:
+            self._pending.append(self.recent[0])
+        self.recent.append(chapter)
+        self.chapter_count += 1
+        if self._pending:
+            self._schedule_update()
+
+    def restore(self, opening, summary, summarized_through, chapter_count, chapters):
+        """저장된 요약과 최근 챕터로 복원 (요약에 아직 합쳐지지 않은 챕터는 다시 요약 대기열로)"""
+        self.opening = opening
+        self.summary = summary
+        self.summarized_through = summarized_through
+        self.recent.clear()
+        for chapter in sorted(chapters, key=lambda c: c["chapter"]):
+            if len(self.recent) == self.recent.maxlen and self.recent[0]["chapter"] > summarized_through:
+                self._pending.append(self.recent[0])
+            self.recent.append(chapter)
+        self.chapter_count = chapter_count
+        if self._pending:
+            self._schedule_update()
+
+    def _schedule_update(self):
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            # 이벤트 루프 밖(동기 코드)에서는 바로 로컬 요약
+            self._apply(compress_locally(self.summary, self._pending, self.summary_chars), self._pending)
+            self._pending = []
+            return
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._update())
+
+    def _apply(self, summary, chapters):
+        self.summary = summary[:self.summary_chars]
+        self.summarized_through = chapters[-1]["chapter"]
+
+    async def _update(self):
+        """대기 중인 챕터를 요약에 합침 (업데이트 중 새로 밀려난 챕터도 이어서 처리)"""
+        while self._pending:
+            batch, self._pending = self._pending, []
+            self._in_progress = batch
+            summary = None
+            if self.summarize:
+                try:
+                    summary = await self.summarize(self.summary, batch)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    print(f"스토리 요약 오류 (로컬 요약 사용): {str(e)}")
+            if not summary:
+                summary = compress_locally(self.summary, batch, self.summary_chars)
+            self._apply(summary, batch)
+            self._in_progress = []
+
+    async def flush(self):
+        """진행 중인 요약 업데이트가 끝날 때까지 대기"""
+        if self._task is not None:
+            await self._task
+
+    def context_items(self, last_n_chapters=3):
+        """프롬프트용 컨텍스트 항목 (오래된 것부터: 시작 장면, 줄거리 요약, 최근 챕터)"""
+        return self.background_items(last_n_chapters) + self.recent_items(last_n_chapters)
+
+    def background_items(self, last_n_chapters=3):
+        """긴 이야기의 흐름을 잡아 주는 항목 (시작 장면, 줄거리 요약)"""
+        if not self.recent:
+            return []
+
+        recent = list(self.recent)[-last_n_chapters:]
+        items = []
+        if recent[0]["chapter"] > 1:
+            items.append(f"이야기의 시작: {self.opening}")
+        if self.summary:
+            items.append(f"지금까지의 줄거리: {self.summary}")
+        return items
+
+    def recent_items(self, last_n_chapters=3):
+        """요약 전 챕터의 첫 문장과 최근 챕터 원문 항목 (오래된 것부터)"""
+        if not self.recent:
+            return []
+
+        recent = list(self.recent)[-last_n_chapters:]
+        items = []
+        # 아직 요약에 합쳐지지 않은 챕터(요약 진행 중이거나 최근 목록 밖)는 첫 문장만
+        gap = [c for c in self._in_progress + self._pending + list(self.recent)
+               if self.summarized_through < c["chapter"] < recent[0]["chapter"]]
+        if gap:
+            items.append(compress_locally("", gap, self.summary_chars))
+        for context in recent:
+            chapter_info = f"챕터 {context['chapter']}: {context['content'][:self.chapter_chars]}"
+            if context['user_input']:
+                chapter_info += f" (사용자 요청: {context['user_input'][:50]})"
+            items.append(chapter_info)
+        return items
+
+    def context_text(self, last_n_chapters=3):
+        """프롬프트용 컨텍스트 (시작 장면 + 줄거리 요약 + 최근 챕터, 길이 상한 고정)"""
+        if not self.recent:
+            return "아직 이야기가 시작되지 않았습니다."
+        return "\n".join(self.context_items(last_n_chapters))
+
+    def estimate_memory_bytes(self):
+        total = len(self.summary.encode("utf-8")) + len(self.opening.encode("utf-8"))
+        for context in list(self.recent) + self._pending:
+            total += len(context['content'].encode('utf-8'))
+            total += len((context['user_input'] or "").encode('utf-8'))
+        return total
+
+    def close(self):
+        """진행 중인 요약 업데이트 취소"""
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
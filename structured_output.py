@@ -0,0 +1,104 @@
+import json
+import re
+
+from question_bank import CODE_FENCE
+
+# 사용자 요청 의도 태그 (제안 문구/의도 메시지 선택에 사용)
+INTENT_TAGS = (
+    "learning_focus", "positive_emotion", "help_action", "social_interaction",
+    "movement_adventure", "fear_concern", "general_continuation",
+)
+
+# 챕터 한 번의 호출로 본문/시각적 설명/의도 태그를 함께 받는 JSON 스키마
+# (쓰는 곳이 있는 항목만 요청, 항목마다 출력 토큰이 들기 때문)
+# (본문을 첫 항목으로 두어 스트리밍 중에도 본문부터 도착하도록 함)
+CHAPTER_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "chapter": {"type": "STRING", "description": "동화 본문"},
+        "visual_description": {"type": "STRING", "description": "삽화 대신 보여줄 2-3문장의 장면 설명"},
+        "intent_tags": {"type": "ARRAY", "items": {"type": "STRING", "enum": list(INTENT_TAGS)}},
+    },
+    "required": ["chapter", "visual_description", "intent_tags"],
+}
+
+CHAPTER_GENERATION_CONFIG = {"response_mime_type": "application/json", "response_schema": CHAPTER_SCHEMA}
+
+ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+
+class ChapterTextStream:
+    """JSON 응답 청크에서 본문 문자열만 도착하는 대로 풀어내는 디코더"""
+
+    def __init__(self, field="chapter"):
+        self.pattern = re.compile(r'"%s"\s*:\s*"' % re.escape(field))
+        self.raw = ""
+        self.done = False
+        self._pos = None
+
+    def feed(self, chunk):
+        """청크를 받아 새로 풀린 본문 텍스트 반환 (이스케이프가 잘린 경우 다음 청크까지 대기)"""
+        self.raw += chunk
+        if self.done:
+            return ""
+        if self._pos is None:
+            match = self.pattern.search(self.raw)
+            if not match:
+                return ""
+            self._pos = match.end()
+
+        raw = self.raw
+        index = self._pos
+        decoded = []
+        while index < len(raw):
+            char = raw[index]
+            if char == '"':
+                self.done = True
+                index += 1
+                break
+            if char != "\\":
+                decoded.append(char)
+                index += 1
+                continue
+            if index + 1 >= len(raw):
+                break
+            code = raw[index + 1]
+            if code != "u":
+                decoded.append(ESCAPES.get(code, code))
+                index += 2
+                continue
+            if index + 6 > len(raw):
+                break
+            point = int(raw[index + 2:index + 6], 16)
+            if 0xD800 <= point < 0xDC00:
+                # 이모지 등 서로게이트 쌍은 두 번째 절반까지 도착해야 풀 수 있음
+                if index + 12 > len(raw):
+                    break
+                low = int(raw[index + 8:index + 12], 16)
+                point = 0x10000 + ((point - 0xD800) << 10) + (low - 0xDC00)
+                index += 6
+            decoded.append(chr(point))
+            index += 6
+        self._pos = index
+        return "".join(decoded)
+
+
+def parse_chapter(text):
+    """구조화 응답을 챕터 dict로 변환 (잘린 JSON은 본문만, JSON이 아니면 전체를 본문으로)"""
+    text = CODE_FENCE.sub("", (text or "").strip())
+    try:
+        data = json.loads(text)
+    except ValueError:
+        data = None
+    if not isinstance(data, dict):
+        data = {"chapter": ChapterTextStream().feed(text) if text.startswith("{") else text}
+
+    chapter = str(data.get("chapter") or "").strip()
+    if not chapter:
+        raise ValueError("응답에 챕터 본문이 없습니다")
+    tags = data.get("intent_tags") or []
+    return {
+        "chapter": chapter,
+        "visual_description": str(data.get("visual_description") or "").strip(),
+        "intent_tags": [tag for tag in tags if tag in INTENT_TAGS] if isinstance(tags, list) else [],
+    }
@@ -3,9 +3,43 @@
 동화 나노바나나 애플리케이션 테스트 스크립트
 """
 
+import os
 import sys
+import time
 import asyncio
+import json
+import random
+import tempfile
+import threading
+import app
 from app import StoryTeller
+from session_registry import SessionRegistry
+from session_store import SessionStore
+from input_queue import InputQueue
+from model_client import AsyncModelClient
+from model_scheduler import (
+    ModelLane, TokenBucket, SchedulerOverloaded, PRIORITY_STORY, PRIORITY_ILLUSTRATION,
+    PRIORITY_BACKGROUND
+)
+from model_resilience import CircuitBreaker, CircuitOpenError
+from model_backends import StubBackend, RecordReplayBackend, ReplayMissError
+from model_registry import ModelRegistry
+from context_cache import CachedInstructionModel
+import metrics
+from speculation import SpeculativeEngine
+from story_memory import StoryMemory
+from question_bank import QuestionBank, QUESTION_BATCH_SCHEMA, parse_question_batch, format_question
+from structured_output import CHAPTER_GENERATION_CONFIG, ChapterTextStream, parse_chapter
+from prompt_builder import PromptBuilder, TokenLedger, compact, usage_from_response
+from image_cache import ImageCache, make_cache_key
+from image_pipeline import ImagePipeline
+from PIL import Image
+import io
+from response_cache import ResponseCache
+from shared_cache import SharedCache
+from worker_router import WorkerRouter, WorkerSupervisor, parse_worker_cookie
+from artifact_store import ImageArtifactStore, guess_image_mime
+from keyword_engine import KeywordMatcher, load_lexicons
 
 async def test_storyteller_basic():
     """StoryTeller 기본 기능 테스트"""
@@ -115,8 +149,66 @@ async def test_story_generation():
     assert learning_info["chapters_count"] == 1
     print("✅ 학습 진행도 추적")
     
+    # 4. 삽화 장면 프롬프트는 스토리 텍스트 없이도 미리 생성 가능
+    scene_prompt = storyteller.build_scene_prompt(3, "친구를 만나고 싶어요")
+    assert "친구를 만나고 싶어요" in scene_prompt
+    assert "야옹이" in scene_prompt
+    assert "테스트 스토리 1" in scene_prompt
+    print("✅ 삽화 장면 프롬프트 사전 생성")
+    
     print("🎉 스토리 생성 로직 테스트 모두 통과!\n")
 
+def test_keyword_engine():
+    """키워드 사전 매칭 엔진 테스트"""
+    print("🔤 키워드 사전 매칭 테스트...")
+    
+    lexicons = {
+        "intent": {"fear_concern": ["무서", "겁"], "social_interaction": ["친구", "같이"]},
+        "characters": {"곰돌이": ["곰"], "북극곰": ["북극곰"]},
+        "banned": {"inappropriate": ["폭력"]},
+    }
+    matcher = KeywordMatcher(lexicons)
+    
+    # 1. 한 번의 스캔으로 모든 사전/분류 일치 (겹치는 단어 포함)
+    hits = matcher.scan("친구랑 같이 북극곰을 봤는데 무서웠어요")
+    assert hits == {"intent": ["fear_concern", "social_interaction"], "characters": ["곰돌이", "북극곰"]}
+    assert [m[4] for m in matcher.find("북극곰")] == ["북극곰", "곰"]
+    print("✅ 한 번에 모든 분류 찾기")
+    
+    # 2. 우선순위는 사전에 적힌 분류 순서
+    assert matcher.first("친구가 무서워해요", "intent") == "fear_concern"
+    assert matcher.first("FOO 폭력", "banned") == "inappropriate"
+    assert matcher.first("안녕", "intent") is None and matcher.first("", "intent") is None
+    print("✅ 분류 우선순위")
+    
+    # 3. 무작위 입력에서도 선형 스캔과 같은 결과
+    rng = random.Random(3)
+    letters = "친구같이무서겁곰북극폭력 "
+    for _ in range(300):
+        text = "".join(rng.choice(letters) for _ in range(rng.randint(0, 12)))
+        expected = {}
+        for lexicon, categories in lexicons.items():
+            matched = [c for c, terms in categories.items() if any(t in text for t in terms)]
+            if matched:
+                expected[lexicon] = matched
+        assert matcher.scan(text) == expected, text
+    print("✅ 선형 스캔과 결과 일치")
+    
+    # 4. 저장소 사전 파일 로드 + 잘못된 형식은 오류
+    assert {"intent", "banned", "characters", "story_start"} <= set(load_lexicons(app.LEXICON_DIR))
+    assert app.keyword_matcher.first("강아지와 고양이", "characters") == "멍멍이"
+    with tempfile.TemporaryDirectory() as lexicon_dir:
+        with open(f"{lexicon_dir}/broken.json", "w", encoding="utf-8") as f:
+            json.dump({"분류": "단어"}, f)
+        try:
+            load_lexicons(lexicon_dir)
+            assert False, "형식 오류가 나야 합니다"
+        except ValueError:
+            pass
+    print("✅ 사전 파일 로드")
+    
+    print("🎉 키워드 사전 매칭 테스트 모두 통과!\n")
+
 def test_ui_helpers():
     """UI 도우미 함수 테스트"""
     print("🎨 UI 도우미 함수 테스트...")
@@ -141,6 +233,1156 @@ def test_ui_helpers():
     
     print("🎉 UI 도우미 함수 테스트 모두 통과!\n")
 
+def test_session_registry():
+    """세션별 스토리텔러 분리 테스트"""
+    print("👥 세션 분리 테스트...")
+    
+    registry = SessionRegistry(StoryTeller, max_sessions=2, idle_ttl=60)
+    
+    # 1. 세션마다 별도의 스토리텔러
+    first = registry.get("session-1")
+    second = registry.get("session-2")
+    assert first is not second
+    assert registry.get("session-1") is first
+    print("✅ 세션별 상태 분리")
+    
+    # 2. 한 세션의 초기화가 다른 세션에 영향 없음
+    second.add_to_story_context("두 번째 아이의 이야기", None)
+    registry.reset("session-1")
+    assert len(registry.get("session-2").story_context) == 1
+    print("✅ 처음부터 다시 시작 시 다른 세션 유지")
+    
+    # 3. 세션 수 상한 초과 시 가장 오래된 세션 제거
+    registry.get("session-3")
+    assert len(registry) == 2
+    assert "session-1" not in registry
+    print("✅ 세션 수 상한 적용")
+    
+    # 4. 정리된 세션의 삽화도 on_close로 함께 해제
+    store = ImageArtifactStore()
+    registry = SessionRegistry(StoryTeller, max_sessions=1, idle_ttl=60,
+                               on_close=lambda session_id, _: store.remove_session(session_id))
+    registry.get("session-1")
+    store.save("session-1", "story_chapter_1.png", b"first")
+    registry.get("session-2")
+    store.save("session-2", "story_chapter_1.png", b"second")
+    assert "session-1" not in registry
+    assert store.stats() == {"sessions": 1, "images": 1, "bytes": len(b"second")}
+    print("✅ 정리된 세션의 삽화 해제")
+
+    print("🎉 세션 분리 테스트 모두 통과!\n")
+
+async def test_session_store():
+    """세션 영구 저장소(쓰기 지연 + 이어하기) 테스트"""
+    print("💾 세션 영구 저장소 테스트...")
+    
+    storyteller = StoryTeller()
+    storyteller.story_stage = "story_ongoing"
+    storyteller.learning_subject = "숫자"
+    storyteller.character_name = "멍멍이"
+    storyteller.user_profile = "6살 호기심 많은 아이"
+    for chapter in range(1, 7):
+        storyteller.add_to_story_context(f"{chapter}번째 장면이에요. 즐거웠어요.", f"요청 {chapter}")
+    await storyteller.story_memory.flush()
+    
+    with tempfile.TemporaryDirectory() as store_dir:
+        path = f"{store_dir}/sessions.sqlite3"
+        store = SessionStore(path, flush_interval=0.05)
+        
+        # 1. 요청 경로에서는 대기열에만 넣고, 잠시 뒤 한 번에 모아서 기록
+        for chapter in storyteller.story_context:
+            store.append_chapter("세션1", chapter)
+        store.save_state("세션1", storyteller.export_state())
+        store.save_state("세션1", storyteller.export_state())
+        assert store.flushes == 0
+        await asyncio.sleep(0.2)
+        assert store.flushes == 1 and store.rows_written == len(storyteller.story_context) + 1
+        print("✅ 쓰기 지연 + 일괄 기록")
+        
+        # 2. 재시작 후에는 상태와 최근 챕터만 읽어서 복원
+        store.close()
+        restarted = SessionStore(path)
+        saved = await restarted.load("세션1", last_n_chapters=2)
+        assert [c["chapter"] for c in saved["chapters"]] == [5, 6]
+        restored = StoryTeller()
+        restored.restore_state(saved["state"], saved["chapters"])
+        assert restored.story_stage == "story_ongoing" and restored.character_name == "멍멍이"
+        assert restored.current_chapter == 6 and restored.persisted_chapter == 6
+        assert restored.story_memory.chapter_count == 6
+        context = restored.get_story_context_summary()
+        assert "지금까지의 줄거리:" in context and "챕터 6:" in context
+        print("✅ 재시작 후 최근 챕터 + 요약으로 이어하기")
+        
+        # 3. '처음부터'는 저장된 이야기 삭제
+        restarted.delete("세션1")
+        assert await restarted.load("세션1") is None
+        restarted.close()
+        print("✅ 저장된 세션 삭제")
+    
+    print("🎉 세션 영구 저장소 테스트 모두 통과!\n")
+
+async def test_input_queue():
+    """세션별 입력 대기열 테스트"""
+    print("📥 입력 대기열 테스트...")
+    
+    started, finished = [], []
+    
+    async def handle(text):
+        started.append(text)
+        if text.startswith("이야기"):
+            # 챕터 생성 구간: 새 입력이 오면 취소되고 합쳐서 다시 처리
+            with queue.supersedable():
+                await asyncio.sleep(0.1)
+        else:
+            await asyncio.sleep(0.05)
+        finished.append(text)
+    
+    queue = InputQueue(handle, mergeable=lambda text: text.startswith("이야기"))
+    
+    # 1. 한 번에 한 턴씩 순서대로 처리
+    await asyncio.gather(queue.submit("숫자"), queue.submit("6살"))
+    assert finished == ["숫자", "6살"]
+    print("✅ 순서대로 한 턴씩 처리")
+    
+    # 2. 생성 중에 이어 보낸 입력은 진행 중인 생성을 취소하고 합쳐서 한 번만 완성
+    started.clear()
+    finished.clear()
+    first = asyncio.create_task(queue.submit("이야기 친구"))
+    await asyncio.sleep(0.03)
+    await queue.submit("이야기 숲")
+    await asyncio.sleep(0.03)
+    await queue.submit("이야기 사과")
+    await first
+    assert finished == ["이야기 친구 이야기 숲 이야기 사과"]
+    assert queue.stats()["superseded"] == 2 and queue.stats()["merged"] == 2
+    print(f"✅ 입력 합치기 + 밀려난 생성 취소 (시작 {len(started)}회, 완성 {len(finished)}회)")
+    
+    # 3. 명령어는 합치지 않고 생성 중이던 턴도 취소하지 않음
+    finished.clear()
+    first = asyncio.create_task(queue.submit("이야기 바다"))
+    await asyncio.sleep(0.03)
+    await queue.submit("도움말")
+    await first
+    assert finished == ["이야기 바다", "도움말"]
+    print("✅ 명령어는 따로 처리")
+    
+    # 4. cancel_all은 진행 중인 턴과 대기 중인 입력을 모두 버림 ('처음부터', 세션 종료)
+    finished.clear()
+    first = asyncio.create_task(queue.submit("이야기 하늘"))
+    await asyncio.sleep(0.03)
+    await queue.submit("도움말")
+    queue.cancel_all()
+    await first
+    assert finished == [] and queue.stats()["cancelled"] == 1 and queue.stats()["pending"] == 0
+    print("✅ 진행 중인 작업 모두 취소")
+    
+    print("🎉 입력 대기열 테스트 모두 통과!\n")
+
+class SlowFakeModel:
+    """API 호출 없이 느린 동기 모델을 흉내내는 테스트용 모델"""
+    model_name = "fake-model"
+    
+    def generate_content(self, prompt):
+        time.sleep(0.2)
+        return prompt
+
+async def test_async_model_client():
+    """비동기 모델 호출 레이어 테스트"""
+    print("⚡ 비동기 모델 호출 테스트...")
+    
+    client = AsyncModelClient(SlowFakeModel(), max_concurrency=2)
+    
+    # 1. 느린 호출 중에도 이벤트 루프가 멈추지 않음
+    started = time.perf_counter()
+    results = await asyncio.gather(
+        client.generate_content("첫 번째"),
+        client.generate_content("두 번째")
+    )
+    elapsed = time.perf_counter() - started
+    assert results == ["첫 번째", "두 번째"]
+    assert elapsed < 0.35
+    print(f"✅ 동시 호출 병렬 처리 ({elapsed:.2f}초)")
+    
+    # 2. 동시성 제한 초과 호출은 대기
+    started = time.perf_counter()
+    await asyncio.gather(*(client.generate_content(str(i)) for i in range(3)))
+    assert time.perf_counter() - started >= 0.35
+    print("✅ 모델별 동시성 제한 적용")
+    
+    client.shutdown()
+    print("🎉 비동기 모델 호출 테스트 모두 통과!\n")
+
+class CountingFakeModel:
+    """호출 횟수를 세는 테스트용 모델 (스트리밍 포함)"""
+    model_name = "fake-counting"
+    
+    def __init__(self):
+        self.calls = 0
+    
+    def generate_content(self, prompt, stream=False, **kwargs):
+        self.calls += 1
+        if stream:
+            return self._stream(prompt)
+        time.sleep(0.1)
+        return f"응답: {prompt}"
+    
+    def _stream(self, prompt):
+        for piece in ["옛날 ", "옛날에 ", prompt]:
+            time.sleep(0.03)
+            yield FakeChunk(piece)
+
+async def test_request_coalescing():
+    """같은 요청 합치기 테스트"""
+    print("🪢 같은 요청 합치기 테스트...")
+    
+    model = CountingFakeModel()
+    client = AsyncModelClient(model, max_concurrency=4)
+    
+    # 1. 공백만 다른 같은 프롬프트는 호출 하나를 공유
+    results = await asyncio.gather(
+        client.generate_content("숫자 강아지 동화"),
+        client.generate_content("숫자  강아지\n동화"),
+        client.generate_content("숫자 강아지 동화"),
+        client.generate_content("색깔 고양이 동화")
+    )
+    assert results[0] is results[1] is results[2] and results[3] == "응답: 색깔 고양이 동화"
+    assert model.calls == 2 and client.stats()["coalesced_calls"] == 2
+    print(f"✅ 동시 요청 합치기 (호출 {model.calls}회, 절약 {client.stats()['coalesced_calls']}회)")
+    
+    # 2. 끝난 호출은 다시 보내고, 설정이 다르면 합치지 않음
+    await client.generate_content("숫자 강아지 동화")
+    await asyncio.gather(
+        client.generate_content("숫자 강아지 동화", generation_config={"temperature": 0.2}),
+        client.generate_content("숫자 강아지 동화", generation_config={"temperature": 0.9})
+    )
+    assert model.calls == 5
+    print("✅ 끝난 호출/다른 설정은 합치지 않음")
+    
+    # 3. 한 쪽이 취소돼도 나머지는 결과를 받고, 모두 떠나면 호출도 취소
+    first = asyncio.create_task(client.generate_content("취소 테스트"))
+    second = asyncio.create_task(client.generate_content("취소 테스트"))
+    await asyncio.sleep(0.02)
+    first.cancel()
+    assert await second == "응답: 취소 테스트"
+    lonely = asyncio.create_task(client.generate_content("혼자 취소"))
+    await asyncio.sleep(0.02)
+    lonely.cancel()
+    await asyncio.sleep(0.01)
+    assert not client.single_flight._flights
+    print("✅ 취소 처리")
+    
+    # 4. 스트리밍: 늦게 합류해도 처음 청크부터 모두 받음
+    async def collect(delay):
+        await asyncio.sleep(delay)
+        return "".join([text async for text in client.stream_content("멍멍이")])
+    
+    calls = model.calls
+    stories = await asyncio.gather(collect(0), collect(0.05))
+    assert stories == ["옛날 옛날에 멍멍이", "옛날 옛날에 멍멍이"]
+    assert model.calls == calls + 1
+    print("✅ 스트리밍 요청 합치기")
+    
+    # 5. 합치기를 끄면 요청마다 호출
+    plain = AsyncModelClient(model, max_concurrency=4, coalesce=False)
+    calls = model.calls
+    await asyncio.gather(plain.generate_content("같은 요청"), plain.generate_content("같은 요청"))
+    assert model.calls == calls + 2
+    print("✅ 합치기 끄기")
+    
+    # 6. 합쳐진 호출의 토큰 사용량은 처음 호출한 쪽만 한 번 기록
+    storytellers = [StoryTeller() for _ in range(3)]
+    
+    async def generate_and_record(storyteller, delay=0):
+        await asyncio.sleep(delay)
+        response = await client.generate_content("사용량 테스트")
+        storyteller.record_usage("continuation", "사용량 테스트", text=response)
+    
+    async def stream_and_record(storyteller, delay=0):
+        await asyncio.sleep(delay)
+        text = "".join([chunk async for chunk in client.stream_content("사용량 스트림")])
+        storyteller.record_usage("continuation", "사용량 스트림", text=text)
+    
+    await asyncio.gather(*(generate_and_record(storyteller) for storyteller in storytellers))
+    await asyncio.gather(*(stream_and_record(storyteller, 0.02 * index) for index, storyteller in enumerate(storytellers)))
+    assert [storyteller.token_ledger.totals()["calls"] for storyteller in storytellers] == [2, 0, 0]
+    for storyteller in storytellers:
+        storyteller.close()
+    print("✅ 합쳐진 호출의 토큰 사용량은 한 번만 기록")
+    
+    client.shutdown()
+    plain.shutdown()
+    print("🎉 같은 요청 합치기 테스트 모두 통과!\n")
+
+class FakeChunk:
+    """스트리밍 응답 청크 흉내"""
+    def __init__(self, text):
+        self.text = text
+
+class StreamingFakeModel:
+    """청크를 나눠서 돌려주는 테스트용 스트리밍 모델"""
+    model_name = "fake-stream"
+    
+    def generate_content(self, prompt, stream=False, **kwargs):
+        for piece in ["멍멍이가 ", "공원에 갔어요. 친구", "를 만났어요! 함께 ", "놀았어요."]:
+            yield FakeChunk(piece)
+
+class StructuredStreamingFakeModel:
+    """구조화 출력(JSON)을 잘게 나눠서 돌려주는 테스트용 스트리밍 모델"""
+    model_name = "fake-structured-stream"
+    
+    def __init__(self, gate=None):
+        # gate가 있으면 본문 문자열을 다 보낸 뒤 gate가 열릴 때까지 나머지 JSON 전송을 멈춤
+        self.gate = gate
+        self.released = None
+    
+    def generate_content(self, prompt, stream=False, **kwargs):
+        assert kwargs["generation_config"] == CHAPTER_GENERATION_CONFIG
+        text = json.dumps({
+            "chapter": "멍멍이가 공원에 갔어요. \"안녕!\" 친구를 만났어요!",
+            "visual_description": "🎨 이런 그림을 상상해보세요! 햇살 가득한 공원이에요.",
+            "intent_tags": ["social_interaction"]
+        }, ensure_ascii=False)
+        chapter_end = text.index('", "visual_description"') + 1
+        for start in range(0, chapter_end, 7):
+            yield FakeChunk(text[start:min(start + 7, chapter_end)])
+        if self.gate:
+            self.released = self.gate.wait(timeout=1)
+        for start in range(chapter_end, len(text), 7):
+            yield FakeChunk(text[start:start + 7])
+
+async def test_streaming_story():
+    """챕터 스트리밍 테스트"""
+    print("🌊 챕터 스트리밍 테스트...")
+    
+    storyteller = StoryTeller()
+    storyteller.character_name = "멍멍이"
+    original_client = app.text_client
+    original_structured = app.STORY_STRUCTURED_OUTPUT
+    app.text_client = AsyncModelClient(StreamingFakeModel(), max_concurrency=1)
+    app.STORY_STRUCTURED_OUTPUT = False
+    
+    try:
+        sentences = [sentence async for sentence in storyteller.stream_continuation_story("공원에 가요")]
+    finally:
+        app.text_client = original_client
+        app.STORY_STRUCTURED_OUTPUT = original_structured
+    
+    # 청크 경계와 상관없이 문장 단위로 전달
+    assert sentences == ["멍멍이가 공원에 갔어요. ", "친구를 만났어요! ", "함께 놀았어요."]
+    print(f"✅ 문장 단위 스트리밍: {len(sentences)}문장")
+    
+    print("🎉 챕터 스트리밍 테스트 모두 통과!\n")
+
+async def test_speculative_chapters():
+    """제안 문구 기반 추측 생성 테스트"""
+    print("🔮 추측 생성 테스트...")
+    
+    requests = []
+    
+    async def fake_generate(request):
+        requests.append(request)
+        await asyncio.sleep(0.01)
+        return f"{request} 이야기"
+    
+    suggestions = [
+        "💡 새로운 친구를 만나게 해주세요",
+        "🌟 신비한 것을 발견하게 해주세요",
+        "🎯 문제를 해결하게 해주세요"
+    ]
+    engine = SpeculativeEngine(fake_generate, budget=2)
+    
+    # 1. 세션 예산만큼만 미리 생성하고, 제안과 같은 입력이면 바로 사용
+    engine.start(suggestions, chapter=2)
+    story = await engine.take("새로운 친구를 만나게 해주세요", chapter=2)
+    assert story == "새로운 친구를 만나게 해주세요 이야기"
+    assert len(requests) <= 2
+    print("✅ 제안 선택 시 미리 만든 챕터 사용")
+    
+    # 2. 제안과 다른 입력이면 추측 작업 취소
+    cancelled_before = engine.cancelled
+    engine.start(suggestions, chapter=3)
+    story = await engine.take("바다에 가고 싶어요", chapter=3)
+    assert story is None
+    assert engine.cancelled - cancelled_before == 2
+    print("✅ 사용하지 않는 추측 생성 취소")
+    
+    # 3. 제안 앞부분만 입력하면 사용하지만, 제안보다 더 많은 내용이 붙은 입력은 새로 생성
+    engine.start(suggestions, chapter=4)
+    assert engine.match("새로운 친구를 만나게") is not None
+    story = await engine.take("새로운 친구를 만나게 해주세요 그리고 공룡이 나타나요", chapter=4)
+    assert story is None
+    print("✅ 제안보다 긴 입력은 미리 만든 챕터로 대신하지 않음")
+    
+    print("🎉 추측 생성 테스트 모두 통과!\n")
+
+async def test_image_cache():
+    """삽화 캐시 테스트"""
+    print("🖼️ 삽화 캐시 테스트...")
+    
+    # 1. 공백/대소문자만 다른 프롬프트는 같은 키
+    assert make_cache_key("Chapter 1  숫자\n강아지") == make_cache_key("chapter 1 숫자 강아지")
+    assert make_cache_key("숫자", "강아지") != make_cache_key("숫자", "고양이")
+    print("✅ 프롬프트 정규화 키")
+    
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = ImageCache(memory_limit_bytes=10, disk_dir=cache_dir, disk_limit_bytes=12)
+        
+        # 2. 메모리 LRU 적중
+        await cache.put("a", b"11111")
+        await cache.put("b", b"22222")
+        assert await cache.get("b") == b"22222"
+        assert cache.memory_hits == 1
+        print("✅ 메모리 캐시 적중")
+        
+        # 3. 용량을 넘으면 가장 오래 안 쓴 이미지부터 제거 (메모리/디스크 모두)
+        await cache.put("c", b"33333")
+        assert await cache.get("a") is None
+        print("✅ 메모리/디스크 용량 제한")
+        
+        # 4. 프로세스를 다시 시작해도 디스크 캐시에서 조회
+        restarted = ImageCache(memory_limit_bytes=10, disk_dir=cache_dir, disk_limit_bytes=12)
+        assert await restarted.get("c") == b"33333"
+        assert restarted.disk_hits == 1
+        print("✅ 디스크 캐시 적중")
+        
+        assert await cache.get("없는 키") is None
+        assert cache.stats()["misses"] == 2
+        
+        # 5. 삽화에 딸린 썸네일 조회는 통계에 넣지 않음
+        before = cache.stats()
+        assert await cache.get("c", count=False) == b"33333"
+        assert await cache.get("없는 썸네일", count=False) is None
+        assert cache.stats() == before
+        print(f"✅ 캐시 통계: {cache.stats()['hit_rate']:.0%} 적중")
+    
+    print("🎉 삽화 캐시 테스트 모두 통과!\n")
+
+async def test_image_pipeline():
+    """삽화 후처리(화면용 WebP + 썸네일) 테스트"""
+    print("🖼️ 삽화 후처리 테스트...")
+    
+    pipeline = ImagePipeline(max_workers=1, display_size=512, thumbnail_size=128)
+    
+    # 1. 큰 원본은 한 번 디코딩해서 화면용/썸네일 WebP로 축소 (비율 유지)
+    buffer = io.BytesIO()
+    exif = Image.Exif()
+    exif[0x010e] = "private description"
+    Image.new("RGB", (1200, 800), (250, 200, 120)).save(buffer, format="JPEG", quality=95, exif=exif)
+    original = buffer.getvalue()
+    variants = await pipeline.process(original)
+    assert variants["mime"] == "image/webp"
+    with Image.open(io.BytesIO(variants["display"])) as display:
+        assert display.format == "WEBP" and display.size == (512, 341)
+        # 2. 메타데이터(exif) 제거
+        assert "exif" not in display.info and not display.getexif()
+    with Image.open(io.BytesIO(variants["thumbnail"])) as thumbnail:
+        assert max(thumbnail.size) == 128
+    assert len(variants["display"]) < len(original)
+    print(f"✅ 화면용/썸네일 변환 + 메타데이터 제거: {len(original)} → {len(variants['display'])} 바이트")
+    
+    # 3. 해석할 수 없는 바이트는 원본 그대로 사용
+    broken = await pipeline.process(b"not an image")
+    assert broken["display"] == b"not an image" and broken["thumbnail"] is None
+    assert pipeline.failed == 1
+    print("✅ 후처리 실패 시 원본 사용")
+    
+    pipeline.shutdown()
+    print("🎉 삽화 후처리 테스트 모두 통과!\n")
+
+async def test_response_cache():
+    """텍스트 응답 캐시 테스트"""
+    print("🗂️ 텍스트 응답 캐시 테스트...")
+    
+    cache = ResponseCache(ttl=60, variants=2)
+    calls = []
+    
+    async def generate():
+        calls.append(1)
+        return f"스토리 변형 {len(calls)}"
+    
+    # 1. 변형 풀이 찰 때까지는 새로 생성
+    first = await cache.get_or_generate("숫자-강아지", generate)
+    second = await cache.get_or_generate("숫자-강아지", generate)
+    assert first != second
+    assert len(calls) == 2
+    print("✅ 변형 풀 채우기")
+    
+    # 2. 풀이 차면 API 호출 없이 변형을 돌려가며 제공
+    served = {await cache.get_or_generate("숫자-강아지", generate) for _ in range(4)}
+    assert served == {first, second}
+    assert len(calls) == 2
+    print(f"✅ 변형 순환 제공 (적중 {cache.hits}회)")
+    
+    # 3. TTL이 지나면 다시 생성
+    expired = ResponseCache(ttl=0, variants=1)
+    expired.add("키", "오래된 스토리")
+    time.sleep(0.01)
+    assert expired.take("키") is None
+    print("✅ TTL 만료")
+    
+    print("🎉 텍스트 응답 캐시 테스트 모두 통과!\n")
+
+async def test_shared_cache():
+    """워커 공유 캐시 테스트"""
+    print("🤝 워커 공유 캐시 테스트...")
+    
+    with tempfile.TemporaryDirectory() as cache_dir:
+        path = f"{cache_dir}/shared.sqlite3"
+        # 워커 두 개가 같은 파일을 각자 연결해서 사용
+        worker_a = SharedCache(path, max_bytes=1000)
+        worker_b = SharedCache(path, max_bytes=1000)
+        
+        # 1. 한 워커가 쓴 값을 다른 워커가 읽음 (TTL이 지나면 없음)
+        worker_a.put("image", "장면", b"png-bytes")
+        worker_a.put("response", "짧은", "곧 만료", ttl=0.01)
+        assert worker_b.get("image", "장면") == b"png-bytes"
+        time.sleep(0.02)
+        assert worker_b.get("response", "짧은") is None
+        print("✅ 프로세스 간 공유 + TTL 만료")
+        
+        # 2. 용량 상한을 넘으면 가장 오래 안 쓴 항목부터 삭제
+        worker_a.put("image", "큰1", b"x" * 400)
+        worker_a.put("image", "큰2", b"y" * 400)
+        worker_b.put("image", "큰3", b"z" * 400)
+        assert worker_a.stats()["bytes"] <= 1000
+        assert worker_a.get("image", "큰1") is None and worker_a.get("image", "큰3") is not None
+        print(f"✅ 용량 상한 LRU 삭제 ({worker_a.stats()['bytes']}B)")
+        
+        # 3. 삽화 캐시: 다른 워커가 만든 이미지를 디스크 캐시 없이 재사용
+        images_a = ImageCache(disk_dir=None, shared=worker_a)
+        images_b = ImageCache(disk_dir=None, shared=worker_b)
+        await images_a.put("숲속 장면", b"webp-image")
+        assert await images_b.get("숲속 장면") == b"webp-image"
+        assert images_b.shared_hits == 1
+        print("✅ 삽화 캐시 워커 간 공유")
+        
+        # 4. 응답 캐시: 다른 워커가 채운 변형 풀을 API 호출 없이 사용
+        responses_a = ResponseCache(ttl=60, variants=2, shared=worker_a)
+        responses_b = ResponseCache(ttl=60, variants=2, shared=worker_b)
+        calls = []
+        
+        async def generate():
+            calls.append(1)
+            return f"공유 스토리 {len(calls)}"
+        
+        await responses_a.get_or_generate("숫자-강아지", generate)
+        await responses_a.get_or_generate("숫자-강아지", generate)
+        await asyncio.sleep(0.1)
+        served = await responses_b.get_or_generate("숫자-강아지", generate)
+        assert served in ("공유 스토리 1", "공유 스토리 2") and len(calls) == 2
+        assert responses_b.stats()["shared_hits"] == 1
+        print("✅ 응답 캐시 워커 간 공유")
+        
+        worker_a.close()
+        worker_b.close()
+    
+    print("🎉 워커 공유 캐시 테스트 모두 통과!\n")
+
+async def test_worker_router():
+    """세션 고정 워커 라우터 테스트"""
+    print("🔀 워커 라우터 테스트...")
+    
+    async def fake_worker(name):
+        async def handle(reader, writer):
+            await reader.readuntil(b"\r\n\r\n")
+            body = name.encode()
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: %d\r\nConnection: close\r\n\r\n%s" % (len(body), body))
+            await writer.drain()
+            writer.close()
+        return await asyncio.start_server(handle, "127.0.0.1", 0)
+    
+    async def request(port, cookie=None):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        head = "GET / HTTP/1.1\r\nHost: localhost\r\n"
+        if cookie:
+            head += f"Cookie: theme=dark; {cookie}\r\n"
+        writer.write((head + "\r\n").encode())
+        response = await reader.read()
+        writer.close()
+        return response.decode()
+    
+    workers = [await fake_worker("워커0"), await fake_worker("워커1")]
+    upstreams = [("127.0.0.1", server.sockets[0].getsockname()[1]) for server in workers]
+    router = await WorkerRouter(upstreams, host="127.0.0.1", port=0).start()
+    
+    # 1. 쿠키가 없으면 워커를 골라서 고정 쿠키를 발급
+    first = await request(router.port)
+    assert "Set-Cookie: storybook_worker=" in first
+    worker = parse_worker_cookie(first.replace("Set-Cookie", "Cookie").encode())
+    assert f"워커{worker}" in first
+    print(f"✅ 첫 요청 → 워커 {worker} 고정 쿠키 발급")
+    
+    # 2. 쿠키가 있으면 같은 워커로만 전달 (쿠키 재발급 없음)
+    for _ in range(3):
+        response = await request(router.port, f"storybook_worker={worker}")
+        assert f"워커{worker}" in response and "Set-Cookie" not in response
+    print("✅ 같은 세션은 같은 워커로")
+    
+    # 3. 고정된 워커가 내려가면 다른 워커로 넘기고 쿠키를 다시 발급
+    workers[worker].close()
+    await workers[worker].wait_closed()
+    response = await request(router.port, f"storybook_worker={worker}")
+    assert f"워커{1 - worker}" in response and f"storybook_worker={1 - worker}" in response
+    assert router.failovers == 1
+    print("✅ 워커 장애 시 다른 워커로 전환")
+    
+    # 4. 워커별 환경변수: 공유 캐시 경로는 같게, 호출 한도는 나눠서
+    supervisor = WorkerSupervisor(4)
+    env = supervisor.worker_env(2)
+    assert env["WORKER_ID"] == "2" and env["SHARED_CACHE_PATH"]
+    assert int(env["TEXT_MODEL_RPM"]) == int(os.environ.get("TEXT_MODEL_RPM", "600")) // 4
+    print("✅ 워커별 환경변수")
+    
+    await router.close()
+    for server in workers:
+        server.close()
+    
+    print("🎉 워커 라우터 테스트 모두 통과!\n")
+
+async def test_artifact_store():
+    """세션별 삽화 저장소 테스트"""
+    print("🗃️ 삽화 저장소 테스트...")
+    
+    with tempfile.TemporaryDirectory() as spill_dir:
+        store = ImageArtifactStore(max_items_per_session=1, spill_dir=spill_dir, retention_seconds=3600)
+        
+        # 1. 같은 챕터 번호라도 세션마다 따로 보관
+        store.save("session-1", "story_chapter_3.png", b"first")
+        store.save("session-2", "story_chapter_3.png", b"second")
+        assert await store.get("session-1", "story_chapter_3.png") == b"first"
+        assert await store.get("session-2", "story_chapter_3.png") == b"second"
+        print("✅ 세션별 네임스페이스")
+        
+        # 2. 메모리 보관 개수를 넘은 이미지는 디스크로 내보낸 뒤 조회 가능
+        store.save("session-1", "story_chapter_6.png", b"sixth")
+        await asyncio.gather(*store._background)
+        assert store.stats()["images"] == 2
+        assert await store.get("session-1", "story_chapter_3.png") == b"first"
+        print("✅ 디스크로 내보내기")
+        
+        # 3. 보관 기간이 지난 파일 정리
+        store.retention_seconds = -1
+        await store.collect_garbage()
+        assert await store.get("session-1", "story_chapter_3.png") is None
+        print("✅ 보관 기간 정리")
+    
+    assert guess_image_mime(b"\x89PNG\r\n\x1a\n....") == "image/png"
+    print("🎉 삽화 저장소 테스트 모두 통과!\n")
+
+async def test_model_scheduler():
+    """모델 호출 스케줄러 테스트"""
+    print("🚦 모델 호출 스케줄러 테스트...")
+    
+    lane = ModelLane("test-model", max_concurrency=1)
+    order = []
+    
+    async def call(priority, label):
+        async with lane.slot(priority):
+            order.append(label)
+            await asyncio.sleep(0.01)
+    
+    # 1. 대기 중인 요청은 우선순위 순서로 처리 (동화 텍스트 > 삽화)
+    first = asyncio.create_task(call(PRIORITY_STORY, "첫 요청"))
+    await asyncio.sleep(0)
+    waiting = [
+        asyncio.create_task(call(PRIORITY_ILLUSTRATION, "삽화")),
+        asyncio.create_task(call(PRIORITY_STORY, "동화"))
+    ]
+    await asyncio.gather(first, *waiting)
+    assert order == ["첫 요청", "동화", "삽화"]
+    print("✅ 우선순위 대기열")
+    
+    # 2. 대기 시간을 넘은 삽화 요청은 거절되어 대체 경로로 전환
+    async with lane.slot():
+        try:
+            await lane.acquire(PRIORITY_ILLUSTRATION, max_wait=0.01)
+            assert False, "대기 시간 초과 예외가 발생해야 합니다"
+        except SchedulerOverloaded:
+            pass
+    assert lane.active == 0 and lane.rejected == 1
+    print("✅ 부하 시 삽화 요청 거절")
+    
+    # 3. 토큰 버킷으로 분당 요청 수 제한
+    bucket = TokenBucket(rate_per_minute=60, burst=1)
+    assert bucket.try_take() == 0
+    assert bucket.try_take() > 0
+    print("✅ 분당 요청 수 제한")
+    
+    print("🎉 모델 호출 스케줄러 테스트 모두 통과!\n")
+
+class FlakyFakeModel:
+    """처음 몇 번은 일시적 오류를 내는 테스트용 모델"""
+    model_name = "fake-flaky"
+    
+    def __init__(self, failures):
+        self.failures = failures
+        self.calls = 0
+    
+    def generate_content(self, prompt):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise ConnectionError("일시적인 연결 오류")
+        return prompt
+
+async def test_model_resilience():
+    """재시도 및 회로 차단기 테스트"""
+    print("🛟 모델 호출 복원력 테스트...")
+    
+    # 1. 일시적 오류는 백오프 후 재시도
+    flaky = FlakyFakeModel(failures=2)
+    client = AsyncModelClient(flaky, max_retries=2, retry_base_delay=0.01)
+    assert await client.generate_content("성공") == "성공"
+    assert flaky.calls == 3 and client.retries == 2
+    print("✅ 일시적 오류 재시도")
+    
+    # 2. 연속 실패 시 회로 차단기가 열리고 이후 호출은 네트워크 없이 바로 실패
+    broken = FlakyFakeModel(failures=100)
+    client = AsyncModelClient(broken, max_retries=0, failure_threshold=2, reset_timeout=60)
+    for _ in range(2):
+        try:
+            await client.generate_content("실패")
+        except ConnectionError:
+            pass
+    calls_before = broken.calls
+    try:
+        await client.generate_content("차단")
+        assert False, "회로 차단기가 열려야 합니다"
+    except CircuitOpenError:
+        pass
+    assert broken.calls == calls_before
+    print("✅ 회로 차단기 열림")
+    
+    # 3. 복구 시간이 지나면 시험 호출 허용
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    print("✅ 회로 차단기 복구")
+    
+    # 4. 반쯤 열린 상태에서는 시험 호출 하나만 보내고 끝날 때까지 나머지는 차단
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    await asyncio.sleep(0.06)
+    assert breaker.allow() and not breaker.allow()
+    breaker.release_probe()
+    assert breaker.allow() and not breaker.allow()
+    
+    model = CountingFakeModel()
+    client = AsyncModelClient(model, max_concurrency=4, failure_threshold=1, reset_timeout=0.05)
+    client.breaker.record_failure()
+    await asyncio.sleep(0.06)
+    results = await asyncio.gather(
+        *(client.generate_content(f"복구 시험 {index}") for index in range(3)), return_exceptions=True
+    )
+    assert model.calls == 1 and results[0] == "응답: 복구 시험 0"
+    assert all(isinstance(result, CircuitOpenError) for result in results[1:])
+    assert client.breaker.state == "closed" and client.breaker.allow()
+    client.shutdown()
+    print("✅ 시험 호출은 하나만")
+    
+    # 5. 헤지 요청은 아이가 기다리는 호출에만 (백그라운드 호출은 한 번만 보냄)
+    model = CountingFakeModel()
+    client = AsyncModelClient(model, max_concurrency=4, hedging=True)
+    for _ in range(client.latency.min_samples):
+        client.latency.record(0.01)
+    assert await client.generate_content("요약", priority=PRIORITY_BACKGROUND) == "응답: 요약"
+    assert model.calls == 1 and client.hedges_sent == 0
+    assert await client.generate_content("본문", priority=PRIORITY_STORY) == "응답: 본문"
+    assert model.calls == 3 and client.hedges_sent == 1
+    client.shutdown()
+    print("✅ 백그라운드 호출은 헤지하지 않음")
+    
+    print("🎉 모델 호출 복원력 테스트 모두 통과!\n")
+
+async def test_model_backends():
+    """스텁 / 녹화 재생 백엔드 테스트"""
+    print("🧪 모델 백엔드 테스트...")
+    
+    # 1. 스텁은 같은 프롬프트에 같은 응답 (결정적), 이미지는 PNG 바이트
+    stub = StubBackend(latency=0.01, text_chars=50, image_size=8)
+    text_model = stub.create_model("gemini-2.5-flash")
+    first = text_model.generate_content("동화 써줘").text
+    assert first == text_model.generate_content("동화 써줘").text and len(first) >= 50
+    streamed = "".join(chunk.text for chunk in text_model.generate_content("동화 써줘", stream=True))
+    assert streamed == first
+    image = stub.create_model("gemini-2.5-flash-image").generate_content("그림")
+    assert image.candidates[0].content.parts[0].inline_data.data.startswith(b"\x89PNG")
+    print("✅ 스텁 백엔드")
+    
+    # 2. 녹화한 응답은 실제 백엔드 없이 재생
+    with tempfile.TemporaryDirectory() as tmp:
+        path = f"{tmp}/recordings.jsonl"
+        recorder = RecordReplayBackend(path, mode="record", inner=stub)
+        recorded = recorder.create_model("gemini-2.5-flash").generate_content("동화 써줘").text
+        replayer = RecordReplayBackend(path, mode="replay")
+        client = AsyncModelClient(replayer.create_model("gemini-2.5-flash"))
+        response = await client.generate_content("동화 써줘")
+        assert response.text == recorded
+        try:
+            await client.generate_content("녹화 안 된 요청")
+            assert False, "녹화되지 않은 요청은 실패해야 합니다"
+        except ReplayMissError:
+            pass
+        client.shutdown()
+    print("✅ 녹화/재생 백엔드")
+    
+    print("🎉 모델 백엔드 테스트 모두 통과!\n")
+
+async def test_model_registry():
+    """모델 핸들/클라이언트 재사용 및 워밍업 테스트"""
+    print("🧪 모델 저장소 테스트...")
+    
+    registry = ModelRegistry(StubBackend(latency=0), use_context_cache=False)
+    
+    # 1. 같은 모델 이름은 같은 핸들과 클라이언트를 재사용
+    client = registry.client("gemini-2.5-flash")
+    assert registry.client("gemini-2.5-flash") is client
+    assert registry.model("gemini-2.5-flash") is client.model
+    assert registry.client("gemini-2.5-flash-image") is not client
+    assert set(registry.clients()) == {"gemini-2.5-flash", "gemini-2.5-flash-image"}
+    print("✅ 모델별 클라이언트 재사용")
+    
+    # 2. 워밍업 실패는 예외 없이 보고서에서만 빠짐 (다른 모델 워밍업은 계속)
+    def broken_count_tokens(*args, **kwargs):
+        raise ConnectionError("연결 실패")
+    registry.model("gemini-2.5-flash-image").count_tokens = broken_count_tokens
+    report = await registry.schedule_warm_up()
+    assert registry.schedule_warm_up() is registry.schedule_warm_up()
+    assert set(report) == {"gemini-2.5-flash"}
+    assert report["gemini-2.5-flash"]["cold_seconds"] >= 0
+    print("✅ 워밍업 실패 보고")
+    
+    for model_client in registry.clients().values():
+        model_client.shutdown()
+    print("🎉 모델 저장소 테스트 모두 통과!\n")
+
+async def test_story_memory():
+    """링 버퍼 + 점진적 요약 스토리 메모리 테스트"""
+    print("🧪 스토리 메모리 테스트...")
+    
+    summarize_calls = []
+    
+    async def fake_summarize(previous_summary, chapters):
+        summarize_calls.append(len(chapters))
+        await asyncio.sleep(0.001)
+        numbers = ", ".join(str(chapter["chapter"]) for chapter in chapters)
+        return (previous_summary + f" [{numbers}]").strip()[-300:]
+    
+    # 1. 최근 챕터만 원문으로 유지하고 밀려난 챕터는 백그라운드에서 요약
+    memory = StoryMemory(summarize=fake_summarize, recent_size=4, summary_chars=300)
+    for chapter in range(1, 61):
+        memory.add({"chapter": chapter, "content": f"챕터 {chapter}의 이야기예요. " * 10, "user_input": "계속"})
+        if chapter % 10 == 0:
+            await asyncio.sleep(0)
+    await memory.flush()
+    assert len(memory) == 4 and memory.chapter_count == 60
+    assert memory.summarized_through == 56
+    assert sum(summarize_calls) == 56 and len(summarize_calls) < 56
+    print("✅ 링 버퍼 + 배치 요약")
+    
+    # 2. 60챕터가 지나도 프롬프트 컨텍스트 길이는 일정 (시작 장면 + 요약 + 최근 3챕터)
+    context = memory.context_text(last_n_chapters=3)
+    assert "이야기의 시작: 챕터 1의 이야기예요." in context
+    assert "지금까지의 줄거리:" in context and "56]" in context
+    assert "챕터 60:" in context and "챕터 57:" in context and "챕터 56:" not in context
+    # 시작 장면 + 요약 + 최근 3챕터(원문 상한 + 사용자 요청/머리말)
+    assert len(context) <= memory.chapter_chars + memory.summary_chars + 3 * (memory.chapter_chars + 80)
+    print(f"✅ 컨텍스트 길이 고정 ({len(context)}자)")
+    
+    # 3. 요약 모델이 실패하면 로컬 요약으로 대체
+    async def failing_summarize(previous_summary, chapters):
+        raise ConnectionError("요약 실패")
+    
+    memory = StoryMemory(summarize=failing_summarize, recent_size=2, summary_chars=200)
+    for chapter in range(1, 5):
+        memory.add({"chapter": chapter, "content": f"{chapter}번째 모험이 시작됐어요. 신나요!", "user_input": None})
+    await memory.flush()
+    assert "1번째 모험이 시작됐어요." in memory.summary and memory.summarized_through == 2
+    print("✅ 로컬 요약 대체")
+    
+    print("🎉 스토리 메모리 테스트 모두 통과!\n")
+
+def test_prompt_builder():
+    """프롬프트 공백 정리 / 토큰 예산 / 토큰 장부 테스트"""
+    print("🧪 프롬프트 빌더 테스트...")
+    
+    # 1. 들여쓰기와 연속 빈 줄 제거
+    assert compact("""
+        첫 줄
+            
+            
+        둘째 줄   
+        """) == "첫 줄\n\n둘째 줄"
+    print("✅ 공백 정리")
+    
+    # 2. 예산을 넘으면 오래된 컨텍스트부터 제외 (고정 섹션은 유지)
+    builder = PromptBuilder(budgets={"continuation": 120})
+    context = [f"챕터 {i}: " + "이야기 " * 20 for i in range(1, 6)]
+    prompt = builder.build("continuation", system="시스템 지시문", task="다음 장면",
+                           context=context, context_title="현재 상황:", sections=["사용자 요청: 숲"])
+    assert "챕터 5:" in prompt and "챕터 1:" not in prompt
+    assert "시스템 지시문" in prompt and "사용자 요청: 숲" in prompt
+    assert builder.trimmed >= 1
+    prompt = builder.build("continuation", task="다음 장면", pinned_context=["줄거리 요약: " + "요약 " * 20],
+                           context=context, context_title="현재 상황:")
+    assert "줄거리 요약:" in prompt and "챕터 5:" in prompt and "챕터 1:" not in prompt
+    print(f"✅ 토큰 예산 ({builder.trimmed}개 컨텍스트 제외, 고정 컨텍스트 유지)")
+    
+    # 3. 실제 이어가기 프롬프트에는 들여쓰기 공백이 없음
+    storyteller = StoryTeller()
+    storyteller.learning_subject = "숫자"
+    storyteller.character_name = "멍멍이"
+    storyteller.add_to_story_context("멍멍이가 사과를 셌어요.", None)
+    continuation_prompt = storyteller.build_continuation_prompt("친구를 만나요")
+    assert "        " not in continuation_prompt
+    assert "챕터 1: 멍멍이가 사과를 셌어요." in continuation_prompt
+    print("✅ 이어가기 프롬프트 정리")
+    
+    # 4. 긴 이야기에서 예산을 넘으면 시작 장면과 줄거리 요약은 두고 오래된 챕터 원문부터 제외
+    storyteller = StoryTeller()
+    storyteller.learning_subject = "숫자"
+    storyteller.character_name = "멍멍이"
+    for chapter in range(1, 11):
+        storyteller.add_to_story_context(
+            (f"{chapter}번째 장면에서 멍멍이는 숲속 친구들과 사과를 세며 즐겁게 놀았어요. " * 6)[:200], f"요청 {chapter}"
+        )
+    storyteller.story_memory.summary = ("멍멍이와 친구들이 숲에서 사과를 세었어요. " * 30)[:500]
+    trimmed_before = app.prompt_builder.trimmed
+    continuation_prompt = storyteller.build_continuation_prompt("친구를 만나요")
+    assert app.prompt_builder.trimmed > trimmed_before
+    assert "이야기의 시작: 1번째 장면" in continuation_prompt
+    assert "지금까지의 줄거리: 멍멍이와 친구들이" in continuation_prompt
+    assert "챕터 10: 10번째 장면" in continuation_prompt and "챕터 8: 8번째 장면" not in continuation_prompt
+    storyteller.close()
+    print("✅ 긴 이야기의 시작 장면/줄거리 요약 유지")
+    
+    # 5. 세션/단계별 토큰 장부 (usage_metadata 우선, 없으면 추정)
+    class Usage:
+        prompt_token_count = 120
+        candidates_token_count = 45
+    
+    class Response:
+        usage_metadata = Usage()
+    
+    assert usage_from_response(Response(), "프롬프트", "응답") == (120, 45)
+    estimated_prompt, estimated_completion = usage_from_response(None, "프롬프트 " * 10, "응답")
+    assert estimated_prompt > 0 and estimated_completion > 0
+    ledger = TokenLedger()
+    ledger.record("continuation", 120, 45)
+    ledger.record("continuation", 100, 40)
+    ledger.record("illustration", 80, 0)
+    assert ledger.stages["continuation"] == {"calls": 2, "prompt_tokens": 220, "completion_tokens": 85}
+    assert ledger.totals() == {"calls": 3, "prompt_tokens": 300, "completion_tokens": 85}
+    print("✅ 토큰 장부")
+    
+    print("🎉 프롬프트 빌더 테스트 모두 통과!\n")
+
+class CachingFakeBackend(StubBackend):
+    """컨텐츠 캐시 생성 횟수를 세는 테스트용 백엔드"""
+    
+    def __init__(self, ttl_override=None, fail=False):
+        super().__init__(latency=0)
+        self.cache_creations = 0
+        self.plain_models = []
+        self.ttl_override = ttl_override
+        self.fail = fail
+    
+    def create_cached_model(self, model_name, system_instruction, ttl_seconds):
+        if self.fail:
+            raise ValueError("최소 토큰 수 미달")
+        self.cache_creations += 1
+        ttl = self.ttl_override if self.ttl_override is not None else ttl_seconds
+        return self.create_model(model_name), time.time() + ttl
+    
+    def create_model(self, model_name, **model_kwargs):
+        self.plain_models.append(model_kwargs)
+        return super().create_model(model_name, **model_kwargs)
+
+def test_context_cache():
+    """시스템 지시문 컨텐츠 캐시 테스트"""
+    print("🧪 시스템 지시문 캐시 테스트...")
+    
+    # 1. 여러 호출이 캐시 핸들 하나를 공유
+    backend = CachingFakeBackend()
+    model = CachedInstructionModel(backend, "gemini-2.5-flash", "동화 작가 지시문", ttl=3600, min_tokens=0)
+    for _ in range(3):
+        model.generate_content("다음 장면")
+    assert backend.cache_creations == 1 and model.cached
+    print("✅ 캐시 핸들 재사용")
+    
+    # 2. 만료 시각이 지나면 새 핸들 생성
+    backend = CachingFakeBackend(ttl_override=0)
+    model = CachedInstructionModel(backend, "gemini-2.5-flash", "동화 작가 지시문", ttl=3600, refresh_margin=0,
+                                   min_tokens=0)
+    model.generate_content("첫 장면")
+    model.generate_content("다음 장면")
+    assert backend.cache_creations == 2
+    print("✅ 만료 시 새로 생성")
+    
+    # 3. 캐시를 만들 수 없으면 system_instruction 모델로 대체
+    backend = CachingFakeBackend(fail=True)
+    model = CachedInstructionModel(backend, "gemini-2.5-flash", "동화 작가 지시문", min_tokens=0)
+    assert model.generate_content("장면").text
+    assert not model.cached
+    assert backend.plain_models[-1] == {"system_instruction": "동화 작가 지시문"}
+    print("✅ system_instruction 대체")
+    
+    # 4. 캐시 최소 크기보다 작은 지시문은 캐시 생성을 시도하지 않음 (만료 후에도)
+    backend = CachingFakeBackend(fail=True)
+    model = CachedInstructionModel(backend, "gemini-2.5-flash", "동화 작가 지시문", ttl=0, refresh_margin=0)
+    model.generate_content("첫 장면")
+    model.generate_content("다음 장면")
+    assert not model.use_cache and backend.plain_models == [{"system_instruction": "동화 작가 지시문"}] * 2
+    assert CachedInstructionModel(backend, "gemini-2.5-flash", "지시문 " * 2000).use_cache
+    print("✅ 작은 지시문은 캐시 생략")
+    
+    print("🎉 시스템 지시문 캐시 테스트 모두 통과!\n")
+
+async def test_question_bank():
+    """학습 문제 은행 테스트"""
+    print("🧪 학습 문제 은행 테스트...")
+    
+    batch_calls = []
+    
+    async def fake_batch(subject, count, avoid):
+        batch_calls.append((subject, count, list(avoid)))
+        start = (len(batch_calls) - 1) * 2
+        questions = [
+            {"question": f"{{주인공}}이 사과 {n}개를 세요. 몇 개일까요?", "choices": [str(n), str(n + 1), str(n + 2)], "answer": "A"}
+            for n in range(start, start + count)
+        ]
+        questions.append({"question": "형식이 잘못된 문제", "choices": ["하나"], "answer": "D"})
+        return "```json\n" + json.dumps({"questions": questions}, ensure_ascii=False) + "\n```"
+    
+    # 1. 주제를 정하면 한 번의 호출로 여러 문제를 미리 준비 (잘못된 형식은 제외)
+    bank = QuestionBank(fake_batch, batch_size=4, low_watermark=2)
+    await bank.prefetch("숫자")
+    assert bank.size("숫자") == 4 and len(batch_calls) == 1
+    print("✅ 배치 생성")
+    
+    # 2. 문제는 풀에서 바로 꺼내고, 부족해지면 백그라운드 보충 (중복 제거)
+    question = bank.take("숫자")
+    assert question["answer"] == "A"
+    text = format_question(question, "멍멍이")
+    assert text.startswith("문제: 멍멍이이 사과 0개") and "정답: A" in text
+    bank.take("숫자")
+    bank.take("숫자")
+    assert bank._refills.get("숫자") is not None
+    await bank._refills["숫자"]
+    assert len(batch_calls) == 2 and bank.duplicates == 2
+    assert len(batch_calls[1][2]) == 4  # 최근 문제를 피하도록 전달
+    assert bank.size("숫자") == 1 + 2
+    assert bank.hits == 3
+    print("✅ 즉시 반환 + 백그라운드 보충 + 중복 제거")
+    
+    # 3. 스텁 백엔드의 구조화 출력도 같은 형식으로 해석 가능
+    stub_model = StubBackend(latency=0).create_model("gemini-2.5-flash")
+    response = stub_model.generate_content(
+        "숫자 문제",
+        generation_config={"response_mime_type": "application/json", "response_schema": QUESTION_BATCH_SCHEMA}
+    )
+    assert len(parse_question_batch(response.text)) == 3
+    print("✅ 구조화 출력 해석")
+    
+    print("🎉 학습 문제 은행 테스트 모두 통과!\n")
+
+async def test_structured_output():
+    """구조화 출력(JSON) 챕터 테스트"""
+    print("🧩 구조화 출력 테스트...")
+    
+    # 1. JSON 청크가 어디서 잘려도 본문 문자열만 순서대로 풀어냄 (이스케이프/이모지 포함)
+    raw = json.dumps({"chapter": "\"안녕\"\n🌟 반가워", "intent_tags": ["general_continuation"]})
+    for size in (1, 2, 5):
+        decoder = ChapterTextStream()
+        assert "".join(decoder.feed(raw[i:i + size]) for i in range(0, len(raw), size)) == "\"안녕\"\n🌟 반가워"
+    assert parse_chapter('{"chapter": "잘린 응답도 본문은')["chapter"] == "잘린 응답도 본문은"
+    assert parse_chapter("그냥 텍스트 응답")["chapter"] == "그냥 텍스트 응답"
+    print("✅ 본문 스트리밍 디코딩 + 잘린 응답 처리")
+    
+    # 2. 한 번의 스트리밍 호출로 본문은 문장 단위로, 시각적 설명/의도는 함께 보관
+    storyteller = StoryTeller()
+    storyteller.character_name = "멍멍이"
+    original_client = app.text_client
+    original_structured = app.STORY_STRUCTURED_OUTPUT
+    app.text_client = AsyncModelClient(StructuredStreamingFakeModel(), max_concurrency=1)
+    app.STORY_STRUCTURED_OUTPUT = True
+    
+    try:
+        sentences = [sentence async for sentence in storyteller.stream_continuation_story("친구를 만나요")]
+    finally:
+        app.text_client = original_client
+        app.STORY_STRUCTURED_OUTPUT = original_structured
+    
+    assert sentences == ["멍멍이가 공원에 갔어요. ", "\"안녕!\" ", "친구를 만났어요!"]
+    extras = storyteller.chapter_extras
+    assert extras["intent_tags"] == ["social_interaction"]
+    assert set(extras) == {"chapter", "visual_description", "intent_tags"}
+    print("✅ 한 번의 호출로 본문 + 시각적 설명 + 의도 태그")
+    
+    # 3. 이미지가 없으면 시각적 설명을 추가 호출 없이 사용
+    assert storyteller.format_visual_description(extras["visual_description"]).startswith("🎨 이런 그림을")
+    # 텍스트와 동시에 시작한 삽화가 실패하면 그사이 받은 시각적 설명 사용
+    assert storyteller.fallback_visual_description() == extras["visual_description"]
+    print("✅ 시각적 설명 재사용")
+    
+    # 4. 본문 문자열이 끝나면 마지막 문장은 나머지 JSON 항목을 기다리지 않고 바로 전달
+    gate = threading.Event()
+    model = StructuredStreamingFakeModel(gate)
+    app.text_client = AsyncModelClient(model, max_concurrency=1)
+    app.STORY_STRUCTURED_OUTPUT = True
+    try:
+        sentences = []
+        async for sentence in storyteller.stream_continuation_story("친구를 만나요"):
+            sentences.append(sentence)
+            if sentence == "친구를 만났어요!":
+                gate.set()
+    finally:
+        app.text_client = original_client
+        app.STORY_STRUCTURED_OUTPUT = original_structured
+    assert sentences[-1] == "친구를 만났어요!" and model.released is True
+    assert storyteller.chapter_extras["intent_tags"] == ["social_interaction"]
+    print("✅ 마지막 문장은 스트림이 끝나기 전에 전달")
+    
+    print("🎉 구조화 출력 테스트 모두 통과!\n")
+
+def test_metrics():
+    """단계별 메트릭 기록 및 /metrics 엔드포인트 테스트"""
+    print("🧪 메트릭 테스트...")
+    
+    # 1. track은 시간/결과/진행 중 개수를 기록
+    before = metrics.STEP_SECONDS.count(stage="test_stage", step="model_call")
+    with metrics.track("test_stage", "model_call") as span:
+        assert metrics.STEP_IN_FLIGHT.value(stage="test_stage", step="model_call") == 1
+        span["outcome"] = "fallback"
+    assert metrics.STEP_SECONDS.count(stage="test_stage", step="model_call") == before + 1
+    assert metrics.STEP_IN_FLIGHT.value(stage="test_stage", step="model_call") == 0
+    assert metrics.STEP_TOTAL.value(stage="test_stage", step="model_call", outcome="fallback") >= 1
+    try:
+        with metrics.track("test_stage", "file_write"):
+            raise OSError("디스크 오류")
+    except OSError:
+        pass
+    assert metrics.STEP_TOTAL.value(stage="test_stage", step="file_write", outcome="error") >= 1
+    print("✅ 단계별 기록")
+    
+    # 2. Prometheus 텍스트 형식 (누적 구간 + 합계 + 개수)
+    text = metrics.registry.render()
+    assert "# TYPE storybook_step_seconds histogram" in text
+    assert 'storybook_step_seconds_bucket{stage="test_stage",step="model_call",le="+Inf"}' in text
+    assert 'storybook_step_total{stage="test_stage",step="file_write",outcome="error"}' in text
+    print("✅ Prometheus 형식")
+    
+    # 3. HTTP 엔드포인트
+    import urllib.request
+    server = metrics.start_metrics_server(0, host="127.0.0.1")
+    port = server.server_address[1]
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics") as response:
+        assert b"storybook_step_seconds_count" in response.read()
+    print("✅ /metrics 엔드포인트")
+    
+    print("🎉 메트릭 테스트 모두 통과!\n")
+
 async def run_all_tests():
     """모든 테스트 실행"""
     print("🚀 동화 나노바나나 전체 테스트 시작!\n")
@@ -149,7 +1391,31 @@ async def run_all_tests():
         await test_storyteller_basic()
         await test_error_handling()
         await test_story_generation()
+        test_keyword_engine()
         test_ui_helpers()
+        test_session_registry()
+        await test_session_store()
+        await test_input_queue()
+        await test_async_model_client()
+        await test_request_coalescing()
+        await test_model_scheduler()
+        await test_model_resilience()
+        await test_model_backends()
+        await test_model_registry()
+        await test_story_memory()
+        test_prompt_builder()
+        test_context_cache()
+        await test_question_bank()
+        await test_structured_output()
+        test_metrics()
+        await test_streaming_story()
+        await test_speculative_chapters()
+        await test_image_cache()
+        await test_image_pipeline()
+        await test_response_cache()
+        await test_shared_cache()
+        await test_worker_router()
+        await test_artifact_store()
         
         print("🎉🎉🎉 모든 테스트 통과! 동화 나노바나나 준비 완료! 🍌📚")
         print("\n✨ 주요 기능 확인 완료:")
@@ -0,0 +1,224 @@
+import argparse
+import asyncio
+import os
+import re
+import signal
+import subprocess
+import sys
+
+# 세션을 한 워커에 고정하는 쿠키 (Chainlit 세션/웹소켓 상태는 워커 프로세스 메모리에 있음)
+COOKIE_NAME = "storybook_worker"
+COOKIE_PATTERN = re.compile(rb"(?im)^cookie:[^\r\n]*?\b" + COOKIE_NAME.encode() + rb"=(\d+)")
+HEAD_END = b"\r\n\r\n"
+MAX_HEAD_BYTES = 64 * 1024
+CHUNK_SIZE = 64 * 1024
+BAD_GATEWAY = b"HTTP/1.1 502 Bad Gateway\r\nContent-Length: 0\r\nConnection: close\r\n\r\n"
+
+
+def parse_worker_cookie(head):
+    """요청 헤더에서 고정된 워커 번호 추출 (없으면 None)"""
+    match = COOKIE_PATTERN.search(head)
+    return int(match.group(1)) if match else None
+
+
+def inject_set_cookie(head, worker_index):
+    """응답 헤더 끝에 워커 고정 쿠키 추가"""
+    cookie = f"Set-Cookie: {COOKIE_NAME}={worker_index}; Path=/; HttpOnly; SameSite=Lax\r\n".encode()
+    return head[:-2] + cookie + b"\r\n"
+
+
+def split_rate(value, default, workers):
+    """프로세스 전체 분당 호출 한도를 워커 수로 나눔 (API 할당량은 호스트 전체가 공유)"""
+    return str(max(1, int(value or default) // workers))
+
+
+class WorkerRouter:
+    """워커 앞단의 TCP 프록시 (쿠키로 세션을 한 워커에 고정, 웹소켓 업그레이드도 그대로 전달)"""
+
+    def __init__(self, upstreams, host="0.0.0.0", port=8000):
+        self.upstreams = list(upstreams)
+        self.host = host
+        self.port = port
+        self.connections = [0] * len(self.upstreams)
+        self.routed = [0] * len(self.upstreams)
+        self.failovers = 0
+        self._server = None
+
+    def candidates(self, sticky):
+        """시도할 워커 순서 (고정 워커 → 연결 수가 적은 워커 순)"""
+        order = sorted(range(len(self.upstreams)), key=lambda index: self.connections[index])
+        if sticky is not None and 0 <= sticky < len(self.upstreams):
+            order.remove(sticky)
+            order.insert(0, sticky)
+        return order
+
+    async def start(self):
+        self._server = await asyncio.start_server(self.handle, self.host, self.port, limit=MAX_HEAD_BYTES)
+        self.port = self._server.sockets[0].getsockname()[1]
+        print(f"🔀 워커 라우터 실행: {self.host}:{self.port} → 워커 {len(self.upstreams)}개")
+        return self
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def handle(self, reader, writer):
+        try:
+            head = await reader.readuntil(HEAD_END)
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            writer.close()
+            return
+
+        sticky = parse_worker_cookie(head)
+        upstream = None
+        for index in self.candidates(sticky):
+            try:
+                upstream = await asyncio.open_connection(*self.upstreams[index])
+                break
+            except OSError:
+                # 재시작 중인 워커는 건너뛰고 다음 워커로 (쿠키도 새 워커로 다시 고정)
+                self.failovers += 1
+        if upstream is None:
+            writer.write(BAD_GATEWAY)
+            await self._close(writer)
+            return
+
+        upstream_reader, upstream_writer = upstream
+        self.connections[index] += 1
+        self.routed[index] += 1
+        upstream_writer.write(head)
+        request_task = asyncio.create_task(self._pipe(reader, upstream_writer))
+        try:
+            await self._relay_response(upstream_reader, writer, index if index != sticky else None)
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            pass
+        finally:
+            request_task.cancel()
+            self.connections[index] -= 1
+            await self._close(upstream_writer)
+            await self._close(writer)
+
+    async def _relay_response(self, upstream_reader, writer, set_cookie):
+        if set_cookie is not None:
+            head = await upstream_reader.readuntil(HEAD_END)
+            writer.write(inject_set_cookie(head, set_cookie))
+        await self._pipe(upstream_reader, writer, half_close=False)
+
+    async def _pipe(self, reader, writer, half_close=True):
+        try:
+            while True:
+                data = await reader.read(CHUNK_SIZE)
+                if not data:
+                    break
+                writer.write(data)
+                await writer.drain()
+            if half_close and writer.can_write_eof():
+                writer.write_eof()
+        except ConnectionError:
+            pass
+
+    async def _close(self, writer):
+        try:
+            writer.close()
+            await writer.wait_closed()
+        except ConnectionError:
+            pass
+
+
+class WorkerSupervisor:
+    """Chainlit 워커 프로세스 실행 및 비정상 종료 시 재시작"""
+
+    def __init__(self, workers, base_port=8101, app_path="app.py", restart_delay=1.0):
+        self.workers = workers
+        self.base_port = base_port
+        self.app_path = app_path
+        self.restart_delay = restart_delay
+        self.processes = [None] * workers
+        self.restarts = 0
+        self._stopping = False
+
+    @property
+    def upstreams(self):
+        return [("127.0.0.1", self.base_port + index) for index in range(self.workers)]
+
+    def worker_env(self, index):
+        """워커별 환경변수 (공유 캐시 경로는 같게, 메트릭 포트와 호출 한도는 워커별로)"""
+        env = dict(os.environ)
+        env["WORKER_ID"] = str(index)
+        env.setdefault("SHARED_CACHE_PATH", ".cache/shared.sqlite3")
+        if int(env.get("METRICS_PORT") or 0):
+            env["METRICS_PORT"] = str(int(env["METRICS_PORT"]) + index)
+        env["TEXT_MODEL_RPM"] = split_rate(env.get("TEXT_MODEL_RPM"), 600, self.workers)
+        env["IMAGE_MODEL_RPM"] = split_rate(env.get("IMAGE_MODEL_RPM"), 60, self.workers)
+        return env
+
+    def spawn(self, index):
+        port = self.base_port + index
+        self.processes[index] = subprocess.Popen(
+            [sys.executable, "-m", "chainlit", "run", self.app_path, "--headless",
+             "--host", "127.0.0.1", "--port", str(port)],
+            env=self.worker_env(index)
+        )
+        print(f"👷 워커 {index} 실행: 127.0.0.1:{port} (pid {self.processes[index].pid})")
+
+    def start(self):
+        for index in range(self.workers):
+            self.spawn(index)
+
+    async def watch(self):
+        """종료된 워커를 찾아 재시작"""
+        while not self._stopping:
+            await asyncio.sleep(self.restart_delay)
+            for index, process in enumerate(self.processes):
+                if process is not None and process.poll() is not None and not self._stopping:
+                    print(f"⚠️ 워커 {index} 종료됨 (코드 {process.returncode}), 재시작")
+                    self.restarts += 1
+                    self.spawn(index)
+
+    def stop(self, timeout=10):
+        self._stopping = True
+        for process in self.processes:
+            if process is not None and process.poll() is None:
+                process.terminate()
+        for process in self.processes:
+            if process is None:
+                continue
+            try:
+                process.wait(timeout=timeout)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+async def serve(workers, host, port, base_port, app_path):
+    supervisor = WorkerSupervisor(workers, base_port=base_port, app_path=app_path)
+    supervisor.start()
+    router = await WorkerRouter(supervisor.upstreams, host=host, port=port).start()
+    watcher = asyncio.create_task(supervisor.watch())
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+    try:
+        await stop.wait()
+    finally:
+        print("🛑 워커 종료 중...")
+        watcher.cancel()
+        await router.close()
+        supervisor.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="동화 앱 멀티 워커 실행 (공유 캐시 + 세션 고정 라우터)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--base-port", type=int, default=8101)
+    parser.add_argument("--app", default="app.py")
+    args = parser.parse_args()
+    asyncio.run(serve(args.workers, args.host, args.port, args.base_port, args.app))
+
+
+if __name__ == "__main__":
+    main()